@@ -4,17 +4,130 @@ import os
 class Settings:
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8080"))
+    # uvicorn worker processes (uvicorn reads it as the --workers default)
+    WEB_CONCURRENCY: int = int(os.getenv("WEB_CONCURRENCY", "1"))
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
 
     CORRELATION_ID_HEADER: str = "X-Correlation-ID"
 
+    # ---------------------------------------------------------------------------
+    # Security store
+    # STORE_BACKEND: "memory" (state lost on restart), "sqlite", "eventlog" or
+    #   "redis" (shared by every node using the same server and prefix)
+    # STORE_PATH: database file of the sqlite backend
+    # STORE_LOG_DIR: event log and snapshot directory of the eventlog backend
+    # STORE_SNAPSHOT_EVERY: events between eventlog snapshots (0 = never)
+    # STORE_SHARED: other processes write the sqlite database too (required
+    #   for WEB_CONCURRENCY > 1); each reloads when the others commit
+    # STORE_REDIS_URL / STORE_REDIS_PREFIX: server and key prefix of the redis
+    #   backend (needs the redis package)
+    # ---------------------------------------------------------------------------
+    STORE_BACKEND: str = os.getenv("STORE_BACKEND", "memory")
+    STORE_PATH: str = os.getenv("STORE_PATH", "data/store.sqlite3")
+    STORE_LOG_DIR: str = os.getenv("STORE_LOG_DIR", "data/store_log")
+    STORE_SNAPSHOT_EVERY: int = int(os.getenv("STORE_SNAPSHOT_EVERY", "100000"))
+    STORE_SHARED: bool = os.getenv("STORE_SHARED", "false").lower() in ("1", "true", "yes")
+    STORE_REDIS_URL: str = os.getenv("STORE_REDIS_URL", "redis://localhost:6379/0")
+    STORE_REDIS_PREFIX: str = os.getenv("STORE_REDIS_PREFIX", "nlsec")
+
+    # ---------------------------------------------------------------------------
+    # Rule engine
+    # RULES_PATH: JSON rules file (empty = bundled app/nlp/rules.json)
+    # RULES_CACHE_PATH: where derived prefilter triggers are cached (empty = off)
+    # RULES_SPELL_CORRECTION: retry unmatched commands with typos corrected
+    # ---------------------------------------------------------------------------
+    RULES_PATH: str = os.getenv("RULES_PATH", "")
+    RULES_CACHE_PATH: str = os.getenv("RULES_CACHE_PATH", "")
+    RULES_SPELL_CORRECTION: bool = os.getenv("RULES_SPELL_CORRECTION", "true").lower() in ("1", "true", "yes")
+
+    # ---------------------------------------------------------------------------
+    # Parse cache (rule-based results keyed by command template)
+    # PARSE_CACHE_SIZE: max templates kept (0 = off); PARSE_CACHE_TTL: seconds
+    # ---------------------------------------------------------------------------
+    PARSE_CACHE_SIZE: int = int(os.getenv("PARSE_CACHE_SIZE", "1024"))
+    PARSE_CACHE_TTL: int = int(os.getenv("PARSE_CACHE_TTL", "300"))
+
+    # ---------------------------------------------------------------------------
+    # Local intent classifier (between the rules and the LLM fallback)
+    # CLASSIFIER_ENABLED: off by default; its misfires act on the alarm
+    # CLASSIFIER_MODEL_PATH: trained model (empty = bundled intent_model.json)
+    # CLASSIFIER_THRESHOLD: min confidence to skip the LLM
+    # ---------------------------------------------------------------------------
+    CLASSIFIER_ENABLED: bool = os.getenv("CLASSIFIER_ENABLED", "false").lower() in ("1", "true", "yes")
+    CLASSIFIER_MODEL_PATH: str = os.getenv("CLASSIFIER_MODEL_PATH", "")
+    CLASSIFIER_THRESHOLD: float = float(os.getenv("CLASSIFIER_THRESHOLD", "0.9"))
+
     # ---------------------------------------------------------------------------
     # LLM provider selection
     # Supported: "azure", "github"
     # Default: none (empty) → rule-based NLP only
     # ---------------------------------------------------------------------------
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "")  # default empty = no LLM
+    # Ordered fallback chain, e.g. "azure,github"; overrides LLM_PROVIDER
+    LLM_PROVIDERS: str = os.getenv("LLM_PROVIDERS", "")
     LLM_TIMEOUT: int = int(os.getenv("LLM_TIMEOUT", "10"))
+    # Completion cap per command (a full add_user answer is about 80 tokens)
+    LLM_MAX_TOKENS: int = int(os.getenv("LLM_MAX_TOKENS", "150"))
+    # Stream completions and stop as soon as the intent settles the answer
+    LLM_STREAM: bool = os.getenv("LLM_STREAM", "false").lower() in ("1", "true", "yes")
+
+    # -- LLM HTTP connection pool (shared, process-wide client) ----------------
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE: int = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+    LLM_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+    LLM_HTTP2: bool = os.getenv("LLM_HTTP2", "false").lower() in ("1", "true", "yes")
+    # Connections to open at startup (0 = no warm-up)
+    LLM_WARMUP_CONNECTIONS: int = int(os.getenv("LLM_WARMUP_CONNECTIONS", "0"))
+
+    # -- LLM micro-batching (async path; max size 1 = off) ---------------------
+    # A batch puts commands from different requests (users) in one prompt. Each
+    # is escaped into its own slot under a random id, but one user's text can
+    # still sway how the model reads the rest; keep it off unless that is
+    # acceptable.
+    LLM_BATCH_MAX_SIZE: int = int(os.getenv("LLM_BATCH_MAX_SIZE", "1"))
+    LLM_BATCH_MAX_WAIT_MS: float = float(os.getenv("LLM_BATCH_MAX_WAIT_MS", "5"))
+
+    # -- LLM routing across LLM_PROVIDERS (EWMA cost, hedged requests) ---------
+    LLM_ROUTING_EWMA_ALPHA: float = float(os.getenv("LLM_ROUTING_EWMA_ALPHA", "0.2"))
+    LLM_HEDGE: bool = os.getenv("LLM_HEDGE", "true").lower() in ("1", "true", "yes")
+    LLM_HEDGE_MIN_DELAY_MS: float = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "100"))
+
+    # -- LLM latency budget and circuit breaker --------------------------------
+    # Budget for the LLM fallback of one /nl/execute call (0 = LLM_TIMEOUT);
+    # the header overrides it per request
+    NL_LATENCY_BUDGET_MS: float = float(os.getenv("NL_LATENCY_BUDGET_MS", "0"))
+    LATENCY_BUDGET_HEADER: str = "X-Latency-Budget-Ms"
+    LLM_BREAKER_WINDOW: int = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+    LLM_BREAKER_MIN_CALLS: int = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+    LLM_BREAKER_ERROR_RATE: float = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+    LLM_BREAKER_P95_MS: float = float(os.getenv("LLM_BREAKER_P95_MS", "8000"))
+    LLM_BREAKER_COOLDOWN: float = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+    # -- LLM result cache (SQLite; empty path = off) ---------------------------
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", "86400"))
+    LLM_CACHE_NEGATIVE_TTL: int = int(os.getenv("LLM_CACHE_NEGATIVE_TTL", "3600"))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+    # -- Semantic cache of LLM intents for reworded commands (size 0 = off) -------
+    # SEMANTIC_CACHE_PATH: SQLite file it is persisted in (empty = memory only)
+    SEMANTIC_CACHE_SIZE: int = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+    SEMANTIC_CACHE_TOP_K: int = int(os.getenv("SEMANTIC_CACHE_TOP_K", "3"))
+    SEMANTIC_CACHE_PATH: str = os.getenv("SEMANTIC_CACHE_PATH", "data/semantic_cache.sqlite3")
+
+    # -- Learned rules: LLM phrasings promoted to the rule engine --------------
+    # A phrasing is promoted after LEARNED_RULES_MIN_COUNT LLM answers of which
+    # at least LEARNED_RULES_MIN_AGREEMENT name the same intent.
+    # LEARNED_RULES_PATH: JSON file counts and entries are kept in (empty = memory only)
+    # LEARNED_RULES_FLUSH_SECONDS: max seconds unsaved counts wait for a write
+    #   (promotions, revocations and shutdown write at once)
+    LEARNED_RULES_ENABLED: bool = os.getenv("LEARNED_RULES_ENABLED", "true").lower() in ("1", "true", "yes")
+    LEARNED_RULES_MIN_COUNT: int = int(os.getenv("LEARNED_RULES_MIN_COUNT", "5"))
+    LEARNED_RULES_MIN_AGREEMENT: float = float(os.getenv("LEARNED_RULES_MIN_AGREEMENT", "0.9"))
+    LEARNED_RULES_MAX_CANDIDATES: int = int(os.getenv("LEARNED_RULES_MAX_CANDIDATES", "1000"))
+    LEARNED_RULES_PATH: str = os.getenv("LEARNED_RULES_PATH", "data/learned_rules.json")
+    LEARNED_RULES_FLUSH_SECONDS: float = float(os.getenv("LEARNED_RULES_FLUSH_SECONDS", "60"))
 
     # -- Azure OpenAI ----------------------------------------------------------
     AZURE_OPENAI_ENDPOINT: str | None = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -28,10 +141,21 @@ class Settings:
 
     def llm_enabled(self) -> bool:
         """Return True if an enabled LLM provider is configured."""
-        p = (self.LLM_PROVIDER or "").lower()
-        if p == "azure":
+        return bool(self.llm_providers())
+
+    def llm_providers(self) -> list[str]:
+        """Configured providers with credentials, in preference order."""
+        names = self.LLM_PROVIDERS.split(",") if self.LLM_PROVIDERS else [self.LLM_PROVIDER or ""]
+        providers: list[str] = []
+        for name in (n.strip().lower() for n in names):
+            if name not in providers and self._provider_configured(name):
+                providers.append(name)
+        return providers
+
+    def _provider_configured(self, provider: str) -> bool:
+        if provider == "azure":
             return bool(self.AZURE_OPENAI_ENDPOINT)
-        if p == "github":
+        if provider == "github":
             return bool(self.GITHUB_TOKEN)
         return False
 
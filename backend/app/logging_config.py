@@ -6,6 +6,21 @@ from contextvars import ContextVar
 correlation_id_var: ContextVar[str] = ContextVar("correlation_id", default="")
 
 
+# `extra=` fields copied into the JSON payload
+_EXTRA_KEYS = (
+    "intent",
+    "endpoint",
+    "masked_pin",
+    "source",
+    "batch_size",
+    "model",
+    "prompt_tokens",
+    "cached_tokens",
+    "completion_tokens",
+    "latency_ms",
+)
+
+
 class JSONFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         payload: dict = {
@@ -17,7 +32,7 @@ class JSONFormatter(logging.Formatter):
         }
         if record.exc_info:
             payload["exception"] = self.formatException(record.exc_info)
-        for key in ("intent", "endpoint", "masked_pin", "source"):
+        for key in _EXTRA_KEYS:
             if hasattr(record, key):
                 payload[key] = getattr(record, key)
         return json.dumps(payload)
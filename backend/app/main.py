@@ -1,3 +1,6 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -12,11 +15,36 @@ except ImportError:
 from app.config import settings
 from app.logging_config import configure_logging
 from app.middleware import CorrelationIDMiddleware
-from app.routers import api, health, nl
+from app.nlp.llm_client import close_llm_clients, warm_up_llm_client
+from app.nlp.rule_learner import check_workers, get_rule_learner
+from app.routers import admin, api, health, nl
+from app.store import store
 
 configure_logging(settings.LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open LLM connections before traffic arrives (LLM_WARMUP_CONNECTIONS > 0)
+    if settings.llm_enabled() and settings.LLM_WARMUP_CONNECTIONS > 0:
+        try:
+            await warm_up_llm_client(settings.LLM_WARMUP_CONNECTIONS)
+        except Exception as exc:
+            logger.warning("LLM warm-up skipped: %s", exc)
+    # Install the rules learned in earlier runs (LEARNED_RULES_PATH)
+    check_workers()
+    get_rule_learner()
+    yield
+    await close_llm_clients()
+    learner = get_rule_learner()
+    if learner is not None:
+        learner.flush()
+    store.close()
+
 
 app = FastAPI(
+    lifespan=lifespan,
     title="NL Security Control",
     version="1.0.0",
     description=(
@@ -29,6 +57,7 @@ app = FastAPI(
         {"name": "NL", "description": "Natural language command processing"},
         {"name": "Security API", "description": "Direct security system control endpoints"},
         {"name": "Health", "description": "Service health and status"},
+        {"name": "Admin", "description": "Rule set and learned rule management"},
     ],
 )
 
@@ -46,6 +75,7 @@ app.add_middleware(CorrelationIDMiddleware)
 app.include_router(health.router)
 app.include_router(nl.router)
 app.include_router(api.router, prefix="/api")
+app.include_router(admin.router, prefix="/admin")
 
 
 @app.exception_handler(Exception)
@@ -0,0 +1,63 @@
+"""
+In-process counters and timings exposed at GET /metrics.
+
+Counters are plain named integers ("parse_cache.hits", ...). Timings keep
+the most recent samples of a duration and report percentiles. Both reset on
+restart and are per process; scrape every worker if running several.
+"""
+import math
+import threading
+from collections import Counter, deque
+
+# Samples kept per timing
+_TIMING_SAMPLES = 1000
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Counter[str] = Counter()
+        self._timings: dict[str, deque[float]] = {}
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters[name]
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one sample of a timing (milliseconds by convention)."""
+        with self._lock:
+            samples = self._timings.get(name)
+            if samples is None:
+                samples = self._timings[name] = deque(maxlen=_TIMING_SAMPLES)
+            samples.append(value)
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def timings(self) -> dict[str, dict[str, float]]:
+        """count, p50 and p95 of the recent samples of each timing."""
+        with self._lock:
+            timings = {name: sorted(samples) for name, samples in self._timings.items()}
+        return {
+            name: {
+                "count": len(samples),
+                "p50": round(samples[math.ceil(0.5 * len(samples)) - 1], 1),
+                "p95": round(samples[math.ceil(0.95 * len(samples)) - 1], 1),
+            }
+            for name, samples in sorted(timings.items())
+        }
+
+    def reset(self) -> None:
+        """Clear all counters and timings (used by tests)."""
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+# Singleton shared across the app
+metrics = Metrics()
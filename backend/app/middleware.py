@@ -1,3 +1,4 @@
+import time
 import uuid
 
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -9,6 +10,9 @@ from app.logging_config import correlation_id_var
 
 class CorrelationIDMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
+        # Outermost middleware: as close to arrival as the app can see, so
+        # latency budgets count from here (see routers/nl.py)
+        request.state.received_at = time.monotonic()
         cid = request.headers.get(settings.CORRELATION_ID_HEADER) or str(uuid.uuid4())
         token = correlation_id_var.set(cid)
         try:
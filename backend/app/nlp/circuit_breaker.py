@@ -0,0 +1,139 @@
+"""
+Circuit breaker for LLM providers.
+
+Each provider gets a breaker that watches its last `window` calls. Once at
+least `min_calls` are recorded, the breaker opens when the error rate
+reaches `error_rate` or the p95 latency exceeds `p95_ms` (0 = latency not
+watched). While open, callers are refused at once instead of waiting on a
+degraded provider. After `cooldown` seconds one probe call is let through
+(half-open): success closes the breaker, failure opens it again.
+"""
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from app.metrics import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window: int,
+        min_calls: int,
+        error_rate: float,
+        p95_ms: float,
+        cooldown: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.p95_ms = p95_ms
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (ok, latency in ms) of the most recent calls
+        self._calls: deque[tuple[bool, float]] = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state != CLOSED and self._clock() - self._opened_at >= self.cooldown:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go to the provider now."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            now = self._clock()
+            if now - self._opened_at >= self.cooldown:
+                # Let one probe through; another after a further cooldown
+                # in case this one never reports back
+                self._state = HALF_OPEN
+                self._opened_at = now
+                return True
+        metrics.incr(f"{self.name}.breaker_rejected")
+        return False
+
+    def record(self, ok: bool, latency_ms: float) -> None:
+        """Outcome of a call that allow() let through."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if ok and not self._too_slow([latency_ms]):
+                    self._state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._trip()
+                return
+            self._calls.append((ok, latency_ms))
+            if self._state == CLOSED and len(self._calls) >= self.min_calls:
+                errors = sum(1 for ok, _ in self._calls if not ok)
+                latencies = [latency for _, latency in self._calls]
+                if errors / len(self._calls) >= self.error_rate or self._too_slow(latencies):
+                    self._trip()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._calls.clear()
+
+    def _too_slow(self, latencies: list[float]) -> bool:
+        if not self.p95_ms:
+            return False
+        ordered = sorted(latencies)
+        return ordered[math.ceil(0.95 * len(ordered)) - 1] > self.p95_ms
+
+    def _trip(self) -> None:
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._calls.clear()
+        metrics.incr(f"{self.name}.breaker_opened")
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """The process-wide breaker for `provider`, built from settings on first use."""
+    from app.config import settings
+
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(
+                f"llm.{provider}",
+                settings.LLM_BREAKER_WINDOW,
+                settings.LLM_BREAKER_MIN_CALLS,
+                settings.LLM_BREAKER_ERROR_RATE,
+                settings.LLM_BREAKER_P95_MS,
+                settings.LLM_BREAKER_COOLDOWN,
+            )
+        return breaker
+
+
+def breaker_states() -> dict[str, str]:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {provider: breaker.state for provider, breaker in sorted(breakers.items())}
+
+
+def reset_breakers() -> None:
+    """Forget every breaker (used by tests)."""
+    with _breakers_lock:
+        _breakers.clear()
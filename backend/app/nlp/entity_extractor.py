@@ -1,9 +1,53 @@
 import logging
 import re
-from typing import Optional
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+from app.nlp.normalize import NormalizedText, TextInput, normalize
+from app.nlp.time_parser import parse_time
 
 logger = logging.getLogger(__name__)
 
+# ---------------------------------------------------------------------------
+# Token walk shared by the extractors
+# One pass over the tokens records where each trigger literal first occurs and
+# the first standalone 4-6 digit token. The keyword-driven patterns below can
+# only match starting at a trigger, so they start searching there, or are
+# skipped outright when the trigger never occurs.
+# ---------------------------------------------------------------------------
+
+# Substrings that start a PIN keyword ("pin", "passcode", "pass code", ...)
+_PIN_TRIGGERS = ("pin", "pass")
+# Substrings that start an explicit name keyword ("user", "name(d)", "for")
+_NAME_TRIGGERS = ("user", "name", "for")
+# Whole words that start a relationship phrase ("my", "our", "the")
+_RELATION_WORDS = frozenset(("my", "our", "the"))
+
+
+def _walk(nt: NormalizedText) -> tuple[dict[str, int], Optional[tuple[int, int]]]:
+    """Return ({trigger: first token offset}, span of the first bare PIN)."""
+
+    def compute() -> tuple[dict[str, int], Optional[tuple[int, int]]]:
+        first: dict[str, int] = {}
+        bare_pin: Optional[tuple[int, int]] = None
+        for token, start, end in nt.tokens:
+            for trigger in _PIN_TRIGGERS + _NAME_TRIGGERS:
+                if trigger not in first and trigger in token:
+                    first[trigger] = start
+            if "relation" not in first and token in _RELATION_WORDS:
+                first["relation"] = start
+            # A whole \w+ token of 4-6 digits is exactly what \b(\d{4,6})\b matches
+            if bare_pin is None and 4 <= len(token) <= 6 and token.isdecimal():
+                bare_pin = (start, end)
+        return first, bare_pin
+
+    return nt.cached(_walk, compute)
+
+
+def _first_offset(first: dict[str, int], triggers: Iterable[str]) -> Optional[int]:
+    offsets = [first[t] for t in triggers if t in first]
+    return min(offsets) if offsets else None
+
 # ---------------------------------------------------------------------------
 # PIN extraction
 # ---------------------------------------------------------------------------
@@ -12,17 +56,30 @@ _PIN_KEYWORD_RE = re.compile(
     r"(?:pin|passcode|pass\s*code|password)\s*(?:is\s*|[:\s]+)?(\d{4,6})",
     re.IGNORECASE,
 )
-_PIN_BARE_RE = re.compile(r"\b(\d{4,6})\b")
 
 
-def extract_pin(text: str) -> Optional[str]:
+def find_pin(text: TextInput) -> Optional[tuple[int, int]]:
+    """Span of the PIN in the normalized text, or None."""
+    nt = normalize(text)
+    return nt.cached(find_pin, lambda: _find_pin(nt))
+
+
+def _find_pin(nt: NormalizedText) -> Optional[tuple[int, int]]:
+    first, bare_pin = _walk(nt)
     # Prefer PIN adjacent to a keyword
-    m = _PIN_KEYWORD_RE.search(text)
-    if m:
-        return m.group(1)
+    start = _first_offset(first, _PIN_TRIGGERS)
+    if start is not None:
+        m = _PIN_KEYWORD_RE.search(nt.text, start)
+        if m:
+            return m.span(1)
     # Fallback: first standalone 4-6 digit sequence
-    m = _PIN_BARE_RE.search(text)
-    return m.group(1) if m else None
+    return bare_pin
+
+
+def extract_pin(text: TextInput) -> Optional[str]:
+    nt = normalize(text)
+    span = find_pin(nt)
+    return nt.text[span[0]:span[1]] if span else None
 
 
 # ---------------------------------------------------------------------------
@@ -38,6 +95,7 @@ _NON_NAME_WORDS = {
     "System", "Alarm", "Security", "User", "Arm", "Disarm", "Pin",
     "Passcode", "Access", "Mode", "Stay", "Away", "Home",
 }
+_NON_NAME_LOWER = {w.lower() for w in _NON_NAME_WORDS}
 
 # Strategy 1: explicit "user/named/for NAME" pattern
 # Captures a single name word (or hyphenated/apostrophe name like O'Brien, Mary-Jane)
@@ -61,51 +119,74 @@ _NEAR_PIN_RE = re.compile(
 )
 
 
-def extract_name(text: str) -> Optional[str]:
+def find_name(text: TextInput) -> Optional[tuple[int, int]]:
+    """Span of the name in the normalized text, or None (see format_name)."""
+    nt = normalize(text)
+    return nt.cached(find_name, lambda: _find_name(nt))
+
+
+def _find_name(nt: NormalizedText) -> Optional[tuple[int, int]]:
+    first, _ = _walk(nt)
+
     # Strategy 1: explicit keyword (add user John, name Sarah, for Alice)
-    m = _USER_KEYWORD_RE.search(text)
-    if m:
-        candidate = m.group(1).strip()
-        if candidate.title() not in _NON_NAME_WORDS and candidate.lower() not in {w.lower() for w in _NON_NAME_WORDS}:
-            return candidate.title()
+    start = _first_offset(first, _NAME_TRIGGERS)
+    if start is not None:
+        m = _USER_KEYWORD_RE.search(nt.text, start)
+        if m:
+            candidate = m.group(1).strip()
+            if candidate.lower() not in _NON_NAME_LOWER:
+                return m.span(1)
 
     # Strategy 2: relationship/title words (my mother-in-law, the sister, our friend)
-    m = _RELATIONSHIP_RE.search(text)
-    if m:
-        candidate = m.group(1).strip()
-        if candidate.title() not in _NON_NAME_WORDS and len(candidate) > 2:
-            return candidate.replace(" ", "-").title()
+    start = first.get("relation")
+    if start is not None:
+        m = _RELATIONSHIP_RE.search(nt.text, start)
+        if m:
+            candidate = m.group(1).strip()
+            if candidate.title() not in _NON_NAME_WORDS and len(candidate) > 2:
+                return m.span(1)
 
     # Strategy 3: capitalized token before "pin/passcode" (prefer hyphenated names)
-    m = _NEAR_PIN_RE.search(text)
-    if m:
-        candidate = m.group(1).strip()
-        if candidate.title() not in _NON_NAME_WORDS:
-            return candidate.title()
+    if _first_offset(first, _PIN_TRIGGERS) is not None:
+        m = _NEAR_PIN_RE.search(nt.text)
+        if m:
+            candidate = m.group(1).strip()
+            if candidate.title() not in _NON_NAME_WORDS:
+                return m.span(1)
 
     return None
 
 
+def format_name(candidate: str) -> str:
+    """Display form of a matched name: 'mother in law' -> 'Mother-In-Law'."""
+    return candidate.strip().replace(" ", "-").title()
+
+
+def extract_name(text: TextInput) -> Optional[str]:
+    nt = normalize(text)
+    span = find_name(nt)
+    return format_name(nt.text[span[0]:span[1]]) if span else None
+
+
 # ---------------------------------------------------------------------------
 # Mode extraction
 # ---------------------------------------------------------------------------
 
-_MODE_PATTERNS: dict[str, re.Pattern] = {
-    "stay": re.compile(r"\bstay\b", re.IGNORECASE),
-    "home": re.compile(r"\bhome\b", re.IGNORECASE),
-    "away": re.compile(r"\baway\b", re.IGNORECASE),
-}
+# Checked in this order; a whole-word match on the folded tokens is the same
+# test as \bstay\b / \bhome\b / \baway\b with IGNORECASE
+_MODES = ("stay", "home", "away")
 
 
-def extract_mode(text: str) -> str:
-    for mode, pattern in _MODE_PATTERNS.items():
-        if pattern.search(text):
+def extract_mode(text: TextInput) -> str:
+    words = normalize(text).words
+    for mode in _MODES:
+        if mode in words:
             return mode
     return "away"
 
 
 # ---------------------------------------------------------------------------
-# Time range extraction (via dateparser)
+# Time range extraction (time_parser grammar, dateparser as last resort)
 # ---------------------------------------------------------------------------
 
 _RANGE_RE = re.compile(
@@ -114,18 +195,21 @@ _RANGE_RE = re.compile(
 )
 
 
-def extract_time_range(text: str) -> tuple[Optional[str], Optional[str]]:
-    try:
-        import dateparser  # type: ignore
+def find_time_range(text: TextInput) -> Optional[tuple[tuple[int, int], tuple[int, int]]]:
+    """Spans of the start and end phrases of a "from ... to ..." window, or None."""
+    m = normalize(text).search(_RANGE_RE)
+    return (m.span(1), m.span(2)) if m else None
 
-        m = _RANGE_RE.search(text)
-        if not m:
-            return None, None
 
-        start_raw = m.group(1).strip()
-        end_raw = m.group(2).strip()
-        start_dt = dateparser.parse(start_raw)
-        end_dt = dateparser.parse(end_raw)
+def resolve_time_range(
+    phrases: tuple[str, str], now: Optional[datetime] = None
+) -> tuple[Optional[str], Optional[str]]:
+    """Resolve (start phrase, end phrase) to ISO strings; None where unparseable."""
+    try:
+        # One reference time for both ends so they resolve consistently
+        now = now or datetime.now()
+        start_dt = parse_time(phrases[0].strip(), now)
+        end_dt = parse_time(phrases[1].strip(), now)
 
         start_iso = start_dt.isoformat() if start_dt else None
         end_iso = end_dt.isoformat() if end_dt else None
@@ -136,6 +220,14 @@ def extract_time_range(text: str) -> tuple[Optional[str], Optional[str]]:
         return None, None
 
 
+def extract_time_range(text: TextInput) -> tuple[Optional[str], Optional[str]]:
+    nt = normalize(text)
+    spans = find_time_range(nt)
+    if spans is None:
+        return None, None
+    return resolve_time_range(tuple(nt.text[s:e] for s, e in spans))
+
+
 # ---------------------------------------------------------------------------
 # Permissions extraction
 # ---------------------------------------------------------------------------
@@ -148,12 +240,18 @@ _CAN_ARM_RE = re.compile(
 )
 
 
-def extract_permissions(text: str) -> list[str]:
-    if _ARM_AND_DISARM_RE.search(text):
+def extract_permissions(text: TextInput) -> list[str]:
+    nt = normalize(text)
+    words = nt.words
+    # Both patterns need the whole word "arm" or "disarm"; skip them otherwise
+    if "arm" not in words and "disarm" not in words:
+        return ["arm", "disarm"]
+
+    if nt.search_folded(_ARM_AND_DISARM_RE):
         return ["arm", "disarm"]
 
     perms: set[str] = set()
-    m = _CAN_ARM_RE.search(text)
+    m = nt.search_folded(_CAN_ARM_RE)
     if m:
         fragment = m.group(1).lower()
         if "arm" in fragment:
@@ -162,3 +260,47 @@ def extract_permissions(text: str) -> list[str]:
             perms.add("disarm")
 
     return sorted(perms) if perms else ["arm", "disarm"]
+
+
+# ---------------------------------------------------------------------------
+# Extraction plan
+# Entities each intent's API payload consumes; nothing else is extracted.
+# arm/disarm dominate traffic and never pay for name, PIN or date parsing.
+# ---------------------------------------------------------------------------
+
+EXTRACTION_PLAN: dict[str, tuple[str, ...]] = {
+    "arm": ("mode",),
+    "disarm": (),
+    "add_user": ("name", "pin", "time_range", "permissions"),
+    "remove_user": ("name", "pin"),
+    "list_users": (),
+}
+
+
+def needs_entities(intent: str) -> bool:
+    """False if the intent's API call takes no entities (disarm, list_users)."""
+    return EXTRACTION_PLAN.get(intent) != ()
+
+
+# ---------------------------------------------------------------------------
+# Single-pass scan
+# ---------------------------------------------------------------------------
+
+_EXTRACTORS = {
+    "name": extract_name,
+    "pin": extract_pin,
+    "mode": extract_mode,
+    "permissions": extract_permissions,
+}
+
+
+def scan_entities(text: TextInput, fields: Iterable[str]) -> dict[str, Any]:
+    """
+    Extract only the requested entities ("name", "pin", "mode", "permissions").
+
+    All of them read the same token walk and word set, computed once for the
+    text, so asking for several entities costs one pass over the tokens plus
+    the regexes whose triggers actually occur.
+    """
+    nt = normalize(text)
+    return {field: _EXTRACTORS[field](nt) for field in fields}
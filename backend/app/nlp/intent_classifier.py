@@ -0,0 +1,187 @@
+"""
+Local statistical intent classifier: the tier between the rules and the LLM.
+
+A linear (softmax regression) model over hashed features of the folded
+command -- character 3-5-grams, words and word bigrams -- trained offline
+(see train_classifier.py) from intent_corpus.json. The corpus includes
+commands that are not for the security system, labelled null, so unrelated
+text lands in the "none" class instead of the nearest intent. Commands the
+model is not confident about (below CLASSIFIER_THRESHOLD) still go to the
+LLM fallback.
+
+Pure Python: a prediction is about a hundred dict lookups, well under a
+millisecond, and needs no third-party packages.
+"""
+import json
+import logging
+import math
+import random
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from app.config import settings
+from app.metrics import metrics
+from app.nlp.normalize import NormalizedText, TextInput, normalize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = Path(__file__).with_name("intent_model.json")
+
+# Label of the "not a security command" class
+NONE_LABEL = "none"
+
+_NGRAM_SIZES = (3, 4, 5)
+_BUCKETS = 1 << 18
+
+
+def features(nt: NormalizedText) -> list[int]:
+    """Distinct hashed features: char n-grams of the folded words, words, bigrams."""
+    words = [token for token, _, _ in nt.tokens]
+    text = " " + " ".join(words) + " "
+    grams = [text[i:i + n] for n in _NGRAM_SIZES for i in range(len(text) - n + 1)]
+    grams += ["w:" + word for word in words]
+    padded = ["<s>", *words, "</s>"]
+    grams += ["b:" + a + " " + b for a, b in zip(padded, padded[1:])]
+    return sorted({zlib.crc32(gram.encode("utf-8")) & (_BUCKETS - 1) for gram in grams})
+
+
+class IntentClassifier:
+    def __init__(
+        self,
+        labels: list[str],
+        bias: list[float],
+        weights: dict[int, list[float]],
+        checksum: str = "",
+    ) -> None:
+        self.labels = labels
+        self.bias = bias
+        # feature bucket -> weight per label, for buckets seen in training
+        self.weights = weights
+        self.checksum = checksum
+
+    @classmethod
+    def train(
+        cls,
+        examples: Iterable[tuple[str, Optional[str]]],
+        epochs: int = 40,
+        rate: float = 1.0,
+        l2: float = 1e-4,
+        seed: int = 0,
+        checksum: str = "",
+    ) -> "IntentClassifier":
+        """
+        Fit on (text, intent) pairs, an intent of None being the "none"
+        class, by stochastic gradient descent on the cross-entropy.
+        """
+        data = [(features(NormalizedText(text)), intent or NONE_LABEL) for text, intent in examples]
+        labels = sorted({label for _, label in data})
+        index = {label: i for i, label in enumerate(labels)}
+        samples = [(buckets, index[label]) for buckets, label in data]
+        model = cls(labels, [0.0] * len(labels), {}, checksum)
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(samples)
+            for buckets, target in samples:
+                probabilities = model._softmax(buckets)
+                scale = rate / math.sqrt(len(buckets))
+                for i, probability in enumerate(probabilities):
+                    gradient = probability - (i == target)
+                    model.bias[i] -= 0.1 * rate * gradient
+                    for bucket in buckets:
+                        row = model.weights.setdefault(bucket, [0.0] * len(labels))
+                        row[i] -= scale * gradient + rate * l2 * row[i]
+        # Rounded as stored, so the trained and the loaded model agree
+        model.bias = [round(b, 3) for b in model.bias]
+        for row in model.weights.values():
+            row[:] = [round(weight, 3) for weight in row]
+        return model
+
+    def _softmax(self, buckets: list[int]) -> list[float]:
+        # Scores are scaled by 1/sqrt(#features) so long and short commands
+        # give comparably sharp posteriors
+        scores = [0.0] * len(self.labels)
+        for bucket in buckets:
+            row = self.weights.get(bucket)
+            if row is not None:
+                for i, weight in enumerate(row):
+                    scores[i] += weight
+        scale = 1 / math.sqrt(len(buckets)) if buckets else 0.0
+        scores = [bias + score * scale for bias, score in zip(self.bias, scores)]
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict(self, nt: NormalizedText) -> tuple[Optional[str], float]:
+        """(intent or None for the "none" class, posterior probability)."""
+        probabilities = self._softmax(features(nt))
+        best = max(range(len(self.labels)), key=probabilities.__getitem__)
+        label = self.labels[best]
+        return (None if label == NONE_LABEL else label), probabilities[best]
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "version": 1,
+            "corpus_checksum": self.checksum,
+            "labels": self.labels,
+            "bias": self.bias,
+            "weights": {str(bucket): row for bucket, row in sorted(self.weights.items())},
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "IntentClassifier":
+        return cls(
+            data["labels"],
+            data["bias"],
+            {int(bucket): row for bucket, row in data["weights"].items()},
+            data.get("corpus_checksum", ""),
+        )
+
+
+_model: Optional[IntentClassifier] = None
+_model_path: Optional[str] = None
+_model_lock = threading.Lock()
+
+
+def load_model(path: Optional[str] = None) -> IntentClassifier:
+    path = path or settings.CLASSIFIER_MODEL_PATH or str(DEFAULT_MODEL_PATH)
+    with open(path, encoding="utf-8") as f:
+        return IntentClassifier.from_json(json.load(f))
+
+
+def get_model() -> Optional[IntentClassifier]:
+    """The shared model, loaded on first use; None if it cannot be read."""
+    global _model, _model_path
+    path = settings.CLASSIFIER_MODEL_PATH or str(DEFAULT_MODEL_PATH)
+    if _model is not None and _model_path == path:
+        return _model
+    with _model_lock:
+        if _model is None or _model_path != path:
+            try:
+                _model = load_model(path)
+            except (OSError, ValueError, KeyError) as exc:
+                logger.warning("Intent classifier model unavailable (%s): %s", path, exc)
+                _model = None
+            _model_path = path
+        return _model
+
+
+def classify_local(text: TextInput) -> Optional[str]:
+    """
+    Intent from the local model if it is at least CLASSIFIER_THRESHOLD
+    confident, else None (leave it to the LLM).
+    """
+    if not settings.CLASSIFIER_ENABLED:
+        return None
+    model = get_model()
+    if model is None:
+        return None
+    nt = normalize(text)
+    intent, confidence = nt.cached(classify_local, lambda: model.predict(nt))
+    if intent is None or confidence < settings.CLASSIFIER_THRESHOLD:
+        metrics.incr("classifier.misses")
+        return None
+    metrics.incr("classifier.hits")
+    return intent
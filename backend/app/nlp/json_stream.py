@@ -0,0 +1,87 @@
+"""
+Incremental scanning of a streamed JSON object.
+
+FieldScanner is fed the text of a JSON object chunk by chunk and reports a
+top-level string/null field as soon as its value is complete, long before
+the object is. It only tracks nesting, strings and literals; the complete
+text is still decoded with json.loads once it has all arrived.
+"""
+import json
+from typing import Any
+
+# Returned by FieldScanner.feed until the field's value is known
+PENDING = object()
+
+_LITERAL_END = frozenset(",}] \t\r\n")
+
+
+class FieldScanner:
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self.value: Any = PENDING
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string: list[str] = []
+        self._literal: list[str] = []
+        self._key = ""
+        self._expect_value = False
+
+    def feed(self, chunk: str) -> Any:
+        """Consume more text; return the field's value, or PENDING if not yet complete."""
+        for char in chunk:
+            if self.value is not PENDING:
+                break
+            self._step(char)
+        return self.value
+
+    def _step(self, char: str) -> None:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._depth == 1:
+                    self._end_string(json.loads('"' + "".join(self._string) + '"'))
+                return
+            self._string.append(char)
+            return
+
+        if self._literal:
+            if char not in _LITERAL_END:
+                self._literal.append(char)
+                return
+            self._end_literal("".join(self._literal))
+            self._literal = []
+
+        if char == '"':
+            self._in_string = True
+            self._string = []
+        elif char in "{[":
+            self._depth += 1
+            if self._depth == 1:
+                self._expect_value = False
+            elif self._depth == 2 and self._expect_value and self._key == self.field:
+                # Not a string or null: leave it to the full decode
+                self._key = ""
+        elif char in "}]":
+            self._depth -= 1
+        elif self._depth == 1:
+            if char == ":":
+                self._expect_value = True
+            elif char == ",":
+                self._expect_value = False
+            elif not char.isspace() and self._expect_value:
+                self._literal = [char]
+
+    def _end_string(self, text: str) -> None:
+        if not self._expect_value:
+            self._key = text
+        elif self._key == self.field:
+            self.value = text
+
+    def _end_literal(self, literal: str) -> None:
+        if self._depth == 1 and self._key == self.field and literal == "null":
+            self.value = None
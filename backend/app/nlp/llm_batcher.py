@@ -0,0 +1,66 @@
+"""
+Micro-batching of LLM fallback calls.
+
+Texts submitted within `max_wait` seconds of each other (or until `max_size`
+are pending) are handed to `call_batch` together, and each caller receives
+the result for its own text. `call_batch` returns one entry per text, in
+order; an entry that is an exception is raised to that caller only.
+
+Callers may pass a deadline (time.monotonic()). The batch is given the
+latest one, so nobody's answer is cut short, or None when any caller has
+no deadline.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+from app.metrics import metrics
+
+BatchCall = Callable[[list[str], Optional[float]], Awaitable[list[Any]]]
+
+
+class LLMBatcher:
+    def __init__(self, call_batch: BatchCall, max_size: int, max_wait: float) -> None:
+        self.call_batch = call_batch
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: list[tuple[str, Optional[float], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, text: str, deadline: Optional[float] = None) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Pending work of a previous (closed) loop can never complete
+            self._loop, self._pending, self._timer = loop, [], None
+        future = loop.create_future()
+        self._pending.append((text, deadline, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            metrics.incr("llm.batches")
+            metrics.incr("llm.batched_items", len(batch))
+            self._loop.create_task(self._run(batch))
+
+    async def _run(self, batch: list[tuple[str, Optional[float], asyncio.Future]]) -> None:
+        deadlines = [deadline for _, deadline, _ in batch]
+        deadline = None if None in deadlines else max(deadlines)
+        try:
+            results = await self.call_batch([text for text, _, _ in batch], deadline)
+        except Exception as exc:
+            results = [exc] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,255 @@
+"""
+Persistent cache of LLM fallback results (SQLite).
+
+Keyed by a hash of the normalized command text, provider, model and prompt
+version, so changing any of them starts from a clean slate. Entries expire
+after LLM_CACHE_TTL seconds; texts the LLM could not classify are stored as
+negative entries with the shorter LLM_CACHE_NEGATIVE_TTL. Past
+LLM_CACHE_MAX_ENTRIES the least recently used entries are evicted.
+
+A hit only reads the database: when an entry was last used is kept in
+memory and written with the next put(), which is also when expired entries
+are deleted. Eviction runs once the table has grown a tenth past its limit,
+and trims it back to the limit in one statement over the used_at index.
+
+Nothing secret or time-dependent is written to disk:
+
+- the command text is only stored as a hash;
+- a PIN is stored as its offset in the normalized text and read back from the
+  text on a hit (results whose PIN does not appear verbatim are not cached);
+- start/end times are stored only as "present". A hit re-resolves them from
+  the text's "from ... to ..." phrases against the current UTC time, as the
+  LLM does, and returns them in UTC; it counts as a miss if that fails.
+  Results with times but no such phrase are not cached.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from app.metrics import metrics
+from app.nlp import entity_extractor as ee
+from app.nlp.normalize import NormalizedText
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key        TEXT PRIMARY KEY,
+    result     TEXT,            -- JSON; NULL for a negative entry
+    expires_at REAL NOT NULL,
+    used_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_cache_used_at ON llm_cache (used_at);
+"""
+_TIME_FIELDS = ("start_time", "end_time")
+
+# Sentinel distinguishing "cached: LLM could not classify" from a cache miss
+NEGATIVE = object()
+
+
+def cache_text(text: str) -> str:
+    """Normalized form of a command used for the cache key."""
+    return " ".join(NormalizedText(text).text.split())
+
+
+class LLMCache:
+    def __init__(
+        self, path: str, ttl: float, negative_ttl: float, max_entries: int
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # key -> last hit, not yet written
+        self._used: dict[str, float] = {}
+        # Rows in the table, give or take replaced keys (an overestimate)
+        self._rows = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            conn.commit()
+            self._rows = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(text: str, provider: str, model: str, prompt_version: int) -> str:
+        raw = "\x1f".join((cache_text(text), provider, model, str(prompt_version)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, text: str) -> Any:
+        """Return the cached result for `text`, NEGATIVE, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT result, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                metrics.incr("llm_cache.misses")
+                return None
+            if row[1] <= now:
+                # Deleted by the next put()
+                metrics.incr("llm_cache.misses")
+                return None
+            self._used[key] = now
+
+        if row[0] is None:
+            metrics.incr("llm_cache.negative_hits")
+            return NEGATIVE
+        result = _restore(json.loads(row[0]), text)
+        if result is None:
+            metrics.incr("llm_cache.misses")
+            return None
+        metrics.incr("llm_cache.hits")
+        return result
+
+    def put(self, key: str, text: str, result: Optional[dict[str, Any]]) -> None:
+        """Store a result, or a negative entry when `result` is None."""
+        if result is None:
+            stored, ttl = None, self.negative_ttl
+        else:
+            prepared = _prepare(result, text)
+            if prepared is None:
+                return
+            stored, ttl = json.dumps(prepared), self.ttl
+
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            self._used.pop(key, None)
+            self._write_used(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, result, expires_at, used_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, stored, now + ttl, now),
+            )
+            self._rows += 1
+            if self._rows > self.max_entries + self.max_entries // 10:
+                conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+                conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN ("
+                    "  SELECT key FROM llm_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?"
+                    ")",
+                    (self.max_entries,),
+                )
+                self._rows = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            conn.commit()
+
+    def _write_used(self, conn: sqlite3.Connection) -> None:
+        # Callers hold _lock and commit
+        if self._used:
+            conn.executemany(
+                "UPDATE llm_cache SET used_at = ? WHERE key = ?",
+                [(used_at, key) for key, used_at in self._used.items()],
+            )
+            self._used.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+            self._used.clear()
+            self._rows = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._write_used(self._conn)
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+
+def _prepare(result: dict[str, Any], text: str) -> Optional[dict[str, Any]]:
+    """Copy of `result` safe to persist, or None if it cannot be cached."""
+    normalized = cache_text(text)
+    stored = dict(result)
+    entities = dict(result.get("entities") or {})
+    pin = entities.pop("pin", None)
+    if pin is not None:
+        start = normalized.find(str(pin))
+        if start < 0:
+            return None
+        entities["pin_span"] = [start, start + len(str(pin))]
+    if any(entities.get(field) is not None for field in _TIME_FIELDS):
+        # Only cacheable if the times can be re-derived from the text later
+        if ee.find_time_range(normalized) is None:
+            return None
+        for field in _TIME_FIELDS:
+            if entities.get(field) is not None:
+                entities[field] = True
+    stored["entities"] = entities
+    return stored
+
+
+def _restore(stored: dict[str, Any], text: str) -> Optional[dict[str, Any]]:
+    """Rebuild a result for `text` from a stored entry; None if times cannot be resolved."""
+    nt = NormalizedText(cache_text(text))
+    result = dict(stored)
+    entities = dict(stored.get("entities") or {})
+    span = entities.pop("pin_span", None)
+    if span is not None:
+        entities["pin"] = nt.text[span[0]:span[1]]
+
+    if any(entities.get(field) for field in _TIME_FIELDS):
+        spans = ee.find_time_range(nt)
+        if spans is None:
+            return None
+        # The LLM resolves against the current UTC time and answers in UTC
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        resolved = dict(
+            zip(_TIME_FIELDS, ee.resolve_time_range(tuple(nt.text[s:e] for s, e in spans), now))
+        )
+        for field in _TIME_FIELDS:
+            if entities.get(field):
+                if resolved[field] is None:
+                    return None
+                entities[field] = _utc(resolved[field])
+    result["entities"] = entities
+    return result
+
+
+def _utc(iso: str) -> str:
+    """`iso` in UTC; a naive time is already a UTC wall-clock time."""
+    moment = datetime.fromisoformat(iso)
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc).isoformat()
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """The shared cache, or None when LLM_CACHE_PATH is empty."""
+    global _cache
+    from app.config import settings
+
+    if not settings.LLM_CACHE_PATH:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != settings.LLM_CACHE_PATH:
+            _cache = LLMCache(
+                settings.LLM_CACHE_PATH,
+                settings.LLM_CACHE_TTL,
+                settings.LLM_CACHE_NEGATIVE_TTL,
+                settings.LLM_CACHE_MAX_ENTRIES,
+            )
+        return _cache
@@ -1,42 +1,192 @@
 """
 Multi-LLM client factory.
 
-Supported providers (set via LLM_PROVIDER env var):
+Supported providers (set via LLM_PROVIDER, or an ordered LLM_PROVIDERS list):
     azure   — Azure OpenAI Service (uses DefaultAzureCredential)
     github  — GitHub Models inference endpoint
 
-Returns an OpenAI-compatible client and the model name to use.
+Returns an OpenAI-compatible client and the model name to use. Without a
+`provider` argument the first configured provider is used.
+
+Clients are process-wide, one per provider: each is created lazily on first
+use, owns one pooled httpx client (keep-alive, connection limits, optional
+HTTP/2) and is reused until the provider settings change. An async client is
+also tied to the event loop it was created on.
 """
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Any
+import threading
+from typing import Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# (provider, asynchronous) -> (config key, client, model, httpx client)
+_clients: dict[tuple[str, bool], tuple[tuple, Any, str, Any]] = {}
+_clients_lock = threading.Lock()
+
 
-def get_llm_client() -> tuple[Any, str]:
+def get_llm_client(provider: Optional[str] = None) -> tuple[Any, str]:
     """
     Factory that selects the correct LLM client and model based on config.
 
     Supported providers: 'azure', 'github'
     """
+    return _pooled_client(asynchronous=False, provider=provider)[:2]
+
+
+def get_async_llm_client(provider: Optional[str] = None) -> tuple[Any, str]:
+    """Same as get_llm_client, but the client is an openai.AsyncOpenAI."""
+    return _pooled_client(asynchronous=True, provider=provider)[:2]
+
+
+def _primary(settings: Any) -> str:
+    providers = settings.llm_providers()
+    return providers[0] if providers else (settings.LLM_PROVIDER or "").lower()
+
+
+def _config_key(settings: Any, provider: str, asynchronous: bool) -> tuple:
+    key = (
+        provider,
+        settings.AZURE_OPENAI_ENDPOINT,
+        settings.AZURE_OPENAI_DEPLOYMENT,
+        settings.AZURE_OPENAI_API_KEY,
+        settings.GITHUB_TOKEN,
+        settings.GITHUB_MODEL,
+        settings.LLM_TIMEOUT,
+        settings.LLM_MAX_CONNECTIONS,
+        settings.LLM_MAX_KEEPALIVE,
+        settings.LLM_KEEPALIVE_EXPIRY,
+        settings.LLM_HTTP2,
+    )
+    if asynchronous:
+        # httpx async connections belong to one event loop
+        key += (asyncio.get_running_loop(),)
+    return key
+
+
+def _pooled_client(
+    asynchronous: bool, provider: Optional[str] = None
+) -> tuple[Any, str, Any]:
+    """(client, model, httpx client), building it if missing or stale."""
     from app.config import settings
 
-    provider = (settings.LLM_PROVIDER or "").lower()
+    provider = (provider or _primary(settings)).lower()
+    key = _config_key(settings, provider, asynchronous)
+    entry = _clients.get((provider, asynchronous))
+    if entry is not None and entry[0] == key:
+        return entry[1:]
+
+    with _clients_lock:
+        entry = _clients.get((provider, asynchronous))
+        if entry is not None and entry[0] == key:
+            return entry[1:]
+        http_client = _build_http_client(settings, asynchronous)
+        client, model = _build_client(settings, provider, asynchronous, http_client)
+        # A replaced client is not closed: requests may still be using it,
+        # and its sockets are released once the last reference goes
+        _clients[(provider, asynchronous)] = (key, client, model, http_client)
+        return client, model, http_client
+
 
+def _build_client(
+    settings: Any, provider: str, asynchronous: bool, http_client: Any
+) -> tuple[Any, str]:
     if provider == "azure":
-        return _build_azure_client(settings)
+        return _build_azure_client(settings, asynchronous, http_client)
 
     if provider == "github":
-        return _build_github_client(settings)
+        return _build_github_client(settings, asynchronous, http_client)
 
     raise RuntimeError(
-        f"Unsupported or unset LLM_PROVIDER: {settings.LLM_PROVIDER!r}. "
+        f"Unsupported or unset LLM provider: {provider!r}. "
         "Supported providers: 'azure', 'github'. To run rule-based only, leave LLM_PROVIDER empty."
     )
 
 
+def _build_http_client(settings: Any, asynchronous: bool) -> Any:
+    import httpx
+
+    http2 = settings.LLM_HTTP2
+    if http2:
+        try:
+            import h2  # type: ignore  # noqa: F401
+        except ImportError:
+            logger.warning("LLM_HTTP2 is set but the h2 package is missing; using HTTP/1.1")
+            http2 = False
+
+    client_cls = httpx.AsyncClient if asynchronous else httpx.Client
+    return client_cls(
+        http2=http2,
+        timeout=settings.LLM_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_llm_model(provider: Optional[str] = None) -> str:
+    """Model (or Azure deployment) name for a provider, without building a client."""
+    from app.config import settings
+
+    provider = (provider or _primary(settings)).lower()
+    if provider == "azure":
+        return settings.AZURE_OPENAI_DEPLOYMENT or ""
+    if provider == "github":
+        return settings.GITHUB_MODEL
+    return ""
+
+
+# ---------------------------------------------------------------------------
+# Lifecycle
+# ---------------------------------------------------------------------------
+
+
+async def warm_up_llm_client(connections: int) -> int:
+    """
+    Open up to `connections` pooled connections to each configured provider
+    ahead of traffic, so the first fallbacks skip DNS, TCP and TLS setup. Any
+    HTTP response counts (the request is an unauthenticated GET of the base
+    URL). Returns how many connections were opened.
+    """
+    from app.config import settings
+
+    opened = 0
+    for provider in settings.llm_providers():
+        opened += await _warm_up(provider, connections)
+    logger.info("LLM client warmed up: %d connection(s)", opened)
+    return opened
+
+
+async def _warm_up(provider: str, connections: int) -> int:
+    client, _, http_client = _pooled_client(asynchronous=True, provider=provider)
+
+    async def touch() -> bool:
+        try:
+            await http_client.get(str(client.base_url))
+            return True
+        except Exception as exc:
+            logger.warning("LLM warm-up request failed: %s", exc)
+            return False
+
+    return sum(await asyncio.gather(*(touch() for _ in range(max(connections, 1)))))
+
+
+async def close_llm_clients() -> None:
+    """Close the pooled clients (application shutdown)."""
+    with _clients_lock:
+        entries = list(_clients.values())
+        _clients.clear()
+    for _, _, _, http_client in entries:
+        if hasattr(http_client, "aclose"):
+            await http_client.aclose()
+        else:
+            http_client.close()
+
+
 # def _build_azure_client(settings: Any) -> tuple[Any, str]:
 #     import openai  # type: ignore
 
@@ -75,12 +225,14 @@ def get_llm_client() -> tuple[Any, str]:
 #     logger.info("LLM client: Azure OpenAI, deployment=%s", settings.AZURE_OPENAI_DEPLOYMENT)
 #     return client, settings.AZURE_OPENAI_DEPLOYMENT
 
-def _build_azure_client(settings: Any) -> tuple[Any, str]:
+def _build_azure_client(
+    settings: Any, asynchronous: bool = False, http_client: Optional[Any] = None
+) -> tuple[Any, str]:
     """
     Simple Azure OpenAI client (no api_version needed).
     Uses only AZURE_OPENAI_ENDPOINT + AZURE_OPENAI_API_KEY.
     """
-    from openai import OpenAI  # modern OpenAI SDK
+    from openai import AsyncOpenAI, OpenAI  # modern OpenAI SDK
 
     if not settings.AZURE_OPENAI_ENDPOINT:
         raise RuntimeError("AZURE_OPENAI_ENDPOINT is not set")
@@ -89,25 +241,32 @@ def _build_azure_client(settings: Any) -> tuple[Any, str]:
         raise RuntimeError("AZURE_OPENAI_API_KEY is not set")
 
     # Create OpenAI client pointing to Azure OpenAI endpoint
-    client = OpenAI(
+    client_cls = AsyncOpenAI if asynchronous else OpenAI
+    client = client_cls(
         api_key=settings.AZURE_OPENAI_API_KEY,
         base_url=settings.AZURE_OPENAI_ENDPOINT,
+        timeout=settings.LLM_TIMEOUT,
+        http_client=http_client,
     )
 
     logger.info("LLM client: Azure OpenAI, deployment=%s", settings.AZURE_OPENAI_DEPLOYMENT)
     return client, settings.AZURE_OPENAI_DEPLOYMENT
 
 
-def _build_github_client(settings: Any) -> tuple[Any, str]:
+def _build_github_client(
+    settings: Any, asynchronous: bool = False, http_client: Optional[Any] = None
+) -> tuple[Any, str]:
     import openai  # type: ignore
 
     if not settings.GITHUB_TOKEN:
         raise RuntimeError("GITHUB_TOKEN is not set")
 
-    client = openai.OpenAI(
+    client_cls = openai.AsyncOpenAI if asynchronous else openai.OpenAI
+    client = client_cls(
         base_url="https://models.github.ai/inference",
         api_key=settings.GITHUB_TOKEN,
         timeout=settings.LLM_TIMEOUT,
+        http_client=http_client,
     )
     logger.info("LLM client: GitHub Models, model=%s", settings.GITHUB_MODEL)
     return client, settings.GITHUB_MODEL
@@ -0,0 +1,224 @@
+"""
+Latency-aware routing across LLM providers.
+
+Every provider call is timed. Per provider, the router keeps an EWMA of
+latency and of the error rate, plus recent latencies for a p90. A fallback
+call goes to the provider with the lowest expected cost (EWMA latency
+inflated by its error rate); providers without observations keep their
+configured order behind observed ones, so the first configured provider
+starts as primary.
+
+On the async path, if the primary has not answered within its p90 latency
+(floored at LLM_HEDGE_MIN_DELAY_MS), the same call is hedged on the next
+provider and the first valid answer wins; the other call is cancelled. On
+errors the next provider is tried as long as the caller's budget allows.
+Every call also goes through the provider's circuit breaker.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from app.metrics import metrics
+from app.nlp.circuit_breaker import CircuitOpenError, get_breaker
+
+# How many recent latencies feed the p90, and how many are needed to hedge
+_LATENCY_SAMPLES = 50
+_MIN_HEDGE_SAMPLES = 5
+
+
+class ProviderStats:
+    def __init__(self, alpha: float) -> None:
+        self.alpha = alpha
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self._latencies: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+
+    def record(self, ok: bool, latency_ms: float) -> None:
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            if self.latency_ms is None:
+                self.latency_ms = latency_ms
+            else:
+                self.latency_ms += self.alpha * (latency_ms - self.latency_ms)
+            self._latencies.append(latency_ms)
+
+    def cost(self) -> float:
+        """Expected latency of a useful answer; inf before the first success."""
+        if self.latency_ms is None:
+            return math.inf
+        return self.latency_ms / max(1.0 - self.error_rate, 0.05)
+
+    def p90(self) -> Optional[float]:
+        if len(self._latencies) < _MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[math.ceil(0.9 * len(ordered)) - 1]
+
+
+class LLMRouter:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats: dict[str, ProviderStats] = {}
+
+    def _get(self, provider: str) -> ProviderStats:
+        from app.config import settings
+
+        stats = self._stats.get(provider)
+        if stats is None:
+            stats = self._stats[provider] = ProviderStats(settings.LLM_ROUTING_EWMA_ALPHA)
+        return stats
+
+    def record(self, provider: str, ok: bool, latency_ms: float) -> None:
+        with self._lock:
+            self._get(provider).record(ok, latency_ms)
+
+    def order(self, providers: list[str]) -> list[str]:
+        """`providers` (in configured order) sorted by expected cost."""
+        with self._lock:
+            costs = {p: self._get(p).cost() for p in providers}
+        return sorted(providers, key=lambda p: (costs[p], providers.index(p)))
+
+    def hedge_delay(self, provider: str) -> Optional[float]:
+        """Seconds to wait on `provider` before hedging; None to never hedge."""
+        from app.config import settings
+
+        with self._lock:
+            p90 = self._get(provider).p90()
+        if p90 is None:
+            return None
+        return max(p90, settings.LLM_HEDGE_MIN_DELAY_MS) / 1000
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {
+                provider: {
+                    "latency_ms": None if s.latency_ms is None else round(s.latency_ms, 1),
+                    "error_rate": round(s.error_rate, 3),
+                    "p90_ms": s.p90(),
+                }
+                for provider, s in sorted(self._stats.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+# Singleton shared by the LLM fallback
+llm_router = LLMRouter()
+
+
+def _next_allowed(candidates: list[str]) -> Optional[str]:
+    """Pop candidates until one whose breaker lets a call through."""
+    while candidates:
+        provider = candidates.pop(0)
+        if get_breaker(provider).allow():
+            return provider
+    return None
+
+
+def _report(provider: str, ok: bool, start: float) -> None:
+    latency_ms = (time.perf_counter() - start) * 1000
+    llm_router.record(provider, ok, latency_ms)
+    get_breaker(provider).record(ok, latency_ms)
+
+
+def call_routed(
+    providers: list[str],
+    call: Callable[[str, Optional[float]], Any],
+    timeout: Optional[float] = None,
+) -> Any:
+    """
+    Run `call(provider, remaining_timeout)` on the best provider, failing
+    over to the next on errors until `timeout` seconds have passed.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    candidates = llm_router.order(providers)
+    error: Optional[Exception] = None
+    while True:
+        provider = _next_allowed(candidates)
+        if provider is None:
+            raise error or CircuitOpenError(",".join(providers))
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise error or TimeoutError("latency budget exhausted")
+        if error is not None:
+            metrics.incr("llm.failovers")
+        start = time.perf_counter()
+        try:
+            result = call(provider, remaining)
+        except Exception as exc:
+            _report(provider, False, start)
+            error = exc
+            continue
+        _report(provider, True, start)
+        return result
+
+
+async def call_routed_async(
+    providers: list[str],
+    call: Callable[[str], Awaitable[Any]],
+    valid: Callable[[Any], bool] = lambda result: result is not None,
+) -> Any:
+    """
+    Await `call(provider)` on the best provider, hedging on the next one
+    after the primary's p90 latency and failing over on errors. Returns the
+    first valid result, else the last result or error. The caller bounds
+    the total wait.
+    """
+    from app.config import settings
+
+    candidates = llm_router.order(providers)
+    provider = _next_allowed(candidates)
+    if provider is None:
+        raise CircuitOpenError(",".join(providers))
+
+    async def attempt(provider: str) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await call(provider)
+        except Exception:
+            _report(provider, False, start)
+            raise
+        _report(provider, True, start)
+        return result
+
+    primary = asyncio.ensure_future(attempt(provider))
+    pending = {primary}
+    delay = llm_router.hedge_delay(provider) if settings.LLM_HEDGE else None
+    error: Optional[Exception] = None
+    result: Any = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.exception()
+                result = None if error is not None else task.result()
+                if error is None and valid(result):
+                    if task is not primary:
+                        metrics.incr("llm.hedge_wins")
+                    return result
+            if not done:
+                # The primary is slow: hedge once on the next provider
+                delay = None
+                backup = _next_allowed(candidates)
+                if backup is not None:
+                    metrics.incr("llm.hedged")
+                    pending.add(asyncio.ensure_future(attempt(backup)))
+            elif not pending:
+                # Everything so far failed: fail over while providers remain
+                backup = _next_allowed(candidates)
+                if backup is not None:
+                    metrics.incr("llm.failovers")
+                    pending.add(asyncio.ensure_future(attempt(backup)))
+    finally:
+        for task in pending:
+            task.cancel()
+    if error is not None:
+        raise error
+    return result
@@ -0,0 +1,92 @@
+"""
+Per-request text normalization shared by every NLP stage.
+
+A command is normalized once into a NormalizedText and handed to the rule
+engine and each entity extractor, instead of every stage re-scanning the raw
+string with its own IGNORECASE regexes.
+
+    text    NFKC form of the input, original case. Extractors that return a
+            substring (name, PIN, time phrases) read this.
+    folded  `text` casefolded and accent-folded ("Désarmer" -> "desarmer"),
+            aligned character-for-character with `text`, so offsets found in
+            one are valid in the other. The rule engine reads this.
+    tokens  (word, start, end) for every \\w+ run in `folded`.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Any, Callable, Optional, Union
+
+from app.nlp.prefilter import fold
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def strip_accents(text: str) -> str:
+    """Remove combining marks: 'système' -> 'systeme'. Leaves ASCII untouched."""
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize("NFD", text)
+    return unicodedata.normalize(
+        "NFC", "".join(c for c in decomposed if not unicodedata.combining(c))
+    )
+
+
+@lru_cache(maxsize=4096)
+def _fold_char(c: str) -> str:
+    folded = fold(strip_accents(c))
+    if len(folded) == 1:
+        return folded
+    # Multi-character folds ('ß' -> 'ss') would break offset alignment
+    lowered = c.lower()
+    return lowered if len(lowered) == 1 else c
+
+
+class NormalizedText:
+    """Normalized views of one command plus a memo for shared sub-results."""
+
+    __slots__ = ("raw", "text", "folded", "tokens", "_words", "_memo")
+
+    def __init__(self, raw: str) -> None:
+        self.raw = raw
+        self.text = unicodedata.normalize("NFKC", raw)
+        if self.text.isascii():
+            self.folded = self.text.lower()
+        else:
+            self.folded = "".join(_fold_char(c) for c in self.text)
+        self.tokens: list[tuple[str, int, int]] = [
+            (m.group(), m.start(), m.end()) for m in _TOKEN_RE.finditer(self.folded)
+        ]
+        self._words: Optional[frozenset[str]] = None
+        self._memo: dict[Any, Any] = {}
+
+    @property
+    def words(self) -> frozenset[str]:
+        """Distinct folded tokens; `w in nt.words` is equivalent to \\bw\\b."""
+        if self._words is None:
+            self._words = frozenset(token for token, _, _ in self.tokens)
+        return self._words
+
+    def cached(self, key: Any, compute: Callable[[], Any]) -> Any:
+        """Return the memoized result for `key`, computing it on first use."""
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = self._memo[key] = compute()
+            return value
+
+    def search(self, pattern: re.Pattern) -> Optional[re.Match]:
+        """Memoized ``pattern.search(self.text)``."""
+        return self.cached(pattern, lambda: pattern.search(self.text))
+
+    def search_folded(self, pattern: re.Pattern) -> Optional[re.Match]:
+        """Memoized ``pattern.search(self.folded)``."""
+        return self.cached(("folded", pattern), lambda: pattern.search(self.folded))
+
+
+TextInput = Union[str, NormalizedText]
+
+
+def normalize(text: TextInput) -> NormalizedText:
+    """Return `text` as a NormalizedText, reusing it if it already is one."""
+    return text if isinstance(text, NormalizedText) else NormalizedText(text)
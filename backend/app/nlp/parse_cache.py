@@ -0,0 +1,208 @@
+"""
+Template-keyed cache of rule-based parse results.
+
+Most traffic is a few hundred phrasings that differ only in the name, PIN and
+times. The cache key is a template of the normalized text in which every
+digit becomes "0" and every slot-safe capitalized word becomes "Xxxx" of the
+same length, so "add user John with pin 4321" and "add user Mike with pin
+8765" share one entry. Lengths are preserved, so spans recorded for one text
+are valid for every text with the same template.
+
+An entry holds the intent plus, per extracted entity, either a span (name,
+PIN, time phrases) or a value that only depends on template text (mode,
+permissions). A hit re-reads the spans from the actual text; the PIN itself,
+and the template's original name, are never stored.
+
+A word is slot-safe only if no pattern could tell it apart from "Xxxx": it
+contains no multi-letter literal run of any rule or extractor regex, neither
+of its end letters is a one-letter run, and it is not a stop word for names.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Optional
+
+from app.config import settings
+from app.metrics import metrics
+from app.nlp import entity_extractor as ee
+from app.nlp.normalize import NormalizedText
+from app.nlp.prefilter import letter_runs
+from app.nlp.rule_engine import RuleSnapshot
+
+_DIGIT_RE = re.compile(r"\d")
+
+# (expiry, intent, slots)
+_Entry = tuple[float, str, dict[str, Any]]
+
+# Every regex besides the rules that reads the words of a command
+_EXTRACTOR_PATTERNS = (
+    ee._PIN_KEYWORD_RE,
+    ee._USER_KEYWORD_RE,
+    ee._RELATIONSHIP_RE,
+    ee._NEAR_PIN_RE,
+    ee._RANGE_RE,
+    ee._ARM_AND_DISARM_RE,
+    ee._CAN_ARM_RE,
+)
+_EXTRACTOR_WORDS = (
+    ee._PIN_TRIGGERS + ee._NAME_TRIGGERS + tuple(ee._RELATION_WORDS) + ee._MODES
+    + ("arm", "disarm")
+)
+
+
+class _Vocabulary:
+    """Letter runs that matching may depend on, for one rules snapshot."""
+
+    def __init__(self, rules: RuleSnapshot) -> None:
+        runs: set[str] = set(_EXTRACTOR_WORDS)
+        for pattern in (p for _, p, _ in rules.rules):
+            runs |= letter_runs(pattern)
+        for pattern in _EXTRACTOR_PATTERNS:
+            runs |= letter_runs(pattern)
+        self.key = rules.key
+        self._letters = frozenset(r for r in runs if len(r) == 1)
+        self._runs = frozenset(r for r in runs if len(r) > 1)
+        self._longest = max(map(len, self._runs), default=0)
+        self._safe: dict[str, bool] = {}
+
+    def slot_safe(self, word: str) -> bool:
+        """`word` is folded, ASCII letters only."""
+        safe = self._safe.get(word)
+        if safe is None:
+            safe = (
+                word[0] not in self._letters
+                and word[-1] not in self._letters
+                and word not in ee._NON_NAME_LOWER
+                and not any(
+                    word[i:j] in self._runs
+                    for i in range(len(word))
+                    for j in range(i + 2, min(len(word), i + self._longest) + 1)
+                )
+            )
+            if len(self._safe) < 65536:
+                self._safe[word] = safe
+        return safe
+
+
+def template(nt: NormalizedText, vocabulary: _Vocabulary) -> str:
+    """Length-preserving template of `nt.text` with names and digits slotted."""
+    chars = list(_DIGIT_RE.sub("0", nt.text))
+    for word, start, end in nt.tokens:
+        original = nt.text[start:end]
+        if (
+            len(original) > 1
+            and original[0].isupper()
+            and original.isascii()
+            and original.isalpha()
+            and vocabulary.slot_safe(word)
+        ):
+            chars[start:end] = "X" + "x" * (end - start - 1)
+    return "".join(chars)
+
+
+class ParseCache:
+    """
+    LRU cache with TTL from template to (intent, slots).
+
+    `maxsize` 0 disables the cache. Entries are keyed by the rules snapshot
+    key too, so a rules reload never serves results from the old rules.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # (rules key, template) -> entry, least recently used first
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._vocabulary: Optional[_Vocabulary] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _key(self, nt: NormalizedText, rules: RuleSnapshot) -> tuple[str, str]:
+        vocabulary = self._vocabulary
+        if vocabulary is None or vocabulary.key != rules.key:
+            vocabulary = self._vocabulary = _Vocabulary(rules)
+        return rules.key, nt.cached(vocabulary, lambda: template(nt, vocabulary))
+
+    def get(
+        self, nt: NormalizedText, rules: RuleSnapshot
+    ) -> Optional[tuple[str, dict[str, Any]]]:
+        """Return (intent, entities) for `nt` if its template is cached."""
+        if not self.maxsize:
+            return None
+        key = self._key(nt, rules)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            metrics.incr("parse_cache.misses")
+            return None
+        metrics.incr("parse_cache.hits")
+        _, intent, slots = entry
+        return intent, _fill(nt, slots)
+
+    def put(
+        self, nt: NormalizedText, rules: RuleSnapshot, intent: str, fields: tuple[str, ...]
+    ) -> None:
+        """Record the slots for `fields` (an extraction plan) of a rule parse of `nt`."""
+        if not self.maxsize:
+            return
+        key = self._key(nt, rules)
+        slots = _slots(nt, fields)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, intent, slots)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def _slots(nt: NormalizedText, fields: tuple[str, ...]) -> dict[str, Any]:
+    slots: dict[str, Any] = {}
+    for field in fields:
+        if field == "name":
+            slots["name"] = ee.find_name(nt)
+        elif field == "pin":
+            slots["pin"] = ee.find_pin(nt)
+        elif field == "time_range":
+            slots["time_range"] = ee.find_time_range(nt)
+        else:
+            # Mode and permissions come from non-slot words only
+            slots[field] = ee.scan_entities(nt, (field,))[field]
+    return slots
+
+
+def _fill(nt: NormalizedText, slots: dict[str, Any]) -> dict[str, Any]:
+    """Entities for `nt` from cached slots, as the extractors would return them."""
+    text = nt.text
+    entities: dict[str, Any] = {}
+    for field, slot in slots.items():
+        if field == "name":
+            entities["name"] = ee.format_name(text[slot[0]:slot[1]]) if slot else None
+        elif field == "pin":
+            entities["pin"] = text[slot[0]:slot[1]] if slot else None
+        elif field == "time_range":
+            if slot:
+                phrases = (text[slot[0][0]:slot[0][1]], text[slot[1][0]:slot[1][1]])
+                entities["start_time"], entities["end_time"] = ee.resolve_time_range(
+                    phrases, datetime.now()
+                )
+            else:
+                entities["start_time"] = entities["end_time"] = None
+        else:
+            entities[field] = slot
+    return entities
+
+
+# Singleton shared by parse_command
+parse_cache = ParseCache(settings.PARSE_CACHE_SIZE, settings.PARSE_CACHE_TTL)
@@ -1,19 +1,32 @@
+import asyncio
 import logging
 from typing import Any, Optional
 
-from app.nlp.entity_extractor import (
-    extract_mode,
-    extract_name,
-    extract_permissions,
-    extract_pin,
-    extract_time_range,
-)
-from app.nlp.llm_fallback import llm_parse
-from app.nlp.rule_engine import classify_intent
+from app.config import settings
+from app.metrics import metrics
+from app.nlp.entity_extractor import EXTRACTION_PLAN, extract_time_range, scan_entities
+from app.nlp.intent_classifier import classify_local
+from app.nlp.llm_fallback import llm_parse, llm_parse_async
+from app.nlp.normalize import NormalizedText
+from app.nlp.parse_cache import parse_cache
+from app.nlp.rule_engine import RuleSnapshot, classify_intent, correct_spelling, get_rules
+from app.nlp.rule_learner import get_rule_learner
+from app.nlp.semantic_cache import get_semantic_cache
 from app.store import store
 
 logger = logging.getLogger(__name__)
 
+# Arming or disarming on spell-corrected text, or on a semantic cache hit,
+# needs one of these words: a correction can turn a real word into a rule
+# word, a near neighbour of an earlier command may mean something else, and
+# nothing else says the command is about the alarm. Corrected text may have
+# the anchor itself corrected, if only one other word was ("disram the sytem").
+_ANCHORED_INTENTS = frozenset({"arm", "disarm"})
+_ANCHORS = frozenset(
+    {"alarm", "alarma", "alarme", "anlage", "home", "house", "security", "sesame",
+     "sistema", "system", "systeme"}
+)
+
 
 def _build_api_call(intent: str, entities: dict[str, Any]) -> Optional[dict[str, Any]]:
     if intent == "arm":
@@ -48,37 +61,121 @@ def _build_api_call(intent: str, entities: dict[str, Any]) -> Optional[dict[str,
     return None
 
 
-def parse_command(text: str) -> dict[str, Any]:
-    source = "rule"
-    intent = classify_intent(text)
-    entities: dict[str, Any] = {}
+def _extract(nt: NormalizedText, intent: str) -> dict[str, Any]:
+    """Rule-based entity extraction, limited to what the intent needs."""
+    plan = EXTRACTION_PLAN[intent]
+    entities = scan_entities(nt, [f for f in plan if f != "time_range"])
+    if "time_range" in plan:
+        entities["start_time"], entities["end_time"] = extract_time_range(nt)
+    return entities
 
-    if intent is None:
-        # Attempt LLM fallback
-        llm_result = llm_parse(text)
-        if llm_result and llm_result.get("intent"):
-            intent = llm_result["intent"]
-            raw_entities = llm_result.get("entities") or {}
-            # Flatten LLM entities, filter None values
-            entities = {k: v for k, v in raw_entities.items() if v is not None}
-            source = "llm"
-            logger.info("LLM fallback used", extra={"intent": intent, "source": source})
+
+def _parse_rules(
+    nt: NormalizedText, rules: RuleSnapshot
+) -> tuple[Optional[str], dict[str, Any]]:
+    """Rule tier: (intent, entities), or (None, {}) when no rule matches."""
+    cached = parse_cache.get(nt, rules)
+    if cached is not None:
+        intent, entities = cached
     else:
-        # Rule-based entity extraction
-        entities["name"] = extract_name(text)
-        entities["pin"] = extract_pin(text)
-        if intent == "arm":
-            entities["mode"] = extract_mode(text)
-        start, end = extract_time_range(text)
-        if start:
-            entities["start_time"] = start
-        if end:
-            entities["end_time"] = end
-        if intent in ("add_user", "remove_user"):
-            entities["permissions"] = extract_permissions(text)
-        # Remove None values
-        entities = {k: v for k, v in entities.items() if v is not None}
+        intent = classify_intent(nt, rules)
+        if intent is None:
+            return None, {}
+        entities = _extract(nt, intent)
+        parse_cache.put(nt, rules, intent, EXTRACTION_PLAN[intent])
+    # Remove None values
+    return intent, {k: v for k, v in entities.items() if v is not None}
+
+
+def _anchored(nt: NormalizedText, corrected: Optional[NormalizedText] = None) -> bool:
+    """Whether `nt` names the alarm (see _ANCHORS)."""
+    if nt.words & _ANCHORS:
+        return True
+    if corrected is None:
+        return False
+    changed = [
+        new for (old, _, _), (new, _, _) in zip(nt.tokens, corrected.tokens) if old != new
+    ]
+    return len(changed) <= 2 and sum(word in _ANCHORS for word in changed) == 1
+
+
+def _local_intent(nt: NormalizedText) -> tuple[Optional[str], str]:
+    """
+    Tiers after the rules: the local classifier, then the semantic cache
+    of LLM answers. (intent or None, source)
+    """
+    intent = classify_local(nt)
+    if intent is not None:
+        return intent, "classifier"
+    cache = get_semantic_cache()
+    intent = cache.get(nt) if cache is not None else None
+    if intent in _ANCHORED_INTENTS and not _anchored(nt):
+        intent = None
+    return intent, "semantic_cache"
+
+
+def _parse_local(nt: NormalizedText) -> tuple[Optional[str], dict[str, Any], str]:
+    """Every tier before the LLM: (intent, entities, source)."""
+    # One rules snapshot per request, so a concurrent reload cannot change
+    # the rules halfway through
+    rules = get_rules()
+    intent, entities = _parse_rules(nt, rules)
+    if intent is not None:
+        return intent, entities, "rule"
+    # Retry the rules with typos corrected ("disram the sytem")
+    corrected = correct_spelling(nt, rules) if settings.RULES_SPELL_CORRECTION else None
+    if corrected is not None:
+        intent, entities = _parse_rules(corrected, rules)
+        if intent in _ANCHORED_INTENTS and not _anchored(nt, corrected):
+            # A corrected word may have been a real one ("unblock the sink")
+            intent = None
+        if intent is not None:
+            metrics.incr("rules.spell_corrected")
+            return intent, entities, "rule_corrected"
+    intent, source = _local_intent(nt)
+    if intent is None:
+        return None, {}, source
+    # Entities come from the rule extractors. These results are not put in
+    # the parse cache, which is keyed for rule matches.
+    entities = _extract(nt, intent)
+    return intent, {k: v for k, v in entities.items() if v is not None}, source
+
 
+def _remember(
+    nt: NormalizedText, intent: Optional[str], entities: dict[str, Any], replayed: bool
+) -> None:
+    """
+    Feed an LLM answer to the semantic cache, for reworded commands, and to
+    the rule learner, which counts it towards promoting the phrasing. Answers
+    `replayed` from the LLM cache are not counted again.
+    """
+    cache = get_semantic_cache()
+    if intent is not None and cache is not None:
+        cache.put(nt, intent)
+    learner = get_rule_learner()
+    if learner is not None and not replayed:
+        learner.observe(nt, intent, intent is None or _reproducible(nt, intent, entities))
+
+
+def _reproducible(nt: NormalizedText, intent: str, entities: dict[str, Any]) -> bool:
+    """Whether the rule extractors build the same API call from `nt` as the LLM's answer."""
+    extracted = {k: v for k, v in _extract(nt, intent).items() if v is not None}
+    return _build_api_call(intent, extracted) == _build_api_call(intent, entities)
+
+
+def _from_llm(llm_result: Optional[dict[str, Any]]) -> tuple[Optional[str], dict[str, Any]]:
+    if not (llm_result and llm_result.get("intent")):
+        return None, {}
+    intent = llm_result["intent"]
+    raw_entities = llm_result.get("entities") or {}
+    logger.info("LLM fallback used", extra={"intent": intent, "source": "llm"})
+    # Flatten LLM entities, filter None values
+    return intent, {k: v for k, v in raw_entities.items() if v is not None}
+
+
+def _result(
+    text: str, intent: Optional[str], entities: dict[str, Any], source: str
+) -> dict[str, Any]:
     # Log with masked PIN
     log_extra: dict[str, Any] = {"intent": intent, "source": source}
     if "pin" in entities:
@@ -94,3 +191,44 @@ def parse_command(text: str) -> dict[str, Any]:
         "api": api_call,
         "source": source,
     }
+
+
+def parse_command(text: str, timeout: Optional[float] = None) -> dict[str, Any]:
+    """`timeout` bounds the LLM fallback in seconds (default LLM_TIMEOUT)."""
+    # Normalize once; the rule engine, the local tiers and every extractor
+    # share this view
+    nt = NormalizedText(text)
+    intent, entities, source = _parse_local(nt)
+    if intent is not None:
+        return _result(text, intent, entities, source)
+
+    # Attempt LLM fallback
+    llm_result = llm_parse(text, timeout)
+    intent, entities = _from_llm(llm_result)
+    if llm_result is not None:
+        _remember(nt, intent, entities, bool(llm_result.get("cached")))
+    return _result(text, intent, entities, "llm" if intent else "rule")
+
+
+async def parse_command_async(text: str, timeout: Optional[float] = None) -> dict[str, Any]:
+    """
+    parse_command for the event loop. The tiers before the LLM run on a
+    worker thread: spelling correction, the classifier, the semantic cache
+    and dateparser (entity extraction's last resort, slow on first import)
+    are CPU-bound and must not stall the loop. The LLM fallback is awaited,
+    so a slow provider holds a coroutine rather than a worker thread.
+    """
+    nt = NormalizedText(text)
+    intent, entities, source = await asyncio.to_thread(_parse_local, nt)
+    if intent is not None:
+        return _result(text, intent, entities, source)
+
+    llm_result = await llm_parse_async(text, timeout)
+    intent, entities = _from_llm(llm_result)
+    if llm_result is not None:
+        # Persisting writes to disk, and the learner runs the extractors;
+        # keep both off the event loop
+        await asyncio.to_thread(
+            _remember, nt, intent, entities, bool(llm_result.get("cached"))
+        )
+    return _result(text, intent, entities, "llm" if intent else "rule")
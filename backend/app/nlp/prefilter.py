@@ -0,0 +1,250 @@
+"""
+Keyword prefilter for the rule engine.
+
+Most rules cannot match unless some literal word ("sesame", "scharf", "user",
+"pin", ...) is present in the text. The literals each rule requires are
+derived from its parsed regex, so new aliases are indexed automatically.
+One scan over the casefolded text then yields the candidate rules, and only
+those are handed to the regex matcher.
+"""
+import re
+from typing import Iterable, Optional
+
+try:
+    from re import _parser as _sre  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse as _sre  # type: ignore
+
+# Bump when the literal analysis changes so cached trigger sets are rebuilt
+ANALYSIS_VERSION = 1
+
+# Upper bound on how many alternative strings a literal run may expand into
+_MAX_EXACT = 32
+# Character classes up to this size ([eè], ['ʼ]) are expanded into literals
+_MAX_CLASS = 8
+# re.IGNORECASE equates these with "i", but casefold() does not
+_FOLD_FIXES = {0x130: "i", 0x131: "i"}
+# Repeat opcodes (POSSESSIVE_REPEAT exists from Python 3.11)
+_REPEATS = tuple(
+    op for op in (_sre.MAX_REPEAT, _sre.MIN_REPEAT, getattr(_sre, "POSSESSIVE_REPEAT", None)) if op
+)
+
+
+def fold(text: str) -> str:
+    """Casefold `text` so IGNORECASE matches imply literal containment."""
+    return text.translate(_FOLD_FIXES).casefold()
+
+
+# ---------------------------------------------------------------------------
+# Required-literal analysis
+# ---------------------------------------------------------------------------
+
+
+def _exact(op, av) -> Optional[set[str]]:
+    """Finite set of strings a single parsed element matches, if small."""
+    if op is _sre.LITERAL:
+        return {fold(chr(av))}
+    if op is _sre.AT:
+        # Zero-width (\b, \B, ...): adjacent literals stay contiguous
+        return {""}
+    if op is _sre.IN:
+        if len(av) <= _MAX_CLASS and all(o is _sre.LITERAL for o, _ in av):
+            return {fold(chr(a)) for _, a in av}
+        return None
+    if op is _sre.SUBPATTERN:
+        return _exact_seq(av[-1])
+    if op is _sre.BRANCH:
+        out: set[str] = set()
+        for alt in av[1]:
+            strings = _exact_seq(alt)
+            if strings is None:
+                return None
+            out |= strings
+        return out if len(out) <= _MAX_EXACT else None
+    if op in (_sre.MAX_REPEAT, _sre.MIN_REPEAT) and av[0] == 0 and av[1] == 1:
+        strings = _exact_seq(av[2])
+        return strings | {""} if strings is not None else None
+    return None
+
+
+def _exact_seq(items) -> Optional[set[str]]:
+    out = {""}
+    for op, av in items:
+        strings = _exact(op, av)
+        if strings is None:
+            return None
+        out = {a + b for a in out for b in strings}
+        if len(out) > _MAX_EXACT:
+            return None
+    return out
+
+
+def _best(requirements: list[frozenset[str]]) -> Optional[frozenset[str]]:
+    """Prefer the requirement whose shortest literal is longest (fewest false hits)."""
+    if not requirements:
+        return None
+    return max(requirements, key=lambda req: (min(map(len, req)), -len(req)))
+
+
+def _required(items, prefix: frozenset[str] = frozenset([""])) -> Optional[frozenset[str]]:
+    """
+    Literals, at least one of which occurs in every match of `items`.
+
+    `prefix` holds the strings that must immediately precede `items`; it lets
+    a literal run such as "p" be carried into a following branch so that
+    ``p(?:in|asscode)`` yields {"pin", "passcode"} rather than {"p"}.
+    Returns None when no such literal set can be derived.
+    """
+    requirements: list[frozenset[str]] = []
+    run = set(prefix)
+
+    def flush() -> None:
+        if run and "" not in run:
+            requirements.append(frozenset(run))
+
+    for op, av in items:
+        strings = _exact(op, av)
+        if strings is not None:
+            expanded = {a + b for a in run for b in strings}
+            if len(expanded) > _MAX_EXACT:
+                flush()
+                expanded = strings
+            run = expanded
+            continue
+
+        carried = frozenset(run)
+        if op is _sre.SUBPATTERN:
+            req = _required(av[-1], carried)
+        elif op is _sre.BRANCH:
+            alternatives = [_required(alt, carried) for alt in av[1]]
+            if any(alt is None for alt in alternatives):
+                req = None
+            else:
+                req = frozenset().union(*alternatives)
+        elif op in (_sre.MAX_REPEAT, _sre.MIN_REPEAT) and av[0] >= 1:
+            req = _required(av[2], carried)
+        else:
+            req = None
+        flush()
+        if req:
+            requirements.append(req)
+        run = {""}
+
+    flush()
+    return _best(requirements)
+
+
+def required_literals(pattern: re.Pattern) -> Optional[frozenset[str]]:
+    """
+    Return casefolded literals such that every text `pattern` matches
+    contains at least one of them, or None if the pattern has no such set.
+    """
+    literals = _required(_sre.parse(pattern.pattern, pattern.flags))
+    if literals is None:
+        return None
+    # A literal containing another member adds nothing to the check
+    return frozenset(
+        lit for lit in literals if not any(o != lit and o in lit for o in literals)
+    )
+
+
+def _collect_runs(items, runs: set[str], prefix: str = "") -> None:
+    # `prefix` is the literal run just before `items`, carried in the same way
+    # as in _required so that factored alternations (a(?:rm|ctivate)) still
+    # yield whole words
+    run = prefix
+    for op, av in items:
+        if op is _sre.LITERAL and chr(av).isalpha():
+            run += fold(chr(av))
+            continue
+        if op is _sre.IN:
+            runs.update(
+                run + fold(chr(a)) for o, a in av if o is _sre.LITERAL and chr(a).isalpha()
+            )
+        elif op is _sre.SUBPATTERN:
+            _collect_runs(av[-1], runs, run)
+        elif op is _sre.BRANCH:
+            for alt in av[1]:
+                _collect_runs(alt, runs, run)
+        elif op in _REPEATS:
+            _collect_runs(av[2], runs, run)
+        elif op in (_sre.ASSERT, _sre.ASSERT_NOT):
+            _collect_runs(av[1], runs)
+        if run:
+            runs.add(run)
+        run = ""
+    if run:
+        runs.add(run)
+
+
+def letter_runs(pattern: re.Pattern) -> set[str]:
+    """
+    Every maximal run of consecutive literal letters in `pattern`, casefolded.
+
+    Letters in small character classes count as one-letter runs. Unlike
+    `required_literals` this covers optional parts too: it is the set of
+    letters the pattern could ever compare against the text.
+    """
+    runs: set[str] = set()
+    _collect_runs(_sre.parse(pattern.pattern, pattern.flags), runs)
+    return runs
+
+
+# ---------------------------------------------------------------------------
+# Trigger index
+# ---------------------------------------------------------------------------
+
+
+class KeywordIndex:
+    """
+    Maps trigger literals to the rules that need them.
+
+    All literals are compiled into one overlapping lookahead scan, longest
+    literal first. At each offset the scan reports only the longest literal,
+    so every shorter literal it starts with is credited along with it.
+
+    `triggers` may supply precomputed literal sets (one per pattern, e.g. from
+    the on-disk rules cache) to skip the analysis.
+    """
+
+    def __init__(
+        self,
+        patterns: Iterable[re.Pattern],
+        triggers: Optional[list[Optional[frozenset[str]]]] = None,
+    ) -> None:
+        if triggers is None:
+            triggers = [required_literals(pattern) for pattern in patterns]
+        self.triggers: list[Optional[frozenset[str]]] = list(triggers)
+        # Rules without a derivable trigger are always candidates
+        self._always = frozenset(
+            index for index, literals in enumerate(self.triggers) if literals is None
+        )
+
+        by_literal: dict[str, set[int]] = {}
+        for index, literals in enumerate(self.triggers):
+            for literal in literals or ():
+                by_literal.setdefault(literal, set()).add(index)
+
+        ordered = sorted(by_literal, key=lambda lit: (-len(lit), lit))
+        self._scan = (
+            re.compile("(?=(" + "|".join(map(re.escape, ordered)) + "))")
+            if ordered
+            else None
+        )
+        self._fires: dict[str, frozenset[int]] = {
+            literal: frozenset(
+                index
+                for other in ordered
+                if literal.startswith(other)
+                for index in by_literal[other]
+            )
+            for literal in ordered
+        }
+
+    def candidates(self, text: str) -> tuple[int, ...]:
+        """Indices of rules that could match `text`, in priority order."""
+        hits = set(self._always)
+        if self._scan is not None:
+            for m in self._scan.finditer(fold(text)):
+                hits |= self._fires[m.group(1)]
+        return tuple(sorted(hits))
@@ -1,173 +1,406 @@
+import hashlib
+import json
 import logging
+import os
 import re
-from typing import Optional
+import threading
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from app.config import settings
+from app.nlp.normalize import NormalizedText, TextInput, normalize, strip_accents
+from app.nlp.prefilter import ANALYSIS_VERSION, KeywordIndex, letter_runs, required_literals
+from app.nlp.spelling import SpellingIndex
 
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
-# Creative & multilingual aliases — checked BEFORE standard patterns
-# Each entry: (compiled_pattern, intent)
-# These are checked in order; first match wins.
+# Rules file
+# The creative/multilingual aliases, standard intent patterns and the add_user
+# heuristic live in rules.json as one ordered list; first match wins.
+# Priority order: creative aliases, add/remove/list, add_user heuristic,
+# then disarm/arm. Set RULES_PATH to load a different file.
+# Phrasings promoted from LLM answers (see rule_learner.py) are spliced in as
+# the "learned alias" stage, right after the creative aliases.
+# Patterns run against the casefolded, accent-folded text (see normalize.py);
+# accents in a pattern are stripped at compile time so either spelling works.
 # ---------------------------------------------------------------------------
-CREATIVE_ALIASES: list[tuple[re.Pattern, str]] = [
-    # ---- Ali Baba / Sesame ------------------------------------------------
-    # "open sesame" / "sesame open" → disarm (open the door)
-    (re.compile(r"\bopen\s+sesame\b|\bsesame\s+open\b", re.IGNORECASE), "disarm"),
-    # "sesame close" / "close sesame" → arm (seal the cave)
-    (re.compile(r"\bsesame\s+close\b|\bclose\s+sesame\b|\bsesame\s+shut\b", re.IGNORECASE), "arm"),
-
-    # ---- English creative aliases ----------------------------------------
-    (re.compile(r"\ball\s+clear\b|\bstand\s+down\b|\bat\s+ease\b|\bstand\s+easy\b", re.IGNORECASE), "disarm"),
-    (re.compile(r"\bcode\s+red\b|\bred\s+alert\b|\bgo\s+hot\b|\bhigh\s+alert\b|\bgo\s+live\b", re.IGNORECASE), "arm"),
-
-    # ---- Spanish -----------------------------------------------------------
-    # armar/activar el sistema → arm; desarmar/desactivar → disarm
-    (re.compile(r"\b(?:armar?|activ[ao]r?)\s+(?:el\s+)?sistema\b", re.IGNORECASE), "arm"),
-    (re.compile(r"\b(?:desarmar?|desactiv[ao]r?)\s+(?:el\s+)?sistema\b", re.IGNORECASE), "disarm"),
-    # mostrar usuarios → list_users
-    (re.compile(r"\bmostrar?\s+(?:los\s+)?usuarios?\b", re.IGNORECASE), "list_users"),
-
-    # ---- French ------------------------------------------------------------
-    (re.compile(r"\b(?:armer?|activer?)\s+(?:le\s+)?syst[eè]me\b", re.IGNORECASE), "arm"),
-    (re.compile(r"\b(?:d[eé]sarmer?|d[eé]sactiver?)\s+(?:le\s+)?syst[eè]me\b", re.IGNORECASE), "disarm"),
-
-    # ---- German ------------------------------------------------------------
-    # "scharf schalten" / "Anlage scharf" → arm
-    (re.compile(r"\b(?:scharf\s+(?:schalten|machen)|anlage\s+scharf|alarm\s+scharf)\b", re.IGNORECASE), "arm"),
-    # "unscharf schalten" / "Anlage unscharf" → disarm
-    (re.compile(r"\b(?:unscharf\s+(?:schalten|machen)|anlage\s+unscharf|alarm\s+unscharf)\b", re.IGNORECASE), "disarm"),
-
-    # ---- Hebrew (romanized) ------------------------------------------------
-    # "pe'al" = activate, "batel" = cancel
-    (re.compile(r"\bpe[''ʼ]?al\b|\bpa[''ʼ]?al\b", re.IGNORECASE), "arm"),
-    (re.compile(r"\bbatel\b|\bbattel\b", re.IGNORECASE), "disarm"),
-
-    # ---- Arabic (romanized) ------------------------------------------------
-    # "aghliq" / "aghleq" = close/lock → arm; "iftah" / "aftah" = open → disarm
-    (re.compile(r"\b(?:aghliq|aghleq|ughliq)\b", re.IGNORECASE), "arm"),
-    (re.compile(r"\b(?:iftah|aftah|af-tah)\b", re.IGNORECASE), "disarm"),
-
-    # ---- Hindi (romanized) -------------------------------------------------
-    # "band karo" = lock/close it → arm; "kholo" = open → disarm
-    (re.compile(r"\bband\s+karo\b|\bband\s+kar\b|\bband\s+karna\b", re.IGNORECASE), "arm"),
-    (re.compile(r"\bkholo\b|\bkhol\s+do\b", re.IGNORECASE), "disarm"),
-
-    # ---- Japanese (romanized) ----------------------------------------------
-    # "kagi kakete" = lock it; "kagi hazushite" / "akete" = unlock
-    (re.compile(r"\bkagi\s+kakete\b|\brokkushite\b", re.IGNORECASE), "arm"),
-    (re.compile(r"\bakete\b|\bkagi\s+hazushite\b|\bunrokku\b", re.IGNORECASE), "disarm"),
-
-    # ---- Portuguese --------------------------------------------------------
-    (re.compile(r"\b(?:armar?|ativar?)\s+(?:o\s+)?sistema\b", re.IGNORECASE), "arm"),
-    (re.compile(r"\b(?:desarmar?|desativar?)\s+(?:o\s+)?sistema\b", re.IGNORECASE), "disarm"),
-]
+DEFAULT_RULES_PATH = Path(__file__).with_name("rules.json")
+
+INTENTS = ("arm", "disarm", "add_user", "remove_user", "list_users")
+STAGES = ("creative alias", "learned alias", "rule", "heuristic")
+LEARNED_STAGE = "learned alias"
+
+_FLAGS = {
+    "IGNORECASE": re.IGNORECASE,
+    "DOTALL": re.DOTALL,
+    "MULTILINE": re.MULTILINE,
+    "VERBOSE": re.VERBOSE,
+}
+_SCOPED_FLAGS = {re.IGNORECASE: "i", re.MULTILINE: "m", re.DOTALL: "s", re.VERBOSE: "x"}
+
 
 # ---------------------------------------------------------------------------
-# Standard intent patterns — ordered by priority
-# add_user MUST come before arm/disarm to avoid "arm and disarm" misclassification
+# Compiled matcher — the whole rule table evaluated through one combined regex
 # ---------------------------------------------------------------------------
-INTENT_PATTERNS: list[tuple[str, re.Pattern]] = [
-    (
-        "add_user",
-        re.compile(
-            r"add\s+(?:a\s+)?(?:temporary\s+|temp\s+)?user"
-            r"|create\s+(?:a\s+)?(?:temporary\s+)?user"
-            r"|give\s+(?:\w+\s+)?access"
-            r"|set\s*up\s+(?:a\s+)?(?:new\s+)?user"
-            # "arm and disarm" = permission-grant language = add_user context
-            r"|\barm\s+and\s+disarm\b",
-            re.IGNORECASE,
-        ),
-    ),
-    (
-        "remove_user",
-        re.compile(
-            r"(?:remove|delete|revoke)\s+(?:the\s+)?(?:user|access(?:\s+for|\s+of)?)"
-            r"|remove\s+\w+\s+from",
-            re.IGNORECASE,
-        ),
-    ),
-    (
-        "list_users",
-        re.compile(
-            r"(?:show|list|display|get)\s+(?:me\s+)?(?:all\s+)?users?"
-            r"|who\s+(?:has|have)\s+access"
-            r"|show\s+(?:me\s+)?(?:the\s+)?user\s+list"
-            r"|list\s+all\s+users?"
-            r"|all\s+users?",
-            re.IGNORECASE,
-        ),
-    ),
-    (
-        "disarm",
-        re.compile(
-            r"\b(?:disarm|deactivate|disable)\b"
-            r"|turn\s+off\s+(?:the\s+)?(?:alarm|security|system)"
-            r"|shut\s+off\s+(?:the\s+)?(?:alarm|security|system)"
-            r"|unlock\s+(?:the\s+)?(?:system|alarm|security)?",
-            re.IGNORECASE,
-        ),
-    ),
-    (
-        "arm",
-        re.compile(
-            # Negative lookahead prevents "arm and disarm" from matching
-            r"\b(?:arm|activate|enable|lock\s+(?:it\s+)?down)\b(?!\s+and\s+disarm)"
-            r"|turn\s+on\s+(?:the\s+)?(?:alarm|security|system)"
-            r"|start\s+(?:the\s+)?(?:alarm|security|system)"
-            r"|please\s+activate",
-            re.IGNORECASE,
-        ),
-    ),
-]
-
-# Heuristic fallback: text mentions a PIN-like number with passcode/pin language
-# but has no explicit "add user" phrase — e.g. "My mother-in-law ... passcode 1234"
-ADD_USER_HEURISTIC = re.compile(
-    r"\b(?:pin|passcode|pass\s*code|password)\b.{0,60}\b\d{4,6}\b"
-    r"|\b\d{4,6}\b.{0,60}\b(?:pin|passcode|pass\s*code|password)\b",
-    re.IGNORECASE | re.DOTALL,
-)
-
-
-def classify_intent(text: str) -> Optional[str]:
-    if not text or not text.strip():
+
+
+class CompiledMatcher:
+    """
+    Evaluates an ordered rule table through a single combined regex.
+
+    Every rule becomes a named alternative (``r0``, ``r1``, ...) carrying its
+    own flags. A search returns the leftmost hit, with ties at the same offset
+    going to the earlier rule. A higher-priority rule may still match further
+    right, so the search is repeated over the higher-priority part of the
+    candidate set, starting just past the hit, until no earlier rule fires.
+    The result is the same rule a first-match-wins loop of ``re.search``
+    calls over the candidates would pick.
+    """
+
+    # Combined patterns are cached per candidate subset; the set of subsets
+    # seen in practice is small, so the cache is simply dropped when full.
+    _CACHE_SIZE = 512
+
+    def __init__(self, rules: tuple[tuple[str, re.Pattern, str], ...]) -> None:
+        self.rules = rules
+        self._all = tuple(range(len(rules)))
+        self._alternatives = [
+            f"(?P<r{index}>{self._scoped(pattern)})"
+            for index, (_, pattern, _) in enumerate(rules)
+        ]
+        self._combined: dict[tuple[int, ...], re.Pattern] = {}
+
+    @staticmethod
+    def _scoped(pattern: re.Pattern) -> str:
+        flags = pattern.flags & ~re.UNICODE
+        letters = "".join(
+            letter for flag, letter in _SCOPED_FLAGS.items() if flags & flag
+        )
+        if flags & ~sum(_SCOPED_FLAGS):
+            raise ValueError(f"Unsupported regex flags in rule: {pattern.pattern!r}")
+        return f"(?{letters}:{pattern.pattern})" if letters else f"(?:{pattern.pattern})"
+
+    def _compile(self, indices: tuple[int, ...]) -> re.Pattern:
+        combined = self._combined.get(indices)
+        if combined is None:
+            if len(self._combined) >= self._CACHE_SIZE:
+                self._combined.clear()
+            combined = re.compile("|".join(self._alternatives[i] for i in indices))
+            self._combined[indices] = combined
+        return combined
+
+    def subsets(self) -> list[tuple[int, ...]]:
+        """Candidate subsets compiled so far (used to warm a replacement)."""
+        return list(self._combined)
+
+    def warm(self, subsets: Iterable[tuple[int, ...]]) -> None:
+        """Precompile the given candidate subsets, skipping out-of-range ones."""
+        for indices in subsets:
+            if indices and indices[-1] < len(self.rules):
+                self._compile(indices)
+
+    def match(
+        self, text: str, indices: Optional[tuple[int, ...]] = None
+    ) -> Optional[int]:
+        """
+        Return the index of the highest-priority matching rule, or None.
+
+        `indices` restricts the search to those rules (ascending order);
+        by default every rule is considered.
+        """
+        if indices is None:
+            indices = self._all
+        if not indices:
+            return None
+        m = self._compile(indices).search(text)
+        while m is not None:
+            index = int(m.lastgroup[1:])
+            # Rules before `index` cannot match at or left of m.start(), or the
+            # alternation would have picked them; only the tail needs checking.
+            earlier = indices[: indices.index(index)]
+            if not earlier:
+                return index
+            nxt = self._compile(earlier).search(text, m.start() + 1)
+            if nxt is None:
+                return index
+            indices, m = earlier, nxt
         return None
 
-    # Check creative / multilingual aliases first
-    for pattern, intent in CREATIVE_ALIASES:
-        if pattern.search(text):
-            logger.debug(
-                "Intent classified via creative alias",
-                extra={"intent": intent},
-            )
-            return intent
-
-    # Check explicit add_user/remove_user/list_users patterns (before arm/disarm)
-    for intent_name, pattern in INTENT_PATTERNS[:3]:  # add_user, remove_user, list_users
-        if pattern.search(text):
-            logger.debug(
-                "Intent classified via rule",
-                extra={"intent": intent_name},
-            )
-            return intent_name
-
-    # Heuristic: PIN + passcode keyword = add_user (before arm/disarm)
-    # Catches: "father-in-law ... passcode 1234" → add_user intent
-    if ADD_USER_HEURISTIC.search(text):
-        logger.debug(
-            "Intent classified via heuristic",
-            extra={"intent": "add_user"},
+
+# ---------------------------------------------------------------------------
+# Rule snapshots
+# ---------------------------------------------------------------------------
+
+
+class RuleSnapshot:
+    """
+    One compiled version of the rules file.
+
+    Snapshots are never mutated after construction: a reload builds a new one
+    and swaps the module-level reference, so a request that grabbed the old
+    snapshot finishes on it. `version` and `checksum` identify the rules for
+    any cache derived from them.
+    """
+
+    __slots__ = ("version", "checksum", "rules", "matcher", "index", "speller")
+
+    def __init__(
+        self,
+        version: Any,
+        checksum: str,
+        rules: tuple[tuple[str, re.Pattern, str], ...],
+        triggers: Optional[list[Optional[frozenset[str]]]] = None,
+    ) -> None:
+        self.version = version
+        self.checksum = checksum
+        # Each entry: (stage, compiled_pattern, intent), in priority order
+        self.rules = rules
+        self.matcher = CompiledMatcher(rules)
+        self.index = KeywordIndex((pattern for _, pattern, _ in rules), triggers)
+        # Typo correction towards the words the patterns spell out
+        self.speller = SpellingIndex(
+            run for _, pattern, _ in rules for run in letter_runs(pattern)
         )
-        return "add_user"
-
-    # Check remaining patterns (disarm, arm)
-    for intent_name, pattern in INTENT_PATTERNS[3:]:  # disarm, arm
-        if pattern.search(text):
-            logger.debug(
-                "Intent classified via rule",
-                extra={"intent": intent_name},
+
+    @property
+    def key(self) -> str:
+        """Short identifier for cache keys: version plus checksum prefix."""
+        return f"{self.version}:{self.checksum[:12]}"
+
+    def match(self, text: TextInput) -> Optional[tuple[str, str]]:
+        """Return (stage, intent) of the first matching rule, or None."""
+        nt = normalize(text)
+        # Only rules whose trigger literals occur in the text can match; with
+        # no candidates the text goes straight to the fallback tiers.
+        candidates = nt.cached(self.index, lambda: self.index.candidates(nt.folded))
+        index = self.matcher.match(nt.folded, candidates)
+        if index is None:
+            return None
+        stage, _, intent = self.rules[index]
+        return stage, intent
+
+
+def _compile_entries(entries: list[Any], first: int = 0) -> list[tuple[str, re.Pattern, str]]:
+    compiled: list[tuple[str, re.Pattern, str]] = []
+    for position, entry in enumerate(entries, first):
+        stage = entry.get("stage", "rule")
+        intent = entry.get("intent")
+        if stage not in STAGES:
+            raise ValueError(f"rule {position}: unknown stage {stage!r}")
+        if intent not in INTENTS:
+            raise ValueError(f"rule {position}: unknown intent {intent!r}")
+        flags = 0
+        for name in entry.get("flags", ["IGNORECASE"]):
+            if name not in _FLAGS:
+                raise ValueError(f"rule {position}: unknown flag {name!r}")
+            flags |= _FLAGS[name]
+        try:
+            pattern = re.compile(strip_accents(entry["pattern"]), flags)
+        except (KeyError, TypeError, re.error) as exc:
+            raise ValueError(f"rule {position}: invalid pattern: {exc}") from exc
+        compiled.append((stage, pattern, intent))
+    return compiled
+
+
+def compile_rules(
+    data: dict[str, Any],
+    checksum: str = "",
+    triggers: Optional[list[Optional[frozenset[str]]]] = None,
+    learned: Iterable[dict[str, Any]] = (),
+) -> RuleSnapshot:
+    """
+    Validate a parsed rules document and compile it into a snapshot.
+
+    `learned` entries (rules.json format) go right after the file's last
+    creative alias. `triggers` covers the file's rules only; the checksum of
+    a snapshot with learned entries also covers those.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+        raise ValueError("rules file must be an object with a 'rules' list")
+
+    compiled = _compile_entries(data["rules"])
+    if triggers is not None and len(triggers) != len(compiled):
+        triggers = None
+
+    learned = list(learned)
+    if learned:
+        extra = _compile_entries(learned, len(compiled))
+        at = max(
+            (i + 1 for i, (stage, _, _) in enumerate(compiled) if stage == "creative alias"),
+            default=0,
+        )
+        compiled[at:at] = extra
+        if triggers is not None:
+            triggers = (
+                triggers[:at]
+                + [required_literals(pattern) for _, pattern, _ in extra]
+                + triggers[at:]
             )
-            return intent_name
+        digest = json.dumps(learned, sort_keys=True, ensure_ascii=False)
+        checksum = hashlib.sha256(f"{checksum}:{digest}".encode("utf-8")).hexdigest()
+    return RuleSnapshot(data.get("version"), checksum, tuple(compiled), triggers)
+
+
+# ---------------------------------------------------------------------------
+# Loading, on-disk trigger cache and hot reload
+# Regex objects cannot be persisted (pickling recompiles them), so the disk
+# cache holds the derived prefilter triggers, keyed by the file checksum.
+# ---------------------------------------------------------------------------
+
+
+def _read_trigger_cache(checksum: str) -> Optional[list[Optional[frozenset[str]]]]:
+    path = settings.RULES_CACHE_PATH
+    if not path:
+        return None
+    try:
+        with open(path, encoding="utf-8") as fh:
+            cached = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if cached.get("checksum") != checksum or cached.get("analysis") != ANALYSIS_VERSION:
+        return None
+    return [frozenset(t) if t is not None else None for t in cached["triggers"]]
+
+
+def _write_trigger_cache(checksum: str, snapshot: RuleSnapshot) -> None:
+    path = settings.RULES_CACHE_PATH
+    if not path:
+        return
+    payload = {
+        "checksum": checksum,
+        "analysis": ANALYSIS_VERSION,
+        # Learned entries are not part of the file the checksum identifies
+        "triggers": [
+            sorted(t) if t is not None else None
+            for (stage, _, _), t in zip(snapshot.rules, snapshot.index.triggers)
+            if stage != LEARNED_STAGE
+        ],
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as exc:
+        logger.warning("Could not write rules cache %s: %s", path, exc)
+
+
+class _RulesFile:
+    """A parsed rules file and its prefilter triggers, to rebuild snapshots from."""
+
+    __slots__ = ("data", "checksum", "triggers")
+
+    def __init__(
+        self,
+        data: dict[str, Any],
+        checksum: str,
+        triggers: Optional[list[Optional[frozenset[str]]]],
+    ) -> None:
+        self.data = data
+        self.checksum = checksum
+        self.triggers = triggers
+
+
+def _read_rules(path: Optional[str] = None) -> _RulesFile:
+    path = path or settings.RULES_PATH or str(DEFAULT_RULES_PATH)
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    checksum = hashlib.sha256(raw).hexdigest()
+    return _RulesFile(json.loads(raw.decode("utf-8")), checksum, _read_trigger_cache(checksum))
+
+
+def _build(source: _RulesFile, learned: Iterable[dict[str, Any]]) -> RuleSnapshot:
+    snapshot = compile_rules(source.data, source.checksum, source.triggers, learned)
+    if source.triggers is None:
+        _write_trigger_cache(source.checksum, snapshot)
+        # The file's own triggers, for the next rebuild
+        source.triggers = [
+            t for (stage, _, _), t in zip(snapshot.rules, snapshot.index.triggers)
+            if stage != LEARNED_STAGE
+        ]
+    return snapshot
+
+
+def load_rules(path: Optional[str] = None) -> RuleSnapshot:
+    """Read, validate and compile a rules file (default: RULES_PATH or bundled)."""
+    return _build(_read_rules(path), _learned)
+
+
+# Learned alias entries, installed by set_learned_rules(). _learned, _file
+# and _snapshot are only assigned under _reload_lock.
+_learned: tuple[dict[str, Any], ...] = ()
+# The rules file the active snapshot was built from
+_file: _RulesFile = _read_rules()
+_snapshot: RuleSnapshot = _build(_file, _learned)
+_reload_lock = threading.Lock()
+
+
+def get_rules() -> RuleSnapshot:
+    """Return the active rules snapshot. Hold on to it for a whole request."""
+    return _snapshot
+
+
+def reload_rules(path: Optional[str] = None) -> RuleSnapshot:
+    """
+    Build a new snapshot from disk and make it the active one.
+
+    Compilation happens before the swap, off the request path; requests never
+    take `_reload_lock`, they just read whichever snapshot is current. On any
+    error the active snapshot is left untouched and the error propagates.
+    """
+    global _file
+    with _reload_lock:
+        source = _read_rules(path)
+        snapshot = _swap(_build(source, _learned))
+        _file = source
+    logger.info("Rules reloaded: version=%s rules=%d", snapshot.version, len(snapshot.rules))
+    return snapshot
+
+
+def set_learned_rules(entries: Iterable[dict[str, Any]]) -> RuleSnapshot:
+    """
+    Replace the learned alias entries and rebuild the active snapshot from
+    the rules file it was built from (the file is not read again).
+    """
+    global _learned
+    with _reload_lock:
+        learned = tuple(entries)
+        snapshot = _swap(_build(_file, learned))
+        _learned = learned
+    return snapshot
+
+
+def _swap(snapshot: RuleSnapshot) -> RuleSnapshot:
+    # Callers hold _reload_lock
+    global _snapshot
+    # Precompile the candidate subsets traffic has been hitting
+    snapshot.matcher.warm(_snapshot.matcher.subsets())
+    _snapshot = snapshot
+    return snapshot
+
+
+def correct_spelling(
+    text: TextInput, rules: Optional[RuleSnapshot] = None
+) -> Optional[NormalizedText]:
+    """
+    `text` with misspelt rule words corrected ("disram the sytem" ->
+    "disarm the system"), or None if no word needed correcting.
+    """
+    return (rules or _snapshot).speller.correct(normalize(text))
+
+
+def classify_intent(
+    text: TextInput, rules: Optional[RuleSnapshot] = None
+) -> Optional[str]:
+    nt = normalize(text)
+    if not nt.text.strip():
+        return None
+
+    hit = (rules or _snapshot).match(nt)
+    if hit is None:
+        return None
 
-    return None
+    stage, intent = hit
+    logger.debug("Intent classified via %s", stage, extra={"intent": intent})
+    return intent
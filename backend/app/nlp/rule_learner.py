@@ -0,0 +1,316 @@
+"""
+Promotion of recurring LLM phrasings into learned rules.
+
+Every command the LLM fallback answers is reduced to a phrase template: its
+folded words, with any word containing a digit (a PIN, a time) replaced by a
+placeholder. The learner counts the intents the LLM gave each template. Once
+a template has been answered LEARNED_RULES_MIN_COUNT times and one intent
+accounts for at least LEARNED_RULES_MIN_AGREEMENT of the answers, it is
+promoted: a pattern matching that whole command joins the "learned alias"
+stage of the rule engine, right after the creative aliases, and the next
+command phrased that way is a rule match. Answers without an intent count
+against agreement, so a phrasing the LLM is unsure about is not promoted.
+So do answers whose API call the rule extractors cannot rebuild from the
+command ("let Bob in with code 1234" as add_user, where no extractor finds
+the name): a rule match would run a different call than the LLM asked for.
+Only fresh answers are counted, never replays from the LLM cache.
+
+Promoted entries are reviewed, exported in rules.json format and revoked
+through /admin/learned-rules. A revoked template stays recorded and is never
+promoted again. With LEARNED_RULES_PATH set, the counts and entries are kept
+in a JSON file and the learned entries are installed on start. The file is
+written on every promotion and revocation; counts alone are flushed at most
+every LEARNED_RULES_FLUSH_SECONDS, and on shutdown. Templates never hold a
+PIN; they do hold the other words, names included.
+
+Counts, entries and the rules they install live in one process. With
+several uvicorn workers a revocation would reach one of them, and each
+would overwrite the others' file, so the learner refuses to start then
+(see check_workers).
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from app.config import settings
+from app.metrics import metrics
+from app.nlp.normalize import NormalizedText
+from app.nlp.rule_engine import LEARNED_STAGE, set_learned_rules
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = "<num>"
+# Counted in place of an intent when the LLM recognized none, and when the
+# rule extractors could not rebuild its API call. Never promoted.
+_NO_INTENT = "none"
+_UNREPRODUCED = "unreproduced"
+
+
+def phrase_template(nt: NormalizedText) -> str:
+    """Folded words of `nt`, with words holding digits as a placeholder."""
+    return " ".join(
+        _NUMBER if any(c.isdigit() for c in token) else token for token, _, _ in nt.tokens
+    )
+
+
+def template_pattern(template: str) -> str:
+    """Regex matching a whole command with `template`'s words."""
+    words = [r"\w*\d\w*" if word == _NUMBER else re.escape(word) for word in template.split()]
+    return r"^\W*" + r"\W+".join(words) + r"\W*$"
+
+
+def _entry_id(template: str) -> str:
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:12]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class RuleLearner:
+    def __init__(
+        self,
+        path: str = "",
+        min_count: int = 5,
+        min_agreement: float = 0.9,
+        max_candidates: int = 1000,
+        flush_seconds: float = 60.0,
+    ) -> None:
+        self.path = path
+        self.min_count = min_count
+        self.min_agreement = min_agreement
+        self.max_candidates = max_candidates
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        # Serializes rule engine installs, which happen outside _lock
+        self._install_lock = threading.Lock()
+        # Serializes file writes, which happen outside _lock
+        self._save_lock = threading.Lock()
+        # Counts changed since the file was last written
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        # Payloads are numbered so an older one never overwrites a newer one
+        self._generation = 0
+        self._written = 0
+        # template -> {intent: answers}, least recently seen first
+        self._candidates: OrderedDict[str, dict[str, int]] = OrderedDict()
+        # id -> promoted entry, revoked ones included
+        self._entries: dict[str, dict[str, Any]] = {}
+        if path:
+            self._load()
+
+    def observe(
+        self, nt: NormalizedText, intent: Optional[str], reproducible: bool = True
+    ) -> Optional[dict[str, Any]]:
+        """
+        Count the LLM's answer for `nt`; the new entry if this promoted it.
+        `reproducible`: the rule extractors rebuild the answer's API call.
+        """
+        template = phrase_template(nt)
+        if not template:
+            return None
+        with self._lock:
+            if _entry_id(template) in self._entries:
+                return None
+            counts = self._candidates.pop(template, {})
+            key = (intent if reproducible else _UNREPRODUCED) if intent else _NO_INTENT
+            counts[key] = counts.get(key, 0) + 1
+            self._candidates[template] = counts
+            while len(self._candidates) > self.max_candidates:
+                self._candidates.popitem(last=False)
+            entry = self._promote(template, counts)
+            self._dirty = True
+            due = entry is not None or time.monotonic() - self._saved_at >= self.flush_seconds
+            payload = self._payload() if due else None
+        if entry is not None:
+            self._install()
+        if payload is not None:
+            self._save(payload)
+        if entry is not None:
+            metrics.incr("rules.learned")
+            logger.info(
+                "Phrasing promoted to learned rule %s", entry["id"], extra={"intent": entry["intent"]}
+            )
+        return entry
+
+    def entries(self) -> list[dict[str, Any]]:
+        """Every promoted entry, revoked ones included, oldest first."""
+        with self._lock:
+            return [dict(entry) for entry in self._entries.values()]
+
+    def rules(self) -> list[dict[str, Any]]:
+        """Active entries as rules.json rules."""
+        with self._lock:
+            return self._rules()
+
+    def export(self) -> dict[str, Any]:
+        """Active entries as a rules.json document."""
+        return {"version": "learned", "rules": self.rules()}
+
+    def revoke(self, entry_id: str) -> Optional[dict[str, Any]]:
+        """Withdraw an entry from the rule engine; None if there is no such entry."""
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return None
+            revoked = not entry["revoked"]
+            if revoked:
+                entry["revoked"] = True
+                entry["revoked_at"] = _now()
+            payload = self._payload() if revoked else None
+            entry = dict(entry)
+        if revoked:
+            self._install()
+        if payload is not None:
+            self._save(payload)
+        return entry
+
+    def flush(self) -> None:
+        """Write counts not yet saved (on shutdown)."""
+        with self._lock:
+            payload = self._payload() if self._dirty else None
+        if payload is not None:
+            self._save(payload)
+
+    def candidate_count(self) -> int:
+        return len(self._candidates)
+
+    def _promote(self, template: str, counts: dict[str, int]) -> Optional[dict[str, Any]]:
+        total = sum(counts.values())
+        intent, top = max(counts.items(), key=lambda item: item[1])
+        if (
+            total < self.min_count
+            or intent in (_NO_INTENT, _UNREPRODUCED)
+            or top / total < self.min_agreement
+        ):
+            return None
+        del self._candidates[template]
+        entry = {
+            "id": _entry_id(template),
+            "template": template,
+            "intent": intent,
+            "pattern": template_pattern(template),
+            "count": total,
+            "agreement": round(top / total, 3),
+            "promoted_at": _now(),
+            "revoked": False,
+        }
+        self._entries[entry["id"]] = entry
+        return entry
+
+    def _rules(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "stage": LEARNED_STAGE,
+                "intent": entry["intent"],
+                "pattern": entry["pattern"],
+                "note": f"learned {entry['id']}: {entry['template']}",
+            }
+            for entry in self._entries.values()
+            if not entry["revoked"]
+        ]
+
+    def _install(self) -> None:
+        # Called without _lock: compiling the rules takes a while. Each
+        # install reads the entries current when it runs, so whichever runs
+        # last leaves the latest ones in the rule engine.
+        with self._install_lock:
+            with self._lock:
+                rules = self._rules()
+            try:
+                set_learned_rules(rules)
+            except ValueError as exc:
+                logger.warning("Could not install learned rules: %s", exc)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            logger.warning("Could not read learned rules %s: %s", self.path, exc)
+            return
+        self._candidates.update(data.get("candidates", {}))
+        self._entries = {entry["id"]: entry for entry in data.get("entries", [])}
+        logger.info("Learned rules loaded", extra={"source": self.path})
+
+    def _payload(self) -> Optional[tuple[int, str]]:
+        # Callers hold _lock; the file itself is written after releasing it
+        if not self.path:
+            return None
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._generation += 1
+        return self._generation, json.dumps(
+            {"candidates": self._candidates, "entries": list(self._entries.values())},
+            ensure_ascii=False,
+        )
+
+    def _save(self, payload: tuple[int, str]) -> None:
+        generation, text = payload
+        directory = os.path.dirname(self.path)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with self._save_lock:
+            if generation < self._written:
+                return
+            self._written = generation
+            try:
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    fh.write(text)
+                os.replace(tmp, self.path)
+            except OSError as exc:
+                logger.warning("Could not write learned rules %s: %s", self.path, exc)
+
+
+_learner: Optional[RuleLearner] = None
+_learner_lock = threading.Lock()
+
+
+def get_rule_learner() -> Optional[RuleLearner]:
+    """
+    The shared learner, or None when LEARNED_RULES_ENABLED is off. Entries
+    loaded from LEARNED_RULES_PATH are installed in the rule engine.
+    """
+    global _learner
+    if not settings.LEARNED_RULES_ENABLED:
+        return None
+    with _learner_lock:
+        if _learner is None or _learner.path != settings.LEARNED_RULES_PATH:
+            previous = _learner
+            _learner = RuleLearner(
+                settings.LEARNED_RULES_PATH,
+                settings.LEARNED_RULES_MIN_COUNT,
+                settings.LEARNED_RULES_MIN_AGREEMENT,
+                settings.LEARNED_RULES_MAX_CANDIDATES,
+                settings.LEARNED_RULES_FLUSH_SECONDS,
+            )
+            # Swap in this file's entries (or drop the previous file's)
+            if previous is not None or _learner.rules():
+                _learner._install()
+        return _learner
+
+
+def check_workers() -> None:
+    """Refuse LEARNED_RULES_ENABLED with WEB_CONCURRENCY > 1 (learned rules are per process)."""
+    if settings.LEARNED_RULES_ENABLED and settings.WEB_CONCURRENCY > 1:
+        raise ValueError(
+            f"WEB_CONCURRENCY={settings.WEB_CONCURRENCY} needs LEARNED_RULES_ENABLED=false: "
+            "learned rules, their counts and revocations are kept per worker"
+        )
+
+
+def reset_rule_learner() -> None:
+    """Drop the shared learner without touching its file (used by tests)."""
+    global _learner
+    with _learner_lock:
+        _learner = None
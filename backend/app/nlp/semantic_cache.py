@@ -0,0 +1,246 @@
+"""
+Nearest-neighbour cache of intents the LLM fallback returned.
+
+Many unrecognized commands are rewordings of earlier ones. Each command the
+LLM classified is indexed as a set of hashed features: the words and word
+bigrams left once filler words are dropped, with digits and capitalized
+names replaced by placeholders. A new command whose cosine similarity to an
+indexed one reaches SEMANTIC_CACHE_THRESHOLD reuses that intent, and its
+entities are extracted by the rule extractors as for a rule match. If the
+top SEMANTIC_CACHE_TOP_K neighbours above the threshold disagree on the
+intent, it is a miss.
+
+Only content words count, so "could you make the alarm go on please" finds
+"make the alarm go on", while "make the alarm go off" (one content word of
+four differs) stays well below the default threshold.
+
+The index holds at most SEMANTIC_CACHE_SIZE commands, evicting the least
+recently used. With SEMANTIC_CACHE_PATH set it is persisted in SQLite by
+put() and reloaded on start; get() only reads memory. Only the feature hashes and the intent are written: no
+command text, names or PINs.
+"""
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import settings
+from app.metrics import metrics
+from app.nlp.normalize import NormalizedText
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS semantic_cache (
+    key      TEXT PRIMARY KEY,
+    features TEXT NOT NULL,     -- JSON list of feature hashes
+    intent   TEXT NOT NULL,
+    used_at  REAL NOT NULL
+)
+"""
+
+# Words that do not change what a command asks for. Negations ("don", "t",
+# "not") and particles such as "on", "off", "in" and "out" are content.
+_FILLER = frozenset(
+    "a an the please kindly could can would will you me my i we to for just hey hi "
+    "ok okay now right away d ll m re s ve".split()
+)
+
+
+def features(nt: NormalizedText) -> frozenset[int]:
+    """Hashed content words and bigrams, with numbers and names as placeholders."""
+    words = []
+    for index, (token, start, end) in enumerate(nt.tokens):
+        if any(c.isdigit() for c in token):
+            words.append("<num>")
+        elif token in _FILLER:
+            continue
+        elif index and nt.text[start].isupper():
+            words.append("<name>")
+        else:
+            words.append(token)
+    grams = words + [a + " " + b for a, b in zip(words, words[1:])]
+    return frozenset(zlib.crc32(gram.encode("utf-8")) for gram in grams)
+
+
+def _key(vector: frozenset[int]) -> str:
+    return hashlib.sha256(json.dumps(sorted(vector)).encode("utf-8")).hexdigest()
+
+
+class SemanticCache:
+    def __init__(self, max_entries: int, threshold: float, top_k: int, path: str = "") -> None:
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.top_k = top_k
+        self.path = path
+        self._lock = threading.Lock()
+        # key -> (features, intent), least recently used first
+        self._entries: OrderedDict[str, tuple[frozenset[int], str]] = OrderedDict()
+        # feature -> keys of the entries that have it
+        self._postings: dict[int, set[str]] = {}
+        # Keys hit since the last write; their recency is persisted with it,
+        # so a lookup never waits on the disk
+        self._touched: set[str] = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, nt: NormalizedText) -> Optional[str]:
+        """Intent of the nearest indexed command, or None."""
+        vector = features(nt)
+        if not vector:
+            return None
+        with self._lock:
+            shared: dict[str, int] = {}
+            for feature in vector:
+                for key in self._postings.get(feature, ()):
+                    shared[key] = shared.get(key, 0) + 1
+            scored = (
+                (count / math.sqrt(len(vector) * len(self._entries[key][0])), key)
+                for key, count in shared.items()
+            )
+            neighbours = [
+                key for score, key in heapq.nlargest(self.top_k, scored)
+                if score >= self.threshold
+            ]
+            intents = {self._entries[key][1] for key in neighbours}
+            if len(intents) != 1:
+                metrics.incr("semantic_cache.misses")
+                return None
+            self._entries.move_to_end(neighbours[0])
+            self._touched.add(neighbours[0])
+        metrics.incr("semantic_cache.hits")
+        return intents.pop()
+
+    def put(self, nt: NormalizedText, intent: str) -> None:
+        """Index a command the LLM classified as `intent`."""
+        vector = features(nt)
+        if not vector:
+            return
+        key = _key(vector)
+        with self._lock:
+            self._insert(key, vector, intent)
+            evicted = self._evict()
+            if not self.path:
+                return
+            now = time.time()
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO semantic_cache (key, features, intent, used_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(sorted(vector)), intent, now),
+            )
+            conn.executemany(
+                "DELETE FROM semantic_cache WHERE key = ?", [(old,) for old in evicted]
+            )
+            self._flush_touched(conn, now)
+            conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._touched.clear()
+            if self.path:
+                conn = self._connect()
+                conn.execute("DELETE FROM semantic_cache")
+                conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._flush_touched(self._conn, time.time())
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def _insert(self, key: str, vector: frozenset[int], intent: str) -> None:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        for feature in vector:
+            self._postings.setdefault(feature, set()).add(key)
+        self._entries[key] = (vector, intent)
+
+    def _evict(self) -> list[str]:
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            key, (vector, _) = self._entries.popitem(last=False)
+            for feature in vector:
+                keys = self._postings[feature]
+                keys.discard(key)
+                if not keys:
+                    del self._postings[feature]
+            evicted.append(key)
+        return evicted
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _load(self) -> None:
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT key, features, intent FROM semantic_cache "
+                "ORDER BY used_at DESC LIMIT ?",
+                (self.max_entries,),
+            ).fetchall()
+            for key, stored, intent in reversed(rows):
+                self._insert(key, frozenset(json.loads(stored)), intent)
+        logger.info("Semantic cache loaded", extra={"source": self.path})
+
+    def _flush_touched(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.executemany(
+            "UPDATE semantic_cache SET used_at = ? WHERE key = ?",
+            [(now, key) for key in self._touched if key in self._entries],
+        )
+        self._touched.clear()
+
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """The shared index, or None when SEMANTIC_CACHE_SIZE is 0."""
+    global _cache
+    if settings.SEMANTIC_CACHE_SIZE <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != settings.SEMANTIC_CACHE_PATH:
+            if _cache is not None:
+                _cache.close()
+            _cache = SemanticCache(
+                settings.SEMANTIC_CACHE_SIZE,
+                settings.SEMANTIC_CACHE_THRESHOLD,
+                settings.SEMANTIC_CACHE_TOP_K,
+                settings.SEMANTIC_CACHE_PATH,
+            )
+        return _cache
+
+
+def reset_semantic_cache() -> None:
+    """Drop the shared index without touching its file (used by tests)."""
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+        _cache = None
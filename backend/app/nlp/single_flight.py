@@ -0,0 +1,86 @@
+"""
+Single-flight call coalescing.
+
+Concurrent calls with the same key share one execution: the first caller
+starts it, later callers wait for its result instead of starting their own.
+Each caller waits with its own timeout; a caller giving up does not cancel
+the shared call, which still completes for everyone else.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from app.metrics import metrics
+
+
+class SingleFlight:
+    """Coalescing for threads (sync code paths)."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Return fn()'s result, sharing a call already in flight for `key`.
+
+        Waiters raise concurrent.futures.TimeoutError after `timeout` seconds.
+        The caller that starts the call runs it in its own thread.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            metrics.incr(f"{self.name}.coalesced")
+            return future.result(timeout)
+
+        try:
+            future.set_result(fn())
+        except BaseException as exc:
+            future.set_exception(exc)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+
+class AsyncSingleFlight:
+    """Coalescing for coroutines on an event loop."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Await fn()'s result, sharing a call already in flight for `key`.
+
+        Raises asyncio.TimeoutError after `timeout` seconds for this caller
+        only; the shared task keeps running.
+        """
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        if task is None or task.get_loop() is not loop:
+            task = loop.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            metrics.incr(f"{self.name}.coalesced")
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every waiter has given up
+            task.exception()
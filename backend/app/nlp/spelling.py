@@ -0,0 +1,171 @@
+"""
+Typo correction against the rule vocabulary (symmetric delete, SymSpell).
+
+Every vocabulary word is indexed under each string obtained by deleting up
+to two of its letters. A misspelt token is looked up under its own deletes:
+any word sharing one is within a couple of edits, and is confirmed with an
+exact (optimal string alignment) distance. A lookup costs a few dozen dict
+probes whatever the vocabulary size.
+
+The vocabulary is only the rules' own literals, so a real English word one
+edit from a rule word ("remote" / "remove", "look" / "lock") would be
+"corrected" too. Corrections are therefore kept conservative:
+
+- the first letter must match, and capitalized words after the first
+  (names) are left alone;
+- a word is not cut back to a vocabulary word it starts with ("arms",
+  "army" stay as they are: the rules chose not to match them);
+- words of up to 4 letters only accept a swap of two adjacent letters
+  ("teh" -> "the", "opne" -> "open");
+- one edit for longer words, but a substituted letter only from 8 letters
+  up; two edits from 9 letters up;
+- a tie between vocabulary words is not corrected;
+- common English words within that reach of a rule word ("unblock" /
+  "unlock", "erase" / "ease", "form" / "from") are never corrected.
+"""
+from typing import Iterable, Optional
+
+from app.nlp.normalize import NormalizedText
+
+_MAX_DISTANCE = 2
+_MIN_LENGTH = 3
+# Words longer than this are not looked up (bounds the deletes generated)
+_MAX_LENGTH = 24
+_MEMO_SIZE = 4096
+
+# Dictionary words the rules below would otherwise correct to a rule word.
+# Found by running a word list through SpellingIndex(rule vocabulary); redo
+# that after adding rule words.
+_REAL_WORDS = frozenset(
+    {
+        "activator", "aroma", "battle", "bland", "brand", "coed", "crate",
+        "cremate", "deceptive", "deductive", "defective", "deplete", "detective",
+        "directive", "disarmer", "drown", "erase", "form", "halve", "heave",
+        "scarf", "shout", "shunt", "strand", "temporally", "temporarily",
+        "unblock", "usher",
+    }
+)
+
+
+def _deletes(word: str, distance: int) -> set[str]:
+    out = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        out |= frontier
+    return out
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Optimal string alignment distance (Levenshtein plus adjacent swaps)."""
+    previous2: list[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[len(b)]
+
+
+def _one_edit(a: str, b: str) -> bool:
+    """Whether `a` and `b` (a != b) are one insertion, deletion, substitution or swap apart."""
+    if len(a) < len(b):
+        a, b = b, a
+    i = 0
+    while i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) != len(b):
+        return len(a) == len(b) + 1 and a[i + 1:] == b[i:]
+    if a[i + 1:] == b[i + 1:]:
+        return True
+    return a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+
+
+def _allowed(word: str, candidate: str, distance: int) -> bool:
+    if word[0] != candidate[0] or word.startswith(candidate):
+        return False
+    if len(word) <= 4:
+        return distance == 1 and sorted(word) == sorted(candidate)
+    if distance == 2:
+        return len(word) >= 9
+    if len(word) == len(candidate) and sorted(word) != sorted(candidate):
+        # A substitution
+        return len(word) >= 8
+    return True
+
+
+class SpellingIndex:
+    def __init__(self, vocabulary: Iterable[str]) -> None:
+        self.vocabulary = frozenset(
+            word for word in vocabulary if len(word) >= _MIN_LENGTH and word.isalpha()
+        )
+        self._index: dict[str, list[str]] = {}
+        for word in sorted(self.vocabulary):
+            for deleted in _deletes(word, _MAX_DISTANCE):
+                self._index.setdefault(deleted, []).append(word)
+        # Unmatched commands repeat their words; the memo is simply dropped
+        # when full
+        self._memo: dict[str, Optional[str]] = {}
+
+    def correct_word(self, word: str) -> Optional[str]:
+        """The vocabulary word `word` is a typo of, or None."""
+        try:
+            return self._memo[word]
+        except KeyError:
+            pass
+        if len(self._memo) >= _MEMO_SIZE:
+            self._memo.clear()
+        corrected = self._memo[word] = self._lookup(word)
+        return corrected
+
+    def _lookup(self, word: str) -> Optional[str]:
+        if (
+            word in self.vocabulary
+            or word in _REAL_WORDS
+            or not _MIN_LENGTH <= len(word) <= _MAX_LENGTH
+            or not word.isalpha()
+        ):
+            return None
+        # Two edits are only accepted from 9 letters up (see _allowed)
+        reach = _MAX_DISTANCE if len(word) >= 9 else 1
+        candidates = {
+            candidate
+            for deleted in _deletes(word, reach)
+            for candidate in self._index.get(deleted, ())
+        }
+        best: list[str] = []
+        best_distance = _MAX_DISTANCE + 1
+        for candidate in candidates:
+            if candidate[0] != word[0] or abs(len(candidate) - len(word)) > reach:
+                continue
+            if reach == 1:
+                if not _one_edit(word, candidate):
+                    continue
+                distance = 1
+            else:
+                distance = edit_distance(word, candidate)
+            if distance > best_distance or not _allowed(word, candidate, distance):
+                continue
+            if distance < best_distance:
+                best, best_distance = [], distance
+            best.append(candidate)
+        return best[0] if len(best) == 1 else None
+
+    def correct(self, nt: NormalizedText) -> Optional[NormalizedText]:
+        """`nt` with misspelt words replaced, or None if nothing changed."""
+        parts: list[str] = []
+        end = 0
+        for index, (token, start, stop) in enumerate(nt.tokens):
+            if index and nt.text[start].isupper():
+                continue
+            corrected = self.correct_word(token)
+            if corrected is not None:
+                parts += [nt.text[end:start], corrected]
+                end = stop
+        if not parts:
+            return None
+        return NormalizedText("".join(parts) + nt.text[end:])
@@ -0,0 +1,180 @@
+"""
+Deterministic parser for the time expressions used in temporary-user commands.
+
+Handles the phrases seen in practice without dateparser:
+
+    today 5pm / 5pm today       tomorrow at 9 / tomorrow 9:30
+    Sunday 10am / next fri 8pm  noon / midnight / 17:00
+    in 3 hours / in a day       now
+    2026-10-20 / 2026-10-20T17:00[+02:00]
+
+Anything else goes to one shared, English-only dateparser instance. Results
+are memoized per phrase and minute, and relative phrases resolve against the
+start of that minute, so every call within the minute gets the same answer.
+
+Like dateparser, results are naive local datetimes (ISO input keeps its
+offset). Named weekdays resolve to the next occurrence; a bare day keeps the
+current time for today/tomorrow and starts at midnight for a weekday.
+"""
+import logging
+import re
+import threading
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_WEEKDAYS = {
+    "monday": 0, "mon": 0,
+    "tuesday": 1, "tues": 1, "tue": 1,
+    "wednesday": 2, "wed": 2,
+    "thursday": 3, "thurs": 3, "thur": 3, "thu": 3,
+    "friday": 4, "fri": 4,
+    "saturday": 5, "sat": 5,
+    "sunday": 6, "sun": 6,
+}
+_UNITS = {
+    "minute": timedelta(minutes=1), "min": timedelta(minutes=1),
+    "hour": timedelta(hours=1), "hr": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+
+_DAY = (
+    r"(?:(?P<rel>next|this)\s+)?"
+    r"(?P<day>today|tomorrow|" + "|".join(sorted(_WEEKDAYS, key=len, reverse=True)) + r")"
+)
+_TIME = (
+    r"(?P<at>at\s+)?(?:(?P<named>noon|midnight)"
+    r"|(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>[ap])\.?m\.?"
+    r"|(?P<hour24>\d{1,2})(?::(?P<minute24>\d{2}))?)"
+)
+# "<day>", "<day> [at] <time>" or "[at] <time>"
+_DAY_FIRST_RE = re.compile(rf"(?:{_DAY}(?:\s*,?\s*|$))?(?:{_TIME})?")
+# "<time> [on] <day>"
+_TIME_FIRST_RE = re.compile(rf"{_TIME}\s+(?:on\s+)?{_DAY}")
+_RELATIVE_RE = re.compile(r"in\s+(?P<count>an?|\d+)\s+(?P<unit>[a-z]+?)s?")
+
+# Bound on memoized (phrase, minute) pairs; old minutes age out of the LRU
+_CACHE_SIZE = 1024
+
+
+def _clock(m: re.Match) -> Optional[time]:
+    """Time of day from the time groups of a match, or None if invalid."""
+    if m.group("named"):
+        return time(12) if m.group("named") == "noon" else time(0)
+    if m.group("hour"):
+        hour, minute = int(m.group("hour")), int(m.group("minute") or 0)
+        if not 1 <= hour <= 12 or minute > 59:
+            return None
+        return time(hour % 12 + (12 if m.group("ampm") == "p" else 0), minute)
+    hour, minute = int(m.group("hour24")), int(m.group("minute24") or 0)
+    if hour > 23 or minute > 59:
+        return None
+    # A bare "9" is only a time after "at" or next to a day; "from 9 to 5" is
+    # left to dateparser rather than guessing am/pm
+    if m.group("minute24") is None and not m.group("at") and not m.group("day"):
+        return None
+    return time(hour, minute)
+
+
+def _resolve(m: re.Match, base: datetime) -> Optional[datetime]:
+    clock = None
+    if m.group("named") or m.group("hour") or m.group("hour24"):
+        clock = _clock(m)
+        if clock is None:
+            return None
+    day = m.group("day")
+
+    if day is None:
+        return datetime.combine(base.date(), clock) if clock else None
+    if day == "today":
+        return datetime.combine(base.date(), clock or base.time())
+    if day == "tomorrow":
+        return datetime.combine(base.date() + timedelta(days=1), clock or base.time())
+
+    ahead = (_WEEKDAYS[day] - base.weekday()) % 7
+    if ahead == 0 and m.group("rel") == "next":
+        ahead = 7
+    result = datetime.combine(base.date() + timedelta(days=ahead), clock or time(0))
+    # "Sunday 10am" said on Sunday at noon means next week
+    if clock is not None and result <= base:
+        result += timedelta(weeks=1)
+    return result
+
+
+def parse_native(phrase: str, now: datetime) -> Optional[datetime]:
+    """Parse `phrase` with the built-in grammar only; None if it does not apply."""
+    text = " ".join(phrase.split())
+    if not text:
+        return None
+    if text[0].isdigit() and "-" in text:
+        try:
+            return datetime.fromisoformat(text)
+        except ValueError:
+            pass
+
+    lowered = text.lower()
+    if lowered == "now":
+        return now
+    m = _RELATIVE_RE.fullmatch(lowered)
+    if m:
+        unit = _UNITS.get(m.group("unit"))
+        if unit is None:
+            return None
+        count = 1 if m.group("count") in ("a", "an") else int(m.group("count"))
+        return now + count * unit
+
+    m = _DAY_FIRST_RE.fullmatch(lowered) or _TIME_FIRST_RE.fullmatch(lowered)
+    return _resolve(m, now) if m else None
+
+
+# ---------------------------------------------------------------------------
+# dateparser fallback
+# ---------------------------------------------------------------------------
+
+_fallback: Any = None
+_fallback_lock = threading.Lock()
+
+
+def _parse_fallback(phrase: str) -> Optional[datetime]:
+    """Shared English-only DateDataParser; skips per-call language detection."""
+    global _fallback
+    with _fallback_lock:
+        if _fallback is None:
+            from dateparser.date import DateDataParser  # type: ignore
+
+            _fallback = DateDataParser(
+                languages=["en"], settings={"PREFER_DATES_FROM": "future"}
+            )
+        return _fallback.get_date_data(phrase).date_obj
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _parse_cached(phrase: str, minute: datetime) -> Optional[datetime]:
+    result = parse_native(phrase, minute)
+    if result is not None:
+        return result
+    logger.debug("Time phrase %r not in grammar; using dateparser", phrase)
+    return _parse_fallback(phrase)
+
+
+def parse_time(phrase: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Resolve a time expression to a datetime, or None if it cannot be parsed.
+
+    `now` defaults to the current local time; it is truncated to the minute,
+    which is also the granularity of the memo.
+    """
+    minute = (now or datetime.now()).replace(second=0, microsecond=0)
+    return _parse_cached(phrase.strip(), minute)
+
+
+def clear_cache() -> None:
+    _parse_cached.cache_clear()
@@ -0,0 +1,89 @@
+"""
+Train the local intent classifier offline.
+
+    cd backend && python -m app.nlp.train_classifier [--extra labelled.jsonl ...]
+
+Reads the bundled corpus (intent_corpus.json: a list of {"text", "intent"},
+intent null for commands that are not for the security system) plus any
+--extra JSONL files of the same records, e.g. commands and the intents the
+LLM fallback returned for them. Reports accuracy on a held-out fifth and the
+false-positive rate on held-out negatives at CLASSIFIER_THRESHOLD, then
+trains on everything and writes intent_model.json. No network access.
+"""
+import argparse
+import hashlib
+import json
+import random
+from pathlib import Path
+from typing import Optional
+
+from app.config import settings
+from app.nlp.intent_classifier import DEFAULT_MODEL_PATH, IntentClassifier
+from app.nlp.normalize import NormalizedText
+
+DEFAULT_CORPUS_PATH = Path(__file__).with_name("intent_corpus.json")
+
+Example = tuple[str, Optional[str]]
+
+
+def load_corpus(path: Path, extra: list[Path]) -> list[Example]:
+    records = json.loads(path.read_text(encoding="utf-8"))
+    for extra_path in extra:
+        with open(extra_path, encoding="utf-8") as f:
+            records += [json.loads(line) for line in f if line.strip()]
+    return [(r["text"], r.get("intent") or None) for r in records]
+
+
+def corpus_checksum(examples: list[Example]) -> str:
+    """Recorded in the model, so a stale model can be detected."""
+    return hashlib.sha256(json.dumps(examples).encode("utf-8")).hexdigest()[:16]
+
+
+def evaluate(train: list[Example], held_out: list[Example], threshold: float) -> dict[str, float]:
+    model = IntentClassifier.train(train)
+    commands = [(t, i) for t, i in held_out if i is not None]
+    negatives = [t for t, i in held_out if i is None]
+    accepted = correct = false_positives = 0
+    for text, intent in commands:
+        predicted, confidence = model.predict(NormalizedText(text))
+        if predicted is not None and confidence >= threshold:
+            accepted += 1
+            correct += predicted == intent
+    for text in negatives:
+        predicted, confidence = model.predict(NormalizedText(text))
+        false_positives += predicted is not None and confidence >= threshold
+    return {
+        "coverage": accepted / max(len(commands), 1),
+        "precision": correct / max(accepted, 1),
+        "false_positive_rate": false_positives / max(len(negatives), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS_PATH)
+    parser.add_argument("--extra", type=Path, action="append", default=[])
+    parser.add_argument("--out", type=Path, default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--threshold", type=float, default=settings.CLASSIFIER_THRESHOLD)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    examples = load_corpus(args.corpus, args.extra)
+    shuffled = examples[:]
+    random.Random(args.seed).shuffle(shuffled)
+    split = len(shuffled) // 5
+    report = evaluate(shuffled[split:], shuffled[:split], args.threshold)
+    print(
+        f"held out {split} of {len(examples)}: "
+        f"coverage {report['coverage']:.0%}, precision {report['precision']:.0%}, "
+        f"false positives {report['false_positive_rate']:.0%} "
+        f"at threshold {args.threshold}"
+    )
+
+    model = IntentClassifier.train(examples, seed=args.seed, checksum=corpus_checksum(examples))
+    args.out.write_text(json.dumps(model.to_json(), separators=(",", ":")), encoding="utf-8")
+    print(f"wrote {args.out} ({len(model.weights)} weighted features)")
+
+
+if __name__ == "__main__":
+    main()
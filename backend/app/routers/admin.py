@@ -0,0 +1,108 @@
+import logging
+
+from fastapi import APIRouter, HTTPException
+
+from app.config import settings
+from app.nlp.rule_engine import LEARNED_STAGE, get_rules, reload_rules
+from app.nlp.rule_learner import RuleLearner, get_rule_learner
+
+router = APIRouter(tags=["Admin"])
+logger = logging.getLogger(__name__)
+
+
+def _rules_info(rules) -> dict:
+    return {
+        "version": rules.version,
+        "checksum": rules.checksum,
+        "count": len(rules.rules),
+        "learned": sum(1 for stage, _, _ in rules.rules if stage == LEARNED_STAGE),
+    }
+
+
+def _learner() -> RuleLearner:
+    learner = get_rule_learner()
+    if learner is None:
+        raise HTTPException(status_code=404, detail="Learned rules are disabled")
+    return learner
+
+
+@router.get(
+    "/rules",
+    summary="Show the active rule set",
+    description="Returns the version, checksum and size of the rules currently in use.",
+)
+async def rules_info():
+    return {"ok": True, "rules": _rules_info(get_rules())}
+
+
+@router.post(
+    "/rules/reload",
+    summary="Reload the rule set from disk",
+    description=(
+        "Re-reads the rules file (RULES_PATH), compiles it and swaps it in atomically. "
+        "Requests already in flight finish on the previous version. "
+        "If the file is invalid the active rules are kept and 400 is returned. "
+        "With several workers it would reach only one of them: 409, restart instead."
+    ),
+)
+def rules_reload():
+    if settings.WEB_CONCURRENCY > 1:
+        raise HTTPException(
+            status_code=409,
+            detail="Rules reload reaches a single worker; restart the service to reload every worker",
+        )
+    previous = get_rules()
+    try:
+        rules = reload_rules()
+    except (OSError, ValueError) as exc:
+        logger.warning("Rules reload failed: %s", exc)
+        raise HTTPException(status_code=400, detail=f"Rules reload failed: {exc}")
+    return {
+        "ok": True,
+        "previous_version": previous.version,
+        "rules": _rules_info(rules),
+    }
+
+
+@router.get(
+    "/learned-rules",
+    summary="Review learned rules",
+    description=(
+        "Lists the phrasings promoted from LLM answers into the learned alias stage, "
+        "revoked ones included, and the number of phrasings still being counted."
+    ),
+)
+def learned_rules():
+    learner = _learner()
+    return {
+        "ok": True,
+        "entries": learner.entries(),
+        "candidates": learner.candidate_count(),
+    }
+
+
+@router.get(
+    "/learned-rules/export",
+    summary="Export learned rules",
+    description=(
+        "Returns the active learned rules as a rules.json document, "
+        "for review or to move them into the rules file."
+    ),
+)
+def learned_rules_export():
+    return _learner().export()
+
+
+@router.delete(
+    "/learned-rules/{entry_id}",
+    summary="Revoke a learned rule",
+    description=(
+        "Removes the entry from the rule engine. The phrasing stays recorded as revoked "
+        "and is not promoted again. 404 if there is no such entry."
+    ),
+)
+def learned_rule_revoke(entry_id: str):
+    entry = _learner().revoke(entry_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"No learned rule {entry_id}")
+    return {"ok": True, "entry": entry}
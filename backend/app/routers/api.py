@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 from fastapi import APIRouter, HTTPException
@@ -5,6 +6,9 @@ from fastapi import APIRouter, HTTPException
 from app.models import AddUserRequest, ArmRequest, RemoveUserRequest
 from app.store import store
 
+# Handlers are async so /nl/execute can await them, but every store call runs
+# on a worker thread: writes wait for the backend to commit, and with a shared
+# backend a read first asks it (SQL, or Redis state) whether to reload
 router = APIRouter(tags=["Security API"])
 logger = logging.getLogger(__name__)
 
@@ -14,14 +18,14 @@ logger = logging.getLogger(__name__)
     summary="Arm the security system",
     description="Arms the security system in the specified mode. Default mode is 'away'.",
 )
-def arm_system(req: ArmRequest):
+async def arm_system(req: ArmRequest):
     """
     Arm the security system.
 
     - **mode**: `away` (default) — full perimeter armed; `home` — interior zones off;
       `stay` — same as home, typically used for overnight stays
     """
-    state = store.arm(req.mode)
+    state = await asyncio.to_thread(store.arm, req.mode)
     return {"ok": True, "state": state}
 
 
@@ -30,9 +34,9 @@ def arm_system(req: ArmRequest):
     summary="Disarm the security system",
     description="Disarms the security system. No payload required.",
 )
-def disarm_system():
+async def disarm_system():
     """Disarm the security system."""
-    state = store.disarm()
+    state = await asyncio.to_thread(store.disarm)
     return {"ok": True, "state": state}
 
 
@@ -45,7 +49,7 @@ def disarm_system():
         "PINs are stored masked in all responses."
     ),
 )
-def add_user(req: AddUserRequest):
+async def add_user(req: AddUserRequest):
     """
     Add a user.
 
@@ -57,7 +61,8 @@ def add_user(req: AddUserRequest):
     """
     if req.pin is None:
         raise HTTPException(status_code=400, detail="pin is required")
-    user = store.add_user(
+    user = await asyncio.to_thread(
+        store.add_user,
         name=req.name,
         pin=req.pin,
         start_time=req.start_time,
@@ -72,7 +77,7 @@ def add_user(req: AddUserRequest):
     summary="Remove a user",
     description="Remove a user by name or PIN. At least one identifier is required.",
 )
-def remove_user(req: RemoveUserRequest):
+async def remove_user(req: RemoveUserRequest):
     """
     Remove a user.
 
@@ -85,7 +90,7 @@ def remove_user(req: RemoveUserRequest):
         raise HTTPException(
             status_code=400, detail="Either name or pin is required"
         )
-    user = store.remove_user(name=req.name, pin=req.pin)
+    user = await asyncio.to_thread(store.remove_user, name=req.name, pin=req.pin)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return {"ok": True, "removed": user}
@@ -96,7 +101,7 @@ def remove_user(req: RemoveUserRequest):
     summary="List all users",
     description="Returns all users with masked PINs (last 2 digits shown, e.g. `**21`).",
 )
-def list_users():
+async def list_users():
     """List all registered users. PINs are masked in the response."""
-    users = store.list_users()
+    users = await asyncio.to_thread(store.list_users)
     return {"ok": True, "users": users, "count": len(users)}
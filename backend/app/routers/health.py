@@ -1,7 +1,14 @@
+import asyncio
 import time
 
 from fastapi import APIRouter
 
+from app.config import settings
+from app.metrics import metrics
+from app.nlp.circuit_breaker import breaker_states
+from app.nlp.llm_router import llm_router
+from app.nlp.parse_cache import parse_cache
+from app.nlp.semantic_cache import get_semantic_cache
 from app.store import store
 
 router = APIRouter(tags=["Health"])
@@ -10,9 +17,27 @@ _START_TIME = time.time()
 
 
 @router.get("/healthz")
-def healthz():
+async def healthz():
     return {
         "ok": True,
         "uptime_seconds": round(time.time() - _START_TIME, 1),
-        "system_state": store.get_state(),
+        # May reload a shared store: off the event loop
+        "system_state": await asyncio.to_thread(store.get_state),
+    }
+
+
+@router.get("/metrics")
+async def metrics_snapshot():
+    semantic_cache = get_semantic_cache()
+    return {
+        "ok": True,
+        "counters": metrics.snapshot(),
+        "timings": metrics.timings(),
+        "parse_cache": {"size": len(parse_cache), "max_size": parse_cache.maxsize},
+        "semantic_cache": {
+            "size": len(semantic_cache) if semantic_cache is not None else 0,
+            "max_size": settings.SEMANTIC_CACHE_SIZE,
+        },
+        "llm_breakers": breaker_states(),
+        "llm_routing": llm_router.snapshot(),
     }
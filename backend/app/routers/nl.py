@@ -1,7 +1,10 @@
 import logging
-from typing import Any
+import time
+from typing import Any, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+
+from app.config import settings
 
 from app.models import (
     AddUserRequest,
@@ -9,7 +12,7 @@ from app.models import (
     NLExecuteRequest,
     RemoveUserRequest,
 )
-from app.nlp.parser import parse_command
+from app.nlp.parser import parse_command_async
 from app.routers.api import (
     add_user,
     arm_system,
@@ -22,20 +25,38 @@ router = APIRouter(tags=["NL"])
 logger = logging.getLogger(__name__)
 
 
-def _execute_api_call(api_call: dict[str, Any]) -> Any:
+def _latency_budget(request: Request) -> Optional[float]:
+    """
+    Seconds the LLM fallback may still take: the request header, else the
+    setting, less the time since the request arrived (queueing, reading and
+    validating the body).
+    """
+    raw = request.headers.get(settings.LATENCY_BUDGET_HEADER)
+    try:
+        budget_ms = float(raw) if raw else settings.NL_LATENCY_BUDGET_MS
+    except ValueError:
+        budget_ms = settings.NL_LATENCY_BUDGET_MS
+    if budget_ms <= 0:
+        return None
+    received_at = getattr(request.state, "received_at", None)
+    spent = 0.0 if received_at is None else time.monotonic() - received_at
+    return max(0.0, budget_ms / 1000 - spent)
+
+
+async def _execute_api_call(api_call: dict[str, Any]) -> Any:
     path = api_call["path"]
     payload = api_call.get("payload") or {}
 
     if path == "/api/arm-system":
-        return arm_system(ArmRequest(**payload))
+        return await arm_system(ArmRequest(**payload))
     if path == "/api/disarm-system":
-        return disarm_system()
+        return await disarm_system()
     if path == "/api/add-user":
-        return add_user(AddUserRequest(**payload))
+        return await add_user(AddUserRequest(**payload))
     if path == "/api/remove-user":
-        return remove_user(RemoveUserRequest(**payload))
+        return await remove_user(RemoveUserRequest(**payload))
     if path == "/api/list-users":
-        return list_users()
+        return await list_users()
     return None
 
 
@@ -48,21 +69,23 @@ def _execute_api_call(api_call: dict[str, Any]) -> Any:
         "to the appropriate `/api/*` endpoint. "
         "Supports English plus creative aliases (e.g. 'open sesame', Spanish, French, "
         "German, Arabic, Hindi). "
-        "Returns the parsed interpretation, the API call made, and the result."
+        "Returns the parsed interpretation, the API call made, and the result. "
+        "An `X-Latency-Budget-Ms` header caps how long the LLM fallback may take."
     ),
 )
-def nl_execute(req: NLExecuteRequest):
+async def nl_execute(req: NLExecuteRequest, request: Request):
     if not req.text.strip():
         raise HTTPException(status_code=400, detail="text must not be empty")
 
-    parsed = parse_command(req.text)
+    budget = _latency_budget(request)
+    parsed = await parse_command_async(req.text, budget)
     api_result = None
     error = None
 
     api_call = parsed.get("api")
     if api_call:
         try:
-            api_result = _execute_api_call(api_call)
+            api_result = await _execute_api_call(api_call)
         except HTTPException as exc:
             error = exc.detail
             logger.warning("API execution HTTP error: %s", exc.detail)
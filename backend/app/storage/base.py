@@ -0,0 +1,195 @@
+"""
+Storage backends behind SecurityStore.
+
+The store keeps the working state in memory and answers every read from it.
+Each write is described as an event (a JSON-able dict, see store.py) and
+handed to the backend, which makes it durable; on start the backend's saved
+state is loaded back. The base class keeps nothing: it is the in-memory
+store (STORE_BACKEND=memory).
+"""
+import logging
+import queue
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# State as persisted: {"state": {"armed", "mode"}, "users": [user, ...]}
+Dump = dict[str, Any]
+
+
+class StorageError(RuntimeError):
+    """A write could not be made durable."""
+
+
+class Commit:
+    """Completion of one write; wait() returns once it is durable."""
+
+    __slots__ = ("event", "_done", "_error")
+
+    def __init__(self, event: dict[str, Any]) -> None:
+        self.event = event
+        self._done = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self._error = error
+        self._done.set()
+
+    def wait(self) -> None:
+        self._done.wait()
+        if self._error is not None:
+            raise StorageError(f"store write failed: {self._error}") from self._error
+
+
+class GroupCommitter:
+    """
+    Makes writes durable in batches, from one thread.
+
+    Writers submit commits and wait on them. The thread takes everything
+    queued while the previous batch was being made durable and hands it to
+    `commit_batch` in submission order, so one fsync covers all of it.
+    `commit_batch` raises if the batch is not durable; every commit in it
+    then fails.
+    """
+
+    def __init__(
+        self, commit_batch: Callable[[list[Commit]], None], name: str, max_batch: int = 512
+    ) -> None:
+        self._commit_batch = commit_batch
+        self.max_batch = max_batch
+        self._queue: queue.Queue[Optional[Commit]] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, commit: Commit) -> Commit:
+        self._queue.put(commit)
+        return commit
+
+    def close(self) -> None:
+        """Commit what is queued and stop the thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            while len(batch) < self.max_batch:
+                try:
+                    commit = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if commit is None:
+                    stopping = True
+                    break
+                batch.append(commit)
+            error: Optional[BaseException] = None
+            try:
+                self._commit_batch(batch)
+            except Exception as exc:
+                logger.error("Store commit of %d writes failed: %s", len(batch), exc)
+                error = exc
+            metrics.incr("store.commits")
+            metrics.incr("store.writes", len(batch))
+            for commit in batch:
+                commit.finish(error)
+
+
+class VersionTracker:
+    """
+    Which version of shared state the store's in-memory copy matches.
+
+    For backends other processes write too: each write transaction bumps a
+    version in the shared state. Loading records the version loaded; a
+    commit that lands right after the recorded one (nobody else wrote in
+    between) advances it. Events queued here but not committed yet are kept,
+    in order: each batch of them bumps the version once, so the copy is
+    behind only once the shared version passes the recorded one plus the
+    batches that may still land. A reload replays them on top of what it
+    read, so they stay in view.
+
+    Backends read their state and commit batches inside sync(), which keeps
+    the two apart: a load sees a batch either in the shared state or still
+    pending, never both.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sync = threading.Lock()
+        self._pending: list[dict[str, Any]] = []
+        self._seen = 0
+
+    def sync(self) -> threading.Lock:
+        return self._sync
+
+    def loaded(self, version: int) -> list[dict[str, Any]]:
+        """Record a load (inside sync()); the pending events to replay on it."""
+        with self._lock:
+            self._seen = version
+            return list(self._pending)
+
+    def submitted(self, event: dict[str, Any]) -> None:
+        with self._lock:
+            self._pending.append(event)
+
+    def finished(self, count: int, version: Optional[int] = None) -> None:
+        """
+        The oldest `count` events are done (inside sync()): committed as
+        `version`, or failed when it is None.
+        """
+        with self._lock:
+            del self._pending[:count]
+            if version is not None and version == self._seen + 1:
+                self._seen = version
+
+    def behind(self, version: Callable[[], int]) -> bool:
+        """Whether the shared `version()` includes writes the copy has not seen."""
+        with self._lock:
+            seen, pending = self._seen, len(self._pending)
+        return not seen <= version() <= seen + pending
+
+
+class StorageBackend:
+    name = "memory"
+
+    def load(self) -> tuple[Optional[Dump], Iterable[dict[str, Any]]]:
+        """
+        The saved state (None if nothing was saved) and the events written
+        after it, to be applied on top in order.
+        """
+        return None, ()
+
+    def write(self, event: dict[str, Any]) -> Optional[Commit]:
+        """
+        Persist one event. Called under the store's write lock, so events
+        arrive in the order they were applied; the store waits on the
+        returned commit after releasing the lock.
+        """
+        return None
+
+    def stale(self) -> bool:
+        """
+        Whether another process has changed the saved state since this one
+        last loaded or wrote it, so the store should load it again.
+        """
+        return False
+
+    def compaction_due(self) -> bool:
+        """Whether the store should hand over a snapshot (see compact)."""
+        return False
+
+    def compact(self, dump: Dump) -> None:
+        """
+        Record `dump`, the state after the last event written, so that
+        loading can start from it. Called under the store's write lock.
+        """
+
+    def close(self) -> None:
+        pass
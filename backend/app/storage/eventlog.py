@@ -0,0 +1,181 @@
+"""
+Append-only event log backend for SecurityStore (STORE_BACKEND=eventlog).
+
+Every store write is appended to a log as one JSON line with a sequence
+number, so the log is a complete, ordered record of arm, disarm, add_user
+and remove_user calls. Appends are group-committed: the committer thread
+writes everything queued with one write() and one fsync, then wakes all the
+waiting writers.
+
+Every STORE_SNAPSHOT_EVERY events the store hands over its whole state. It
+is written to snapshot.json (fsynced, then renamed into place) with the
+sequence number it covers, and the log moves on to a new segment file.
+Startup loads the snapshot and replays only the segments written after it.
+Older segments stay on disk as the audit trail.
+
+Files in STORE_LOG_DIR:
+
+    snapshot.json           {"seq": n, "dump": {"state": ..., "users": [...]}}
+    events-<first seq>.log  one {"seq": n, "type": ...} object per line
+
+A line torn by a crash during an append was never acknowledged; it is cut
+off on start.
+"""
+import json
+import logging
+import os
+from typing import Any, BinaryIO, Iterable, Iterator, Optional
+
+from app.storage.base import Commit, Dump, GroupCommitter, StorageBackend
+
+logger = logging.getLogger(__name__)
+
+_SNAPSHOT = "snapshot.json"
+_SEGMENT_PREFIX = "events-"
+_SEGMENT_SUFFIX = ".log"
+
+
+def _fsync_directory(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class EventLogBackend(StorageBackend):
+    name = "eventlog"
+
+    def __init__(self, directory: str, snapshot_every: int = 100_000) -> None:
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+        # Last sequence number handed out, and the one the latest snapshot
+        # covers (both under the store's write lock)
+        self._seq = 0
+        self._snapshot_seq = 0
+        # Segment appended to; opened by the committer on its first append
+        self._segment = self._segment_path(1)
+        self._file: Optional[BinaryIO] = None
+        self._committer = GroupCommitter(self._commit, "store-log")
+
+    # ---- Loading ----
+
+    def load(self) -> tuple[Optional[Dump], Iterable[dict[str, Any]]]:
+        snapshot_seq, dump = self._read_snapshot()
+        segments = self._segments()
+        # The segment the snapshot was taken in holds its last events; the
+        # ones before it only hold events the snapshot covers
+        start = 0
+        for index, (first, _) in enumerate(segments):
+            if first <= snapshot_seq + 1:
+                start = index
+        self._seq = self._snapshot_seq = snapshot_seq
+        paths = [path for _, path in segments[start:]]
+        return dump, self._replay(paths, snapshot_seq)
+
+    def _replay(self, paths: list[str], after: int) -> Iterator[dict[str, Any]]:
+        for number, path in enumerate(paths, 1):
+            with open(path, "rb") as fh:
+                good = 0
+                for line in fh:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        break
+                    good += len(line)
+                    seq = event.pop("seq")
+                    self._seq = seq
+                    if seq > after:
+                        yield event
+            if number == len(paths) and good != os.path.getsize(path) and self._file is None:
+                logger.warning("Cutting a torn append off %s at byte %d", path, good)
+                with open(path, "r+b") as fh:
+                    fh.truncate(good)
+        # Appends go on in the last segment, or in a new one when nothing
+        # was written after the snapshot
+        self._segment = paths[-1] if self._seq > after else self._segment_path(after + 1)
+
+    def _read_snapshot(self) -> tuple[int, Optional[Dump]]:
+        try:
+            with open(os.path.join(self.directory, _SNAPSHOT), encoding="utf-8") as fh:
+                snapshot = json.load(fh)
+        except FileNotFoundError:
+            return 0, None
+        return snapshot["seq"], snapshot["dump"]
+
+    def _segments(self) -> list[tuple[int, str]]:
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                first = int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)])
+                segments.append((first, os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def _segment_path(self, first: int) -> str:
+        return os.path.join(self.directory, f"{_SEGMENT_PREFIX}{first:012d}{_SEGMENT_SUFFIX}")
+
+    # ---- Writing ----
+
+    def write(self, event: dict[str, Any]) -> Optional[Commit]:
+        self._seq += 1
+        return self._committer.submit(Commit({"seq": self._seq, **event}))
+
+    def compaction_due(self) -> bool:
+        return 0 < self.snapshot_every <= self._seq - self._snapshot_seq
+
+    def compact(self, dump: Dump) -> None:
+        # Nobody waits on it: a failed snapshot only means a longer replay
+        self._snapshot_seq = self._seq
+        self._committer.submit(Commit({"type": "snapshot", "seq": self._seq, "dump": dump}))
+
+    def close(self) -> None:
+        self._committer.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _commit(self, batch: list[Commit]) -> None:
+        lines: list[str] = []
+        for commit in batch:
+            event = commit.event
+            if event["type"] != "snapshot":
+                lines.append(json.dumps(event, separators=(",", ":"), ensure_ascii=False))
+                continue
+            self._append(lines)
+            lines = []
+            try:
+                self._write_snapshot(event["seq"], event["dump"])
+            except OSError as exc:
+                logger.warning("Store snapshot at %d failed: %s", event["seq"], exc)
+                continue
+            # Events after the snapshot go to a new segment
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._segment = self._segment_path(event["seq"] + 1)
+        self._append(lines)
+
+    def _append(self, lines: list[str]) -> None:
+        if not lines:
+            return
+        if self._file is None:
+            created = not os.path.exists(self._segment)
+            self._file = open(self._segment, "ab")
+            if created:
+                _fsync_directory(self.directory)
+        self._file.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _write_snapshot(self, seq: int, dump: Dump) -> None:
+        path = os.path.join(self.directory, _SNAPSHOT)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"seq": seq, "dump": dump}, fh, ensure_ascii=False)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        _fsync_directory(self.directory)
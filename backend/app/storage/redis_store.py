@@ -0,0 +1,298 @@
+"""
+Redis backend for SecurityStore (STORE_BACKEND=redis).
+
+For several nodes (or workers) sharing one alarm state. Anything speaking
+the Redis protocol works: redis-server, Valkey, KeyDB, or fakeredis in the
+tests. The redis package is optional and only imported for this backend.
+
+Keys, under STORE_REDIS_PREFIX:
+
+    {<prefix>}:state          hash {armed: "0"/"1", mode}
+    {<prefix>}:user:<name>    hash per user (lowercased name): name, pin,
+                              start_time, end_time ("" = none), permissions (JSON)
+    {<prefix>}:pins           hash PIN -> lowercased name (the PIN index)
+    {<prefix>}:order          sorted set of lowercased names, in order added
+    {<prefix>}:seq            counter scoring :order
+    {<prefix>}:version        bumped by every write transaction
+    {<prefix>}:changes        pub/sub channel, carries each new version
+
+The braces are a Redis Cluster hash tag: every key of one store hashes to
+the same slot. The scripts build the user keys from ARGV (a user's name is
+only known once the PIN index has been read), which a cluster only allows
+within the slot of the declared keys, and a MULTI/EXEC batch must stay in
+one slot too. One store therefore lives on one shard; stores under
+different prefixes spread across the cluster. connect() opens a single-node
+client; against a cluster, pass RedisBackend a redis.cluster.RedisCluster.
+
+Every event is a Lua script, so arming and disarming, and replacing a user
+together with both index entries, happen atomically on the server. The
+committer thread pipelines a whole batch of events, plus the version bump
+and its publish, into one MULTI/EXEC round trip.
+
+Each node keeps serving reads from its in-memory copy. A listener thread
+follows the changes channel; when a version this node did not write goes
+past, the copy is stale and the store reloads it (one script call). The
+check on a read is a local comparison, with no round trip. Pub/sub is
+best effort, so a node sees another's writes a moment after they commit,
+and while the subscription is lost every read reloads, until the listener
+has subscribed again.
+
+Durability is Redis's: configure appendonly/appendfsync to match.
+"""
+import json
+import logging
+import threading
+from typing import Any, Iterable, Optional
+
+from app.storage.base import Commit, Dump, GroupCommitter, StorageBackend, VersionTracker
+
+logger = logging.getLogger(__name__)
+
+# KEYS: state; ARGV: mode
+_ARM = """
+redis.call('HSET', KEYS[1], 'armed', '1', 'mode', ARGV[1])
+return 1
+"""
+
+# KEYS: state
+_DISARM = """
+redis.call('HSET', KEYS[1], 'armed', '0')
+if redis.call('HEXISTS', KEYS[1], 'mode') == 0 then
+    redis.call('HSET', KEYS[1], 'mode', 'away')
+end
+return 1
+"""
+
+# Drops the user hash stored at prefix..name along with its index entries
+_DROP_USER = """
+local function drop(prefix, pins, order, name)
+    local pin = redis.call('HGET', prefix .. name, 'pin')
+    if pin then
+        redis.call('HDEL', pins, pin)
+    end
+    redis.call('DEL', prefix .. name)
+    redis.call('ZREM', order, name)
+end
+"""
+
+# KEYS: pins, order, seq; ARGV: user prefix, name key, name, pin, start_time,
+# end_time, permissions
+_ADD_USER = _DROP_USER + """
+local pins, order = KEYS[1], KEYS[2]
+local prefix, key, pin = ARGV[1], ARGV[2], ARGV[4]
+drop(prefix, pins, order, key)
+local holder = redis.call('HGET', pins, pin)
+if holder then
+    drop(prefix, pins, order, holder)
+end
+redis.call('HSET', prefix .. key, 'name', ARGV[3], 'pin', pin,
+           'start_time', ARGV[5], 'end_time', ARGV[6], 'permissions', ARGV[7])
+redis.call('HSET', pins, pin, key)
+redis.call('ZADD', order, redis.call('INCR', KEYS[3]), key)
+return 1
+"""
+
+# KEYS: pins, order; ARGV: user prefix, name key
+_REMOVE_USER = _DROP_USER + """
+drop(ARGV[1], KEYS[1], KEYS[2], ARGV[2])
+return 1
+"""
+
+# KEYS: state, pins, order; ARGV: user prefix
+_RESET = """
+for _, name in ipairs(redis.call('ZRANGE', KEYS[3], 0, -1)) do
+    redis.call('DEL', ARGV[1] .. name)
+end
+redis.call('DEL', KEYS[2], KEYS[3])
+redis.call('HSET', KEYS[1], 'armed', '0', 'mode', 'away')
+return 1
+"""
+
+# KEYS: version; ARGV: channel
+_BUMP_VERSION = """
+local version = redis.call('INCR', KEYS[1])
+redis.call('PUBLISH', ARGV[1], version)
+return version
+"""
+
+# KEYS: state, order, version; ARGV: user prefix. Everything in one atomic read.
+_LOAD = """
+local state = redis.call('HMGET', KEYS[1], 'armed', 'mode')
+local users = {}
+for i, name in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    users[i] = redis.call('HMGET', ARGV[1] .. name,
+                          'name', 'pin', 'start_time', 'end_time', 'permissions')
+end
+return {state[1] or '0', state[2] or 'away', redis.call('GET', KEYS[3]) or '0', users}
+"""
+
+
+def connect(url: str) -> Any:
+    """A client for `url` (redis://host:port/db), answering in str."""
+    try:
+        import redis  # type: ignore
+    except ImportError as exc:
+        raise ImportError("STORE_BACKEND=redis needs the redis package: pip install redis") from exc
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+class RedisBackend(StorageBackend):
+    name = "redis"
+
+    def __init__(self, client: Any, prefix: str = "nlsec") -> None:
+        """`client` is a redis.Redis (or compatible) created with decode_responses=True."""
+        self.client = client
+        self.prefix = prefix
+        # Hash tagged: one cluster slot for all of them (see above)
+        tag = f"{{{prefix}}}"
+        self._state = f"{tag}:state"
+        self._users = f"{tag}:user:"
+        self._pins = f"{tag}:pins"
+        self._order = f"{tag}:order"
+        self._seq = f"{tag}:seq"
+        self._version = f"{tag}:version"
+        self.channel = f"{tag}:changes"
+        self._scripts = {
+            name: client.register_script(source)
+            for name, source in (
+                ("arm", _ARM),
+                ("disarm", _DISARM),
+                ("add_user", _ADD_USER),
+                ("remove_user", _REMOVE_USER),
+                ("reset", _RESET),
+                ("bump", _BUMP_VERSION),
+                ("load", _LOAD),
+            )
+        }
+        self._versions = VersionTracker()
+        # Highest version heard of, from pub/sub or this node's commits, and
+        # whether notifications may have been missed since the last load
+        self._latest = 0
+        self._latest_lock = threading.Lock()
+        self._lost = False
+        self._stopping = threading.Event()
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(self.channel)
+        self._listener = threading.Thread(target=self._listen, name="store-changes", daemon=True)
+        self._listener.start()
+        self._committer = GroupCommitter(self._commit, "store-redis")
+
+    def load(self) -> tuple[Optional[Dump], Iterable[dict[str, Any]]]:
+        with self._versions.sync():
+            armed, mode, version, rows = self._scripts["load"](
+                keys=[self._state, self._order, self._version], args=[self._users]
+            )
+            version = int(version)
+            # This node's writes still queued go back on top
+            pending = self._versions.loaded(version)
+        self._heard(version)
+        dump = {
+            "state": {"armed": armed == "1", "mode": mode},
+            "users": [
+                {
+                    "name": name,
+                    "pin": pin,
+                    "start_time": start_time or None,
+                    "end_time": end_time or None,
+                    "permissions": json.loads(permissions),
+                }
+                for name, pin, start_time, end_time, permissions in rows
+            ],
+        }
+        return dump, pending
+
+    def write(self, event: dict[str, Any]) -> Optional[Commit]:
+        self._versions.submitted(event)
+        return self._committer.submit(Commit(event))
+
+    def stale(self) -> bool:
+        return self._versions.behind(lambda: -1 if self._lost else self._latest)
+
+    def close(self) -> None:
+        self._committer.close()
+        self._stopping.set()
+        # Wakes the listener
+        self._pubsub.unsubscribe()
+        self._listener.join()
+        self._pubsub.close()
+
+    # ---- Committing ----
+
+    def _commit(self, batch: list[Commit]) -> None:
+        with self._versions.sync():
+            committed = None
+            try:
+                pipe = self.client.pipeline(transaction=True)
+                for commit in batch:
+                    self._queue_event(pipe, commit.event)
+                self._scripts["bump"](keys=[self._version], args=[self.channel], client=pipe)
+                committed = int(pipe.execute()[-1])
+            finally:
+                self._versions.finished(len(batch), committed)
+        self._heard(committed)
+
+    def _queue_event(self, pipe: Any, event: dict[str, Any]) -> None:
+        kind = event["type"]
+        scripts = self._scripts
+        if kind == "arm":
+            scripts["arm"](keys=[self._state], args=[event["mode"]], client=pipe)
+        elif kind == "disarm":
+            scripts["disarm"](keys=[self._state], client=pipe)
+        elif kind == "add_user":
+            user = event["user"]
+            scripts["add_user"](
+                keys=[self._pins, self._order, self._seq],
+                args=[
+                    self._users,
+                    user["name"].lower(),
+                    user["name"],
+                    user["pin"],
+                    user["start_time"] or "",
+                    user["end_time"] or "",
+                    json.dumps(user["permissions"]),
+                ],
+                client=pipe,
+            )
+        elif kind == "remove_user":
+            scripts["remove_user"](
+                keys=[self._pins, self._order], args=[self._users, event["name"].lower()], client=pipe
+            )
+        elif kind == "reset":
+            scripts["reset"](keys=[self._state, self._pins, self._order], args=[self._users], client=pipe)
+        else:
+            raise ValueError(f"unknown store event {kind!r}")
+
+    # ---- Change notifications ----
+
+    def _heard(self, version: int) -> None:
+        with self._latest_lock:
+            self._latest = max(self._latest, version)
+
+    def _listen(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                message = self._pubsub.get_message(timeout=0.5)
+            except Exception as exc:
+                # Changes may have been missed: every read reloads until the
+                # subscription is back
+                logger.warning("Store change subscription lost: %s", exc)
+                self._lost = True
+                self._stopping.wait(1.0)
+                self._resubscribe()
+                continue
+            if message is not None and message["type"] == "message":
+                self._heard(int(message["data"]))
+
+    def _resubscribe(self) -> None:
+        if self._stopping.is_set():
+            return
+        try:
+            self._pubsub.subscribe(self.channel)
+            # Commits from before the subscription came back are counted here,
+            # later ones are heard
+            version = self.client.get(self._version)
+        except Exception as exc:
+            logger.warning("Store change subscription not restored: %s", exc)
+            return
+        self._heard(int(version or 0))
+        self._lost = False
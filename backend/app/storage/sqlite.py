@@ -0,0 +1,184 @@
+"""
+SQLite backend for SecurityStore (STORE_BACKEND=sqlite).
+
+The database runs in WAL mode with synchronous=FULL, so a write the API has
+acknowledged survives a crash or power loss. Committing costs an fsync, so
+writes are group-committed: store threads queue their events and wait, and
+one committer thread applies everything queued in a single transaction,
+then wakes all of them. Under load, one fsync covers many writes.
+
+Users are keyed by their lowercased name, with a unique index on the PIN;
+replacing a user by either is one indexed DELETE. Every statement is a
+constant SQL string, so sqlite3 prepares it once per connection and reuses
+it from its statement cache.
+
+With STORE_SHARED set, several processes (uvicorn --workers) use the same
+database. Every transaction bumps a change counter in `meta`; each process
+remembers the version its in-memory state matches, and the store reloads
+when the counter shows another process has committed since. Checking costs
+one single-row query per read.
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Iterable, Optional
+
+from app.storage.base import Commit, Dump, GroupCommitter, StorageBackend, VersionTracker
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS system_state (
+    id    INTEGER PRIMARY KEY CHECK (id = 0),
+    armed INTEGER NOT NULL,
+    mode  TEXT NOT NULL
+);
+INSERT OR IGNORE INTO system_state (id, armed, mode) VALUES (0, 0, 'away');
+CREATE TABLE IF NOT EXISTS users (
+    name_key    TEXT PRIMARY KEY,   -- lowercased name
+    name        TEXT NOT NULL,
+    pin         TEXT NOT NULL,
+    start_time  TEXT,
+    end_time    TEXT,
+    permissions TEXT NOT NULL       -- JSON list
+);
+CREATE UNIQUE INDEX IF NOT EXISTS users_pin ON users (pin);
+CREATE TABLE IF NOT EXISTS meta (
+    id      INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL        -- bumped by every write transaction
+);
+INSERT OR IGNORE INTO meta (id, version) VALUES (0, 0);
+"""
+
+_ARM = "UPDATE system_state SET armed = 1, mode = ? WHERE id = 0"
+_DISARM = "UPDATE system_state SET armed = 0 WHERE id = 0"
+_RESET_STATE = "UPDATE system_state SET armed = 0, mode = 'away' WHERE id = 0"
+_DELETE_USER = "DELETE FROM users WHERE name_key = ? OR pin = ?"
+_INSERT_USER = (
+    "INSERT INTO users (name_key, name, pin, start_time, end_time, permissions) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+_REMOVE_USER = "DELETE FROM users WHERE name_key = ?"
+_CLEAR_USERS = "DELETE FROM users"
+_BUMP_VERSION = "UPDATE meta SET version = version + 1 WHERE id = 0"
+_VERSION = "SELECT version FROM meta WHERE id = 0"
+
+
+def connect(path: str) -> sqlite3.Connection:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write transactions take the write lock up front (BEGIN IMMEDIATE), so
+    # a concurrent writer in another process waits instead of failing
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level="IMMEDIATE")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def apply_event(conn: sqlite3.Connection, event: dict[str, Any]) -> None:
+    """Run the statements for one store event (inside the caller's transaction)."""
+    kind = event["type"]
+    if kind == "arm":
+        conn.execute(_ARM, (event["mode"],))
+    elif kind == "disarm":
+        conn.execute(_DISARM)
+    elif kind == "add_user":
+        user = event["user"]
+        conn.execute(_DELETE_USER, (user["name"].lower(), user["pin"]))
+        conn.execute(
+            _INSERT_USER,
+            (
+                user["name"].lower(),
+                user["name"],
+                user["pin"],
+                user["start_time"],
+                user["end_time"],
+                json.dumps(user["permissions"]),
+            ),
+        )
+    elif kind == "remove_user":
+        conn.execute(_REMOVE_USER, (event["name"].lower(),))
+    elif kind == "reset":
+        conn.execute(_CLEAR_USERS)
+        conn.execute(_RESET_STATE)
+    else:
+        raise ValueError(f"unknown store event {kind!r}")
+
+
+def read_dump(conn: sqlite3.Connection) -> Dump:
+    armed, mode = conn.execute("SELECT armed, mode FROM system_state WHERE id = 0").fetchone()
+    rows = conn.execute(
+        "SELECT name, pin, start_time, end_time, permissions FROM users ORDER BY rowid"
+    ).fetchall()
+    return {
+        "state": {"armed": bool(armed), "mode": mode},
+        "users": [
+            {
+                "name": name,
+                "pin": pin,
+                "start_time": start_time,
+                "end_time": end_time,
+                "permissions": json.loads(permissions),
+            }
+            for name, pin, start_time, end_time, permissions in rows
+        ],
+    }
+
+
+class SQLiteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str, shared: bool = False) -> None:
+        self.path = path
+        self.shared = shared
+        self._conn = connect(path)
+        # Loads and change checks, from request threads
+        self._reader = connect(path)
+        self._reader_lock = threading.Lock()
+        self._versions = VersionTracker()
+        self._committer = GroupCommitter(self._commit, "store-commit")
+
+    def load(self) -> tuple[Optional[Dump], Iterable[dict[str, Any]]]:
+        with self._versions.sync(), self._reader_lock:
+            # One read transaction: the dump and its version agree
+            self._reader.execute("BEGIN")
+            try:
+                dump = read_dump(self._reader)
+                version = self._version()
+            finally:
+                self._reader.execute("COMMIT")
+            # This process's writes still queued go back on top
+            return dump, self._versions.loaded(version)
+
+    def write(self, event: dict[str, Any]) -> Optional[Commit]:
+        self._versions.submitted(event)
+        return self._committer.submit(Commit(event))
+
+    def stale(self) -> bool:
+        return self.shared and self._versions.behind(self._read_version)
+
+    def close(self) -> None:
+        self._committer.close()
+        self._conn.close()
+        self._reader.close()
+
+    def _read_version(self) -> int:
+        with self._reader_lock:
+            return self._version()
+
+    def _version(self) -> int:
+        return self._reader.execute(_VERSION).fetchone()[0]
+
+    def _commit(self, batch: list[Commit]) -> None:
+        with self._versions.sync():
+            committed = None
+            try:
+                with self._conn:
+                    self._conn.execute(_BUMP_VERSION)
+                    version = self._conn.execute(_VERSION).fetchone()[0]
+                    for commit in batch:
+                        apply_event(self._conn, commit.event)
+                committed = version
+            finally:
+                self._versions.finished(len(batch), committed)
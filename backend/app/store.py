@@ -1,34 +1,201 @@
 from __future__ import annotations
 
 import logging
-from typing import Any, Optional
+import threading
+from typing import Any, Iterable, Optional
+
+from app.config import settings
+from app.metrics import metrics
+from app.storage.base import Commit, Dump, StorageBackend, StorageError
+from app.storage.eventlog import EventLogBackend
+from app.storage.redis_store import RedisBackend, connect as connect_redis
+from app.storage.sqlite import SQLiteBackend
 
 logger = logging.getLogger(__name__)
 
 
+_INITIAL_STATE = {"armed": False, "mode": "away"}
+
+
+class StoreSnapshot:
+    """
+    One published state of the store.
+
+    Snapshots are never mutated after construction (nor are the user dicts
+    they hold): a write builds a new one and swaps the store's reference, so
+    a reader that grabbed a snapshot sees both user indexes and the system
+    state as of the same write.
+    """
+
+    __slots__ = ("system_state", "users_by_name", "users_by_pin")
+
+    def __init__(
+        self,
+        system_state: dict[str, Any],
+        users_by_name: dict[str, dict[str, Any]],
+        users_by_pin: dict[str, dict[str, Any]],
+    ) -> None:
+        self.system_state = system_state
+        self.users_by_name = users_by_name
+        self.users_by_pin = users_by_pin
+
+    @classmethod
+    def from_dump(cls, dump: Optional[Dump]) -> StoreSnapshot:
+        """Snapshot of a backend's saved state (None: the initial state)."""
+        if dump is None:
+            return cls(dict(_INITIAL_STATE), {}, {})
+        users = [dict(user) for user in dump["users"]]
+        return cls(
+            dict(dump["state"]),
+            {user["name"].lower(): user for user in users},
+            {user["pin"]: user for user in users},
+        )
+
+    def to_dump(self) -> Dump:
+        return {
+            "state": dict(self.system_state),
+            "users": [dict(user) for user in self.users_by_name.values()],
+        }
+
+    def apply(self, event: dict[str, Any]) -> StoreSnapshot:
+        """The snapshot after one write event (see SecurityStore)."""
+        return self.replay((event,))
+
+    def replay(self, events: Iterable[dict[str, Any]]) -> StoreSnapshot:
+        """The snapshot after `events`, in order. The indexes are copied once."""
+        state = self.system_state
+        by_name = self.users_by_name
+        by_pin = self.users_by_pin
+        copied = False
+        for event in events:
+            kind = event["type"]
+            if kind == "arm":
+                state = {"armed": True, "mode": event["mode"]}
+                continue
+            if kind == "disarm":
+                state = {"armed": False, "mode": state["mode"]}
+                continue
+            if kind == "reset":
+                state, by_name, by_pin = dict(_INITIAL_STATE), {}, {}
+                copied = True
+                continue
+            if not copied:
+                by_name, by_pin = dict(by_name), dict(by_pin)
+                copied = True
+            if kind == "add_user":
+                user = event["user"]
+                # A name and a PIN each identify one user: whoever held either
+                # is replaced, from both indexes
+                for previous in (by_name.get(user["name"].lower()), by_pin.get(user["pin"])):
+                    if previous is not None:
+                        by_name.pop(previous["name"].lower(), None)
+                        by_pin.pop(previous["pin"], None)
+                by_name[user["name"].lower()] = user
+                by_pin[user["pin"]] = user
+            elif kind == "remove_user":
+                # Gone already when a reload replays it over another
+                # process's removal
+                user = by_name.pop(event["name"].lower(), None)
+                if user is not None:
+                    by_pin.pop(user["pin"], None)
+            else:
+                raise ValueError(f"unknown store event {kind!r}")
+        return StoreSnapshot(state, by_name, by_pin)
+
+
 class SecurityStore:
-    def __init__(self) -> None:
-        self.reset()
+    """
+    System state and users, served from memory.
+
+    Methods block (a write waits for its commit, and a read may ask a shared
+    backend whether to reload), so async routes call them on a worker
+    thread. Writes are serialized by one short lock and publish a
+    copy-on-write snapshot. Reads take no lock: they use whichever snapshot
+    is current.
+
+    Every write is an event -- {"type": "arm", "mode"}, {"type": "disarm"},
+    {"type": "add_user", "user"}, {"type": "remove_user", "name"} or
+    {"type": "reset"} -- applied to the snapshot and handed to the storage
+    backend in the same order. A write returns once the backend has made it
+    durable; readers may see it slightly before that. If the backend fails,
+    the snapshot is reloaded from it and the error propagates.
+
+    When other processes write the same backend (uvicorn --workers), the
+    snapshot is this process's read cache: reads and writes first ask the
+    backend whether it changed elsewhere, and reload it if so.
+    """
+
+    def __init__(self, backend: Optional[StorageBackend] = None) -> None:
+        self._lock = threading.Lock()
+        self.backend = backend or StorageBackend()
+        self._snapshot = self._load()
 
     def reset(self) -> None:
-        self._system_state: dict[str, Any] = {"armed": False, "mode": "away"}
-        self._users_by_name: dict[str, dict[str, Any]] = {}
-        self._users_by_pin: dict[str, dict[str, Any]] = {}
+        """Drop every user and disarm (in the backend too)."""
+        with self._lock:
+            commit = self._write({"type": "reset"})
+        self._wait(commit)
+
+    def close(self) -> None:
+        self.backend.close()
+
+    def snapshot(self) -> StoreSnapshot:
+        """The current state. Hold on to it to read several things consistently."""
+        if self.backend.stale():
+            with self._lock:
+                return self._refresh()
+        return self._snapshot
+
+    def _refresh(self) -> StoreSnapshot:
+        # Callers hold _lock
+        if self.backend.stale():
+            self._snapshot = self._load()
+            metrics.incr("store.reloads")
+        return self._snapshot
+
+    def _load(self) -> StoreSnapshot:
+        dump, events = self.backend.load()
+        return StoreSnapshot.from_dump(dump).replay(events)
+
+    def _write(self, event: dict[str, Any]) -> Optional[Commit]:
+        # Callers hold _lock
+        snapshot = self._refresh().apply(event)
+        commit = self.backend.write(event)
+        self._snapshot = snapshot
+        if self.backend.compaction_due():
+            self.backend.compact(snapshot.to_dump())
+        return commit
+
+    def _wait(self, commit: Optional[Commit]) -> None:
+        if commit is None:
+            return
+        try:
+            commit.wait()
+        except StorageError:
+            with self._lock:
+                self._snapshot = self._load()
+            raise
 
     # ---- System state ----
 
     def arm(self, mode: str = "away") -> dict[str, Any]:
-        self._system_state = {"armed": True, "mode": mode}
+        with self._lock:
+            commit = self._write({"type": "arm", "mode": mode})
+            state = self._snapshot.system_state
+        self._wait(commit)
         logger.info("System armed", extra={"endpoint": "arm-system"})
-        return dict(self._system_state)
+        return dict(state)
 
     def disarm(self) -> dict[str, Any]:
-        self._system_state = {"armed": False, "mode": self._system_state["mode"]}
+        with self._lock:
+            commit = self._write({"type": "disarm"})
+            state = self._snapshot.system_state
+        self._wait(commit)
         logger.info("System disarmed", extra={"endpoint": "disarm-system"})
-        return dict(self._system_state)
+        return dict(state)
 
     def get_state(self) -> dict[str, Any]:
-        return dict(self._system_state)
+        return dict(self.snapshot().system_state)
 
     # ---- Users ----
 
@@ -49,8 +216,9 @@ class SecurityStore:
             "end_time": end_time,
             "permissions": permissions,
         }
-        self._users_by_name[name.lower()] = user
-        self._users_by_pin[pin] = user
+        with self._lock:
+            commit = self._write({"type": "add_user", "user": user})
+        self._wait(commit)
         logger.info(
             "User added",
             extra={"endpoint": "add-user", "masked_pin": self.mask_pin(pin)},
@@ -60,31 +228,26 @@ class SecurityStore:
     def remove_user(
         self, name: Optional[str] = None, pin: Optional[str] = None
     ) -> Optional[dict[str, Any]]:
-        user: Optional[dict[str, Any]] = None
-        if name:
-            user = self._users_by_name.get(name.lower())
-        elif pin:
-            user = self._users_by_pin.get(pin)
-
-        if user is None:
-            return None
+        with self._lock:
+            current = self._refresh()
+            user: Optional[dict[str, Any]] = None
+            if name:
+                user = current.users_by_name.get(name.lower())
+            elif pin:
+                user = current.users_by_pin.get(pin)
 
-        self._users_by_name.pop(user["name"].lower(), None)
-        self._users_by_pin.pop(user["pin"], None)
+            if user is None:
+                return None
+            commit = self._write({"type": "remove_user", "name": user["name"]})
+        self._wait(commit)
         logger.info("User removed", extra={"endpoint": "remove-user"})
         return self._public_user(user)
 
     def list_users(self) -> list[dict[str, Any]]:
-        seen: set[str] = set()
-        result: list[dict[str, Any]] = []
-        for user in self._users_by_name.values():
-            if user["name"] not in seen:
-                seen.add(user["name"])
-                result.append(self._public_user(user))
-        return result
+        return [self._public_user(user) for user in self.snapshot().users_by_name.values()]
 
     def get_user_by_name(self, name: str) -> Optional[dict[str, Any]]:
-        user = self._users_by_name.get(name.lower())
+        user = self.snapshot().users_by_name.get(name.lower())
         return self._public_user(user) if user else None
 
     # ---- Helpers ----
@@ -101,5 +264,26 @@ class SecurityStore:
         return {**user, "pin": self.mask_pin(user["pin"])}
 
 
+def create_backend() -> StorageBackend:
+    """The backend STORE_BACKEND selects."""
+    kind = settings.STORE_BACKEND.strip().lower()
+    shared = kind == "redis" or (kind == "sqlite" and settings.STORE_SHARED)
+    if settings.WEB_CONCURRENCY > 1 and not shared:
+        # Each worker would hold its own alarm state
+        raise ValueError(
+            f"WEB_CONCURRENCY={settings.WEB_CONCURRENCY} needs a store the workers "
+            "share: STORE_BACKEND=redis, or sqlite with STORE_SHARED=true"
+        )
+    if kind == "memory":
+        return StorageBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(settings.STORE_PATH, shared=settings.STORE_SHARED)
+    if kind == "eventlog":
+        return EventLogBackend(settings.STORE_LOG_DIR, settings.STORE_SNAPSHOT_EVERY)
+    if kind == "redis":
+        return RedisBackend(connect_redis(settings.STORE_REDIS_URL), settings.STORE_REDIS_PREFIX)
+    raise ValueError(f"Unknown STORE_BACKEND {settings.STORE_BACKEND!r}")
+
+
 # Singleton store instance
-store = SecurityStore()
+store = SecurityStore(create_backend())
@@ -0,0 +1,134 @@
+"""
+Recovery time and sustained write rate of the event log store backend.
+
+    cd backend && python -m benchmarks.event_log [--events 2000000] [--writers 16]
+
+Builds a log of --events store writes (arms, disarms, user adds and
+removals over a pool of 1000 users) in a temporary directory, with a
+snapshot every --snapshot-every events, then times opening a store on it:
+from the latest snapshot plus the log tail, and by replaying the whole log
+(snapshot hidden). The write rate is measured with --writers threads calling
+the store for --seconds, each write waiting for its fsync, next to a single
+writer for comparison. Use --dir to benchmark a specific disk.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from app.metrics import metrics
+from app.storage.eventlog import EventLogBackend
+from app.store import SecurityStore
+
+_USERS = 1000
+
+
+def _event(rng: random.Random) -> dict:
+    roll = rng.random()
+    if roll < 0.3:
+        return {"type": "arm", "mode": rng.choice(("away", "home", "stay"))}
+    if roll < 0.6:
+        return {"type": "disarm"}
+    i = rng.randrange(_USERS)
+    user = {
+        "name": f"user{i}",
+        "pin": f"{i:04d}",
+        "start_time": None,
+        "end_time": None,
+        "permissions": ["arm", "disarm"],
+    }
+    return {"type": "add_user", "user": user}
+
+
+def build_log(directory: str, events: int, snapshot_every: int) -> None:
+    """Write `events` events as the store would, without waiting on each fsync."""
+    store = SecurityStore(EventLogBackend(directory, snapshot_every))
+    rng = random.Random(0)
+    commit = None
+    for _ in range(events):
+        event = _event(rng)
+        with store._lock:
+            if event["type"] == "add_user" and rng.random() < 0.3:
+                name = event["user"]["name"]
+                if name.lower() in store.snapshot().users_by_name:
+                    event = {"type": "remove_user", "name": name}
+            commit = store._write(event)
+    if commit is not None:
+        commit.wait()
+    store.close()
+
+
+def time_recovery(directory: str, snapshot_every: int) -> tuple[float, int]:
+    start = time.perf_counter()
+    store = SecurityStore(EventLogBackend(directory, snapshot_every))
+    elapsed = time.perf_counter() - start
+    users = len(store.list_users())
+    store.close()
+    return elapsed, users
+
+
+def time_writes(directory: str, writers: int, seconds: float) -> tuple[float, float]:
+    """(writes per second, mean writes per fsync) with `writers` threads."""
+    store = SecurityStore(EventLogBackend(directory, 0))
+    metrics.reset()
+    deadline = time.perf_counter() + seconds
+
+    def writer(worker: int) -> None:
+        i = 0
+        while time.perf_counter() < deadline:
+            store.add_user(f"w{worker}-{i % 100}", f"{worker:03d}{i % 100:03d}")
+            i += 1
+
+    threads = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    store.close()
+    writes = metrics.get("store.writes")
+    return writes / elapsed, writes / max(metrics.get("store.commits"), 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=2_000_000)
+    parser.add_argument("--snapshot-every", type=int, default=100_000)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--dir", default=None, help="parent directory for the logs")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="eventlog-bench-", dir=args.dir)
+    try:
+        log = os.path.join(root, "log")
+        start = time.perf_counter()
+        build_log(log, args.events, args.snapshot_every)
+        size = sum(os.path.getsize(os.path.join(log, name)) for name in os.listdir(log))
+        print(
+            f"built {args.events:,} events in {time.perf_counter() - start:.1f} s "
+            f"({size / 2**20:.0f} MiB)"
+        )
+
+        elapsed, users = time_recovery(log, args.snapshot_every)
+        print(f"recovery, snapshot + tail     {elapsed * 1000:9.1f} ms   ({users} users)")
+        os.rename(os.path.join(log, "snapshot.json"), os.path.join(root, "snapshot.json"))
+        elapsed, users = time_recovery(log, 0)
+        print(f"recovery, full replay         {elapsed * 1000:9.1f} ms   ({users} users)")
+
+        for writers in (1, args.writers):
+            rate, batch = time_writes(os.path.join(root, f"writes-{writers}"), writers, args.seconds)
+            print(
+                f"writes, {writers:>3} writer(s)          {rate:9.0f} /s     "
+                f"({batch:.1f} writes per fsync)"
+            )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Latency of temporary-user commands: dateparser per fragment vs. time_parser.
+
+    cd backend && python -m benchmarks.time_parsing [--runs 2000]
+
+Both columns time parse_command end to end. "before" swaps the time parser
+for a plain dateparser.parse per fragment, as extract_time_range used to do;
+"after" is the shipped path, reported cold (memo cleared before every call)
+and warm. dateparser's import and first-call setup are excluded.
+"""
+import argparse
+import statistics
+import time
+from typing import Callable
+
+from app.nlp import entity_extractor, time_parser
+from app.nlp.parser import parse_command
+
+COMMANDS = [
+    "add a temporary user Sarah, pin 5678 from today 5pm to Sunday 10am",
+    "add user Tom with pin 2468 from tomorrow at 9 to tomorrow 6pm",
+    "add guest user Ana pin 1357 from now to in 3 hours",
+    "add user Lee pin 9753 from 2026-10-20T08:00 to 2026-10-22T20:00",
+    "add user Max pin 8642 from next friday 8pm to sunday noon",
+]
+
+
+def _dateparser_only(phrase: str, now: object = None) -> object:
+    import dateparser  # type: ignore
+
+    return dateparser.parse(phrase)
+
+
+def _measure(
+    fn: Callable[[str], object], runs: int, before: Callable[[], None] = lambda: None
+) -> list[float]:
+    samples = []
+    for i in range(runs):
+        text = COMMANDS[i % len(COMMANDS)]
+        before()
+        start = time.perf_counter()
+        fn(text)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _report(label: str, samples: list[float]) -> None:
+    cuts = statistics.quantiles(samples, n=100)
+    print(f"{label:<28} p50 {cuts[49]:8.3f} ms   p99 {cuts[98]:8.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Pay imports and first-call setup outside the measurement
+    for text in COMMANDS:
+        _dateparser_only(text)
+        parse_command(text)
+
+    entity_extractor.parse_time = _dateparser_only
+    try:
+        _report("before: dateparser.parse", _measure(parse_command, args.runs))
+    finally:
+        entity_extractor.parse_time = time_parser.parse_time
+    _report("after: parse_command, cold", _measure(parse_command, args.runs, time_parser.clear_cache))
+    _report("after: parse_command, warm", _measure(parse_command, args.runs))
+
+
+if __name__ == "__main__":
+    main()
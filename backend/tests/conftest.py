@@ -1,7 +1,15 @@
 import pytest
 from fastapi.testclient import TestClient
 
+from app.config import settings
 from app.main import app
+from app.metrics import metrics
+from app.nlp.circuit_breaker import reset_breakers
+from app.nlp.llm_router import llm_router
+from app.nlp import rule_engine
+from app.nlp.parse_cache import parse_cache
+from app.nlp.rule_learner import reset_rule_learner
+from app.nlp.semantic_cache import reset_semantic_cache
 from app.store import store
 
 
@@ -16,3 +24,24 @@ def reset_store():
 @pytest.fixture
 def client():
     return TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def reset_caches(monkeypatch):
+    """Start each test with empty caches, zeroed counters and fresh LLM routing."""
+    parse_cache.clear()
+    metrics.reset()
+    reset_breakers()
+    llm_router.reset()
+    # No LLM cache file (tests that want one point it at tmp_path), and an
+    # in-memory semantic cache, so no test reuses another's LLM answers
+    monkeypatch.setattr(settings, "LLM_CACHE_PATH", "")
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_PATH", "")
+    reset_semantic_cache()
+    # Nothing learned in one test may reach the next one's rules
+    monkeypatch.setattr(settings, "LEARNED_RULES_PATH", "")
+    monkeypatch.setattr(rule_engine, "_snapshot", rule_engine._snapshot)
+    monkeypatch.setattr(rule_engine, "_learned", rule_engine._learned)
+    monkeypatch.setattr(rule_engine, "_file", rule_engine._file)
+    reset_rule_learner()
+    yield
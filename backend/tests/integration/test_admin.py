@@ -0,0 +1,94 @@
+import pytest
+
+from app.config import settings
+from app.nlp import rule_engine
+from app.nlp.normalize import NormalizedText
+from app.nlp.rule_learner import check_workers, get_rule_learner
+
+
+def test_rules_info(client):
+    r = client.get("/admin/rules")
+    assert r.status_code == 200
+    data = r.json()
+    assert data["ok"] is True
+    assert data["rules"]["version"] == rule_engine.get_rules().version
+    assert data["rules"]["count"] > 0
+
+
+def test_rules_reload(client):
+    original = rule_engine.get_rules()
+    try:
+        r = client.post("/admin/rules/reload")
+        assert r.status_code == 200
+        assert r.json()["rules"]["checksum"] == original.checksum
+    finally:
+        rule_engine._snapshot = original
+
+
+def test_rules_reload_invalid_file(client, tmp_path, monkeypatch):
+    bad = tmp_path / "rules.json"
+    bad.write_text('{"rules": [{"pattern": "(", "intent": "arm"}]}', encoding="utf-8")
+    monkeypatch.setattr(rule_engine.settings, "RULES_PATH", str(bad))
+    active = rule_engine.get_rules()
+    r = client.post("/admin/rules/reload")
+    assert r.status_code == 400
+    assert rule_engine.get_rules() is active
+
+
+def test_rules_reload_refused_with_several_workers(client, monkeypatch):
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 4)
+    active = rule_engine.get_rules()
+    assert client.post("/admin/rules/reload").status_code == 409
+    assert rule_engine.get_rules() is active
+
+
+def test_learned_rules_refused_with_several_workers(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 4)
+    with pytest.raises(ValueError, match="LEARNED_RULES_ENABLED=false"):
+        with TestClient(app):
+            pass
+    monkeypatch.setattr(settings, "LEARNED_RULES_ENABLED", False)
+    check_workers()
+
+
+def _learn(text, intent, times=5):
+    learner = get_rule_learner()
+    for _ in range(times):
+        entry = learner.observe(NormalizedText(text), intent)
+    return entry
+
+
+def test_learned_rules_review(client):
+    entry = _learn("batten down the hatches", "arm")
+    _learn("stand the guard down", "disarm", times=1)
+    r = client.get("/admin/learned-rules")
+    assert r.status_code == 200
+    data = r.json()
+    assert [e["id"] for e in data["entries"]] == [entry["id"]]
+    assert data["candidates"] == 1
+    assert client.get("/admin/rules").json()["rules"]["learned"] == 1
+
+
+def test_learned_rules_export(client):
+    _learn("batten down the hatches", "arm")
+    exported = client.get("/admin/learned-rules/export").json()
+    assert [rule["intent"] for rule in exported["rules"]] == ["arm"]
+    assert rule_engine.compile_rules(exported).rules
+
+
+def test_learned_rule_revoke(client):
+    entry = _learn("batten down the hatches", "arm")
+    r = client.delete(f"/admin/learned-rules/{entry['id']}")
+    assert r.status_code == 200
+    assert r.json()["entry"]["revoked"] is True
+    assert rule_engine.classify_intent("batten down the hatches") is None
+    assert client.delete("/admin/learned-rules/unknown").status_code == 404
+
+
+def test_learned_rules_disabled(client, monkeypatch):
+    monkeypatch.setattr(settings, "LEARNED_RULES_ENABLED", False)
+    assert client.get("/admin/learned-rules").status_code == 404
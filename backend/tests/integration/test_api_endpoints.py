@@ -1,3 +1,5 @@
+import threading
+
 import pytest
 
 
@@ -119,3 +121,30 @@ class TestListUsers:
         r = client.get("/api/list-users")
         for user in r.json()["users"]:
             assert "1111" not in user["pin"]
+
+
+class TestEventLoop:
+    async def test_store_calls_run_off_the_loop(self, monkeypatch):
+        from app.models import AddUserRequest, ArmRequest, RemoveUserRequest
+        from app.routers import api
+        from app.store import store
+
+        loop_thread = threading.current_thread()
+        threads = []
+
+        def recording(method):
+            def call(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return method(*args, **kwargs)
+
+            return call
+
+        for name in ("arm", "disarm", "add_user", "remove_user", "list_users"):
+            monkeypatch.setattr(store, name, recording(getattr(store, name)))
+        await api.arm_system(ArmRequest())
+        await api.disarm_system()
+        await api.add_user(AddUserRequest(name="Alice", pin="1234"))
+        await api.list_users()
+        await api.remove_user(RemoveUserRequest(name="Alice"))
+        assert len(threads) == 5
+        assert loop_thread not in threads
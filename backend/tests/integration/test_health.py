@@ -15,3 +15,18 @@ def test_healthz_correlation_id_generated(client):
 def test_healthz_correlation_id_echoed(client):
     r = client.get("/healthz", headers={"X-Correlation-ID": "test-abc-123"})
     assert r.headers.get("x-correlation-id") == "test-abc-123"
+
+
+def test_metrics_reports_parse_cache_counters(client):
+    client.post("/nl/execute", json={"text": "add user John with pin 4321"})
+    client.post("/nl/execute", json={"text": "add user Mike with pin 8765"})
+    data = client.get("/metrics").json()
+    assert data["ok"] is True
+    assert data["counters"]["parse_cache.misses"] == 1
+    assert data["counters"]["parse_cache.hits"] == 1
+    assert data["parse_cache"]["size"] == 1
+
+
+def test_metrics_reports_semantic_cache_size(client):
+    data = client.get("/metrics").json()
+    assert data["semantic_cache"] == {"size": 0, "max_size": 2000}
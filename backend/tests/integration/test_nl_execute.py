@@ -39,6 +39,14 @@ class TestNLExecute:
         assert r.status_code == 200
         assert r.json()["parsed"]["intent"] == "list_users"
 
+    def test_arm_extracts_only_mode(self, client):
+        r = client.post("/nl/execute", json={"text": "arm the system for John in stay mode"})
+        assert r.json()["parsed"]["entities"] == {"mode": "stay"}
+
+    def test_disarm_extracts_nothing(self, client):
+        r = client.post("/nl/execute", json={"text": "disarm the alarm from 9am to 5pm"})
+        assert r.json()["parsed"]["entities"] == {}
+
     def test_unknown_command_returns_error(self, client):
         r = client.post("/nl/execute", json={"text": "hello world"})
         assert r.status_code == 200
@@ -58,3 +66,53 @@ class TestNLExecute:
         assert "entities" in data["parsed"]
         assert "api" in data["parsed"]
         assert "source" in data["parsed"]
+
+
+class TestLatencyBudget:
+    @pytest.fixture
+    def budgets(self, monkeypatch):
+        from app.routers import nl
+
+        seen = []
+
+        async def fake_parse(text, timeout=None):
+            seen.append(timeout)
+            return {"text": text, "intent": None, "entities": {}, "api": None, "source": "rule"}
+
+        monkeypatch.setattr(nl, "parse_command_async", fake_parse)
+        return seen
+
+    def test_header_sets_budget(self, client, budgets):
+        r = client.post(
+            "/nl/execute", json={"text": "do a barrel roll"}, headers={"X-Latency-Budget-Ms": "250"}
+        )
+        assert r.json()["error"] == "Could not understand command. Try rephrasing."
+        assert 0 < budgets[0] <= 0.25
+
+    def test_setting_is_default_budget(self, client, budgets, monkeypatch):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "NL_LATENCY_BUDGET_MS", 1500)
+        client.post("/nl/execute", json={"text": "do a barrel roll"})
+        client.post(
+            "/nl/execute", json={"text": "do a barrel roll"}, headers={"X-Latency-Budget-Ms": "soon"}
+        )
+        assert all(1.4 < budget <= 1.5 for budget in budgets)
+
+    def test_time_since_arrival_charged(self):
+        import time
+        from types import SimpleNamespace
+
+        from app.routers import nl
+
+        request = SimpleNamespace(
+            headers={"X-Latency-Budget-Ms": "500"},
+            state=SimpleNamespace(received_at=time.monotonic() - 0.3),
+        )
+        assert 0.15 < nl._latency_budget(request) <= 0.2
+        request.state.received_at -= 1
+        assert nl._latency_budget(request) == 0.0
+
+    def test_no_budget_by_default(self, client, budgets):
+        client.post("/nl/execute", json={"text": "do a barrel roll"})
+        assert budgets == [None]
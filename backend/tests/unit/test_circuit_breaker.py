@@ -0,0 +1,83 @@
+from app.metrics import metrics
+from app.nlp.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _breaker(clock, p95_ms=0):
+    return CircuitBreaker(
+        "test", window=10, min_calls=4, error_rate=0.5, p95_ms=p95_ms, cooldown=30, clock=clock
+    )
+
+
+class TestCircuitBreaker:
+    def test_stays_closed_below_min_calls(self):
+        breaker = _breaker(Clock())
+        for _ in range(3):
+            breaker.record(False, 10)
+        assert breaker.state == CLOSED
+        assert breaker.allow()
+
+    def test_opens_on_error_rate(self):
+        breaker = _breaker(Clock())
+        for ok in (True, False, True, False):
+            breaker.record(ok, 10)
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+        assert metrics.get("test.breaker_opened") == 1
+        assert metrics.get("test.breaker_rejected") == 1
+
+    def test_opens_on_p95_latency(self):
+        breaker = _breaker(Clock(), p95_ms=1000)
+        for latency in (100, 100, 100, 5000):
+            breaker.record(True, latency)
+        assert breaker.state == OPEN
+
+    def test_healthy_calls_keep_it_closed(self):
+        breaker = _breaker(Clock(), p95_ms=1000)
+        for _ in range(50):
+            breaker.record(True, 100)
+        breaker.record(False, 100)
+        assert breaker.state == CLOSED
+
+    def test_half_open_probe_success_closes(self):
+        clock = Clock()
+        breaker = _breaker(clock)
+        for _ in range(4):
+            breaker.record(False, 10)
+        clock.now = 31
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+        # Only one probe at a time
+        assert not breaker.allow()
+        breaker.record(True, 10)
+        assert breaker.state == CLOSED
+        assert breaker.allow()
+
+    def test_half_open_probe_failure_reopens(self):
+        clock = Clock()
+        breaker = _breaker(clock)
+        for _ in range(4):
+            breaker.record(False, 10)
+        clock.now = 31
+        assert breaker.allow()
+        breaker.record(False, 10)
+        assert breaker.state == OPEN
+        clock.now = 40
+        assert not breaker.allow()
+
+    def test_lost_probe_replaced_after_cooldown(self):
+        clock = Clock()
+        breaker = _breaker(clock)
+        for _ in range(4):
+            breaker.record(False, 10)
+        clock.now = 31
+        assert breaker.allow()
+        clock.now = 62
+        assert breaker.allow()
@@ -12,6 +12,10 @@ class TestLLMEnabled:
         # Reload settings to pick up monkeypatched env
         import importlib
         import app.config as cfg_module
+        # Put the original settings object back afterwards: everything else
+        # (and the conftest fixtures) holds on to it
+        monkeypatch.setattr(cfg_module, "Settings", cfg_module.Settings)
+        monkeypatch.setattr(cfg_module, "settings", cfg_module.settings)
         importlib.reload(cfg_module)
         assert cfg_module.Settings().llm_enabled() is True
 
@@ -51,3 +55,32 @@ class TestLLMEnabled:
         s.GITHUB_TOKEN = None
         assert s.llm_enabled() is False
     
+
+    def test_providers_list_in_order(self):
+        from app.config import Settings
+        s = Settings()
+        s.LLM_PROVIDERS = "github, azure,github"
+        s.GITHUB_TOKEN = "ghp_test"
+        s.AZURE_OPENAI_ENDPOINT = "https://my.openai.azure.com"
+        assert s.llm_providers() == ["github", "azure"]
+
+    def test_providers_list_skips_unconfigured(self):
+        from app.config import Settings
+        s = Settings()
+        s.LLM_PROVIDERS = "azure,github"
+        s.GITHUB_TOKEN = "ghp_test"
+        s.AZURE_OPENAI_ENDPOINT = None
+        assert s.llm_providers() == ["github"]
+        assert s.llm_enabled() is True
+
+
+class TestClassifierSetting:
+
+    def test_classifier_off_by_default(self, monkeypatch):
+        monkeypatch.delenv("CLASSIFIER_ENABLED", raising=False)
+        import importlib
+        import app.config as cfg_module
+        monkeypatch.setattr(cfg_module, "Settings", cfg_module.Settings)
+        monkeypatch.setattr(cfg_module, "settings", cfg_module.settings)
+        importlib.reload(cfg_module)
+        assert cfg_module.Settings.CLASSIFIER_ENABLED is False
@@ -6,7 +6,9 @@ from app.nlp.entity_extractor import (
     extract_permissions,
     extract_pin,
     extract_time_range,
+    scan_entities,
 )
+from app.nlp.normalize import NormalizedText
 
 
 class TestExtractPin:
@@ -87,6 +89,10 @@ class TestExtractTimeRange:
         assert start is not None
         assert end is not None
 
+    def test_weekday_end_is_in_the_future(self):
+        start, end = extract_time_range("add user Sarah from now to Sunday 10am")
+        assert end > start
+
     def test_time_range_iso_format(self):
         start, end = extract_time_range("from today 9am to tomorrow 6pm")
         # ISO 8601 format check
@@ -110,3 +116,50 @@ class TestExtractPermissions:
         )
         perms = extract_permissions(text)
         assert set(perms) == {"arm", "disarm"}
+
+
+class TestSharedNormalizedText:
+    def test_extractors_accept_normalized_text(self):
+        nt = NormalizedText("add user John with pin 4321 in STAY mode")
+        assert extract_name(nt) == "John"
+        assert extract_pin(nt) == "4321"
+        assert extract_mode(nt) == "stay"
+        assert set(extract_permissions(nt)) == {"arm", "disarm"}
+
+    def test_fullwidth_pin_normalized(self):
+        assert extract_pin("pin １２３４") == "1234"
+
+    def test_permissions_arm_only(self):
+        assert extract_permissions("she can arm the system, pin 1234") == ["arm"]
+
+
+class TestScanEntities:
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "add user John with pin 4321 in STAY mode",
+            "My mother-in-law is coming, make sure she can arm and disarm our system using passcode 1234",
+            "Add a temporary user Sarah, pin 5678 from today 5pm to Sunday 10am",
+            "remove user John",
+            "arm the system in away mode",
+            "the sister needs access, pin 2468",
+        ],
+    )
+    def test_matches_individual_extractors(self, text):
+        found = scan_entities(text, ("name", "pin", "mode", "permissions"))
+        assert found == {
+            "name": extract_name(text),
+            "pin": extract_pin(text),
+            "mode": extract_mode(text),
+            "permissions": extract_permissions(text),
+        }
+
+    def test_only_requested_fields(self):
+        assert scan_entities("arm the system in stay mode", ("mode",)) == {"mode": "stay"}
+        assert scan_entities("disarm with pin 1234", ()) == {}
+
+    def test_keyword_pin_beats_earlier_bare_digits(self):
+        assert scan_entities("user 12345 pin 6789", ("pin",)) == {"pin": "6789"}
+
+    def test_time_range_without_range_phrase(self):
+        assert extract_time_range("arm the system") == (None, None)
@@ -0,0 +1,143 @@
+import json
+import statistics
+import time
+
+import pytest
+
+from app.config import settings
+from app.metrics import metrics
+from app.nlp import intent_classifier, parser
+from app.nlp.intent_classifier import IntentClassifier, classify_local, get_model
+from app.nlp.normalize import NormalizedText
+from app.nlp.train_classifier import DEFAULT_CORPUS_PATH, corpus_checksum, load_corpus
+
+
+@pytest.fixture(autouse=True)
+def bundled_model(monkeypatch):
+    monkeypatch.setattr(settings, "CLASSIFIER_ENABLED", True)
+    monkeypatch.setattr(settings, "CLASSIFIER_MODEL_PATH", "")
+    monkeypatch.setattr(settings, "CLASSIFIER_THRESHOLD", 0.9)
+
+
+class TestIntentClassifier:
+    @pytest.mark.parametrize(
+        "text,intent",
+        [
+            ("could you please switch on the alarm", "arm"),
+            ("kindly shut the alarm off", "disarm"),
+            ("give Kate a code 1234", "add_user"),
+            ("erase Bob from the system", "remove_user"),
+            ("show me who has a code", "list_users"),
+        ],
+    )
+    def test_paraphrases_outside_corpus(self, text, intent):
+        assert classify_local(text) == intent
+
+    @pytest.mark.parametrize(
+        "text", ["what's the weather like", "set an alarm for 8am", "turn on the bedroom lights"]
+    )
+    def test_unrelated_commands_rejected(self, text):
+        assert classify_local(text) is None
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            # Questions, statements and bare verbs: the reject class
+            "the alarm went off",
+            "is the alarm off?",
+            "is the alarm on?",
+            "the house is on fire",
+            "stop",
+            "go",
+            "hold on",
+            "leave it",
+            "let me in",
+        ],
+    )
+    def test_out_of_domain_rejected(self, text):
+        assert classify_local(text) is None
+
+    def test_below_threshold_left_to_llm(self, monkeypatch):
+        monkeypatch.setattr(settings, "CLASSIFIER_THRESHOLD", 1.01)
+        assert classify_local("kindly shut the alarm off") is None
+        assert metrics.get("classifier.misses") == 1
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "CLASSIFIER_ENABLED", False)
+        assert classify_local("kindly shut the alarm off") is None
+
+    def test_missing_model_disables_tier(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(settings, "CLASSIFIER_MODEL_PATH", str(tmp_path / "missing.json"))
+        assert get_model() is None
+        assert classify_local("kindly shut the alarm off") is None
+
+    def test_prediction_memoized_on_normalized_text(self, monkeypatch):
+        nt = NormalizedText("kindly shut the alarm off")
+        assert classify_local(nt) == "disarm"
+        monkeypatch.setattr(intent_classifier, "features", lambda nt: pytest.fail("recomputed"))
+        assert classify_local(nt) == "disarm"
+
+    def test_inference_under_a_millisecond(self):
+        model = get_model()
+        texts = [f"could you please switch the security alarm on for night {i}" for i in range(300)]
+        samples = []
+        for text in texts:
+            start = time.perf_counter()
+            model.predict(NormalizedText(text))
+            samples.append(time.perf_counter() - start)
+        assert statistics.median(samples) < 0.001
+
+
+class TestTraining:
+    def test_round_trip(self):
+        examples = [("arm the house", "arm"), ("disarm the house", "disarm"), ("hello", None)] * 3
+        model = IntentClassifier.train(examples, epochs=10)
+        restored = IntentClassifier.from_json(json.loads(json.dumps(model.to_json())))
+        nt = NormalizedText("arm the house")
+        assert restored.labels == ["arm", "disarm", "none"]
+        assert restored.predict(nt) == model.predict(nt)
+        assert model.predict(nt)[0] == "arm"
+        assert model.predict(NormalizedText("hello"))[0] is None
+
+    def test_bundled_model_matches_corpus(self):
+        """Retrain (python -m app.nlp.train_classifier) after editing the corpus."""
+        examples = load_corpus(DEFAULT_CORPUS_PATH, [])
+        assert get_model().checksum == corpus_checksum(examples)
+
+
+class TestParserTier:
+    def test_classifier_skips_llm(self, monkeypatch):
+        monkeypatch.setattr(parser, "llm_parse", lambda *a, **k: pytest.fail("LLM called"))
+        result = parser.parse_command("could you please switch on the alarm")
+        assert result["source"] == "classifier"
+        assert result["api"]["path"] == "/api/arm-system"
+
+    def test_entities_extracted_for_classified_intent(self, monkeypatch):
+        monkeypatch.setattr(parser, "llm_parse", lambda *a, **k: pytest.fail("LLM called"))
+        result = parser.parse_command("give Kate a code 1234")
+        assert result["source"] == "classifier"
+        assert result["api"]["payload"]["pin"] == "1234"
+
+    async def test_async_path(self, monkeypatch):
+        async def llm_parse_async(*args, **kwargs):
+            pytest.fail("LLM called")
+
+        monkeypatch.setattr(parser, "llm_parse_async", llm_parse_async)
+        result = await parser.parse_command_async("kindly shut the alarm off")
+        assert (result["intent"], result["source"]) == ("disarm", "classifier")
+
+    @pytest.mark.parametrize(
+        "text", ["the alarm went off", "is the alarm on?", "stop", "let me in", "hold on"]
+    )
+    def test_out_of_domain_stays_unparsed(self, monkeypatch, text):
+        monkeypatch.setattr(parser, "llm_parse", lambda text, timeout=None: None)
+        result = parser.parse_command(text)
+        assert result["intent"] is None
+        assert result["api"] is None
+
+    def test_unsure_falls_through_to_llm(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(parser, "llm_parse", lambda text, timeout=None: calls.append(text))
+        result = parser.parse_command("what's the weather like")
+        assert calls == ["what's the weather like"]
+        assert result["intent"] is None
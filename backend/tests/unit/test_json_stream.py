@@ -0,0 +1,48 @@
+import pytest
+
+from app.nlp.json_stream import PENDING, FieldScanner
+
+
+def _scan(text, size=1):
+    """(value, characters consumed when it became known)."""
+    scanner = FieldScanner("intent")
+    for i in range(0, len(text), size):
+        value = scanner.feed(text[i:i + size])
+        if value is not PENDING:
+            return value, i + size
+    return PENDING, len(text)
+
+
+class TestFieldScanner:
+    def test_string_known_before_object_ends(self):
+        text = '{"intent":"arm","entities":{"mode":"away"}}'
+        value, consumed = _scan(text)
+        assert value == "arm"
+        assert consumed == len('{"intent":"arm"')
+
+    def test_null(self):
+        assert _scan('{ "intent" : null , "entities": {}}', size=3)[0] is None
+
+    @pytest.mark.parametrize("size", [1, 2, 5, 100])
+    def test_chunk_boundaries(self, size):
+        assert _scan('{"entities":{},"intent":"list_users"}', size)[0] == "list_users"
+
+    def test_nested_field_ignored(self):
+        text = '{"entities":{"intent":"x","tags":["}",{"a":1}]},"intent":"disarm"}'
+        assert _scan(text)[0] == "disarm"
+
+    def test_field_name_as_value_ignored(self):
+        assert _scan('{"name":"intent","intent":"disarm"}')[0] == "disarm"
+
+    def test_escapes_decoded(self):
+        assert _scan(r'{"intent":"a\"bé"}')[0] == 'a"bé'
+
+    def test_other_literals_before_field(self):
+        assert _scan('{"n":12,"ok":true,"intent":"arm"}')[0] == "arm"
+
+    def test_non_string_value_stays_pending(self):
+        assert _scan('{"intent":{"x":1},"y":"z"}')[0] is PENDING
+        assert _scan('{"intent":7}')[0] is PENDING
+
+    def test_missing_field_stays_pending(self):
+        assert _scan('{"entities":{}}')[0] is PENDING
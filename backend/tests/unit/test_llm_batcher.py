@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app.metrics import metrics
+from app.nlp.llm_batcher import LLMBatcher
+
+
+def _recorder(results=None):
+    batches = []
+
+    async def call_batch(texts, deadline):
+        batches.append(texts)
+        await asyncio.sleep(0)
+        return results(texts) if results else [t.upper() for t in texts]
+
+    return batches, call_batch
+
+
+class TestLLMBatcher:
+    async def test_concurrent_submissions_share_a_batch(self):
+        batches, call_batch = _recorder()
+        batcher = LLMBatcher(call_batch, max_size=10, max_wait=0.01)
+        results = await asyncio.gather(*(batcher.submit(t) for t in ("a", "b", "c")))
+        assert results == ["A", "B", "C"]
+        assert batches == [["a", "b", "c"]]
+        assert metrics.get("llm.batches") == 1
+        assert metrics.get("llm.batched_items") == 3
+
+    async def test_flushes_at_max_size(self):
+        batches, call_batch = _recorder()
+        batcher = LLMBatcher(call_batch, max_size=2, max_wait=10)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(t) for t in "abcd")), timeout=1
+        )
+        assert results == ["A", "B", "C", "D"]
+        assert batches == [["a", "b"], ["c", "d"]]
+
+    async def test_flushes_after_max_wait(self):
+        batches, call_batch = _recorder()
+        batcher = LLMBatcher(call_batch, max_size=10, max_wait=0.01)
+        assert await batcher.submit("a") == "A"
+        assert await batcher.submit("b") == "B"
+        assert batches == [["a"], ["b"]]
+
+    async def test_item_exception_only_reaches_its_caller(self):
+        _, call_batch = _recorder(lambda texts: [ValueError(t) if t == "b" else t for t in texts])
+        batcher = LLMBatcher(call_batch, max_size=10, max_wait=0.01)
+        results = await asyncio.gather(
+            *(batcher.submit(t) for t in "abc"), return_exceptions=True
+        )
+        assert results[0] == "a" and results[2] == "c"
+        assert isinstance(results[1], ValueError)
+
+    async def test_batch_failure_reaches_every_caller(self):
+        async def broken(texts, deadline):
+            raise TimeoutError("slow provider")
+
+        batcher = LLMBatcher(broken, max_size=10, max_wait=0.01)
+        results = await asyncio.gather(
+            *(batcher.submit(t) for t in "ab"), return_exceptions=True
+        )
+        assert all(isinstance(r, TimeoutError) for r in results)
+
+    async def test_cancelled_caller_does_not_break_batch(self):
+        _, call_batch = _recorder()
+        batcher = LLMBatcher(call_batch, max_size=10, max_wait=0.01)
+        hasty = asyncio.ensure_future(batcher.submit("a"))
+        patient = asyncio.ensure_future(batcher.submit("b"))
+        await asyncio.sleep(0)
+        hasty.cancel()
+        assert await patient == "B"
+        with pytest.raises(asyncio.CancelledError):
+            await hasty
+
+    async def test_batch_gets_the_latest_deadline(self):
+        deadlines = []
+
+        async def call_batch(texts, deadline):
+            deadlines.append(deadline)
+            return texts
+
+        batcher = LLMBatcher(call_batch, max_size=10, max_wait=0.01)
+        await asyncio.gather(batcher.submit("a", 5.0), batcher.submit("b", 7.0))
+        await asyncio.gather(batcher.submit("a", 5.0), batcher.submit("b"))
+        assert deadlines == [7.0, None]
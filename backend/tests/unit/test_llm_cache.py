@@ -0,0 +1,175 @@
+import sqlite3
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.metrics import metrics
+from app.nlp import llm_fallback
+from app.nlp.llm_cache import NEGATIVE, LLMCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = LLMCache(str(tmp_path / "llm.sqlite3"), ttl=60, negative_ttl=10, max_entries=100)
+    yield c
+    c.close()
+
+
+def _key(text):
+    return LLMCache.key(text, "github", "openai/gpt-4o", 1)
+
+
+class TestLLMCache:
+    def test_round_trip(self, cache):
+        text = "let the plumber in, code 4321"
+        result = {"intent": "add_user", "entities": {"name": "Plumber", "pin": "4321"}}
+        cache.put(_key(text), text, result)
+        assert cache.get(_key(text), text) == result
+
+    def test_key_normalizes_whitespace_and_width(self):
+        assert _key("let  the plumber in ") == _key("let the plumber in")
+        assert _key("code １２３４") == _key("code 1234")
+        assert _key("x") != LLMCache.key("x", "github", "openai/gpt-4o", 2)
+
+    def test_pin_not_stored(self, cache):
+        text = "let the plumber in, code 4321"
+        cache.put(_key(text), text, {"intent": "add_user", "entities": {"pin": "4321"}})
+        rows = sqlite3.connect(cache.path).execute("SELECT key, result FROM llm_cache").fetchall()
+        assert "4321" not in repr(rows)
+
+    def test_pin_not_in_text_not_cached(self, cache):
+        text = "code is one two three four"
+        cache.put(_key(text), text, {"intent": "add_user", "entities": {"pin": "1234"}})
+        assert cache.get(_key(text), text) is None
+
+    def test_negative_entry(self, cache):
+        cache.put(_key("blah"), "blah", None)
+        assert cache.get(_key("blah"), "blah") is NEGATIVE
+        assert metrics.get("llm_cache.negative_hits") == 1
+
+    def test_expiry(self, cache, monkeypatch):
+        cache.put(_key("blah"), "blah", None)
+        later = time.time() + 11
+        monkeypatch.setattr(time, "time", lambda: later)
+        assert cache.get(_key("blah"), "blah") is None
+
+    def test_size_eviction_keeps_most_recent(self, tmp_path):
+        cache = LLMCache(str(tmp_path / "small.sqlite3"), ttl=60, negative_ttl=60, max_entries=2)
+        for text in ("one", "two", "three"):
+            cache.put(_key(text), text, None)
+            time.sleep(0.01)
+        assert cache.get(_key("one"), "one") is None
+        assert cache.get(_key("three"), "three") is NEGATIVE
+        cache.close()
+
+    def test_eviction_batched_past_a_tenth_over(self, tmp_path):
+        cache = LLMCache(str(tmp_path / "small.sqlite3"), ttl=60, negative_ttl=60, max_entries=10)
+        count = lambda: sqlite3.connect(cache.path).execute(
+            "SELECT COUNT(*) FROM llm_cache"
+        ).fetchone()[0]
+        for i in range(11):
+            cache.put(_key(str(i)), str(i), None)
+        assert count() == 11
+        cache.put(_key("11"), "11", None)
+        assert count() == 10
+        cache.close()
+
+    def test_hits_do_not_write(self, cache):
+        cache.put(_key("one"), "one", None)
+        used_at = lambda: sqlite3.connect(cache.path).execute(
+            "SELECT used_at FROM llm_cache WHERE key = ?", (_key("one"),)
+        ).fetchone()[0]
+        stored = used_at()
+        time.sleep(0.01)
+        assert cache.get(_key("one"), "one") is NEGATIVE
+        assert used_at() == stored
+        # Written with the next put
+        cache.put(_key("two"), "two", None)
+        assert used_at() > stored
+
+    def test_used_at_indexed(self, cache):
+        cache.put(_key("one"), "one", None)
+        plan = sqlite3.connect(cache.path).execute(
+            "EXPLAIN QUERY PLAN SELECT key FROM llm_cache ORDER BY used_at DESC"
+        ).fetchall()
+        assert "llm_cache_used_at" in repr(plan)
+
+    def test_survives_reopen(self, cache):
+        cache.put(_key("blah"), "blah", None)
+        cache.close()
+        reopened = LLMCache(cache.path, ttl=60, negative_ttl=10, max_entries=100)
+        assert reopened.get(_key("blah"), "blah") is NEGATIVE
+        reopened.close()
+
+    def test_times_re_resolved_on_hit(self, cache):
+        text = "let Bo in from today 5pm to tomorrow 6pm"
+        stale = {"intent": "add_user", "entities": {"start_time": "2000-01-01T17:00:00"}}
+        cache.put(_key(text), text, stale)
+        hit = cache.get(_key(text), text)
+        assert hit["entities"]["start_time"] != "2000-01-01T17:00:00"
+        # Resolved as the LLM would: against the UTC clock, in UTC
+        today = datetime.now(timezone.utc).date().isoformat()
+        assert hit["entities"]["start_time"] == f"{today}T17:00:00+00:00"
+
+    def test_times_without_range_phrase_not_cached(self, cache):
+        text = "let Bo in until the weekend"
+        cache.put(_key(text), text, {"intent": "add_user", "entities": {"end_time": "x"}})
+        assert cache.get(_key(text), text) is None
+
+
+class TestLLMParseCaching:
+    @pytest.fixture
+    def llm(self, monkeypatch, tmp_path):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "LLM_PROVIDER", "github")
+        monkeypatch.setattr(settings, "GITHUB_TOKEN", "token")
+        monkeypatch.setattr(settings, "LLM_CACHE_PATH", str(tmp_path / "llm.sqlite3"))
+        calls = []
+
+        def fake_call(text, timeout=None, provider=None):
+            calls.append(text)
+            if "garbage" in text:
+                return {"intent": None, "entities": {}}
+            return {"intent": "disarm", "entities": {}}
+
+        monkeypatch.setattr(llm_fallback, "_call_llm", fake_call)
+        return calls
+
+    def test_second_call_served_from_cache(self, llm):
+        assert "cached" not in llm_fallback.llm_parse("let me in please")
+        replayed = llm_fallback.llm_parse("let me in please")
+        assert (replayed["intent"], replayed["cached"]) == ("disarm", True)
+        assert len(llm) == 1
+
+    def test_unclassifiable_cached_negatively(self, llm):
+        assert llm_fallback.llm_parse("garbage input")["intent"] is None
+        assert llm_fallback.llm_parse("garbage input") is None
+        assert len(llm) == 1
+
+    def test_provider_errors_not_cached(self, llm, monkeypatch):
+        def broken(text, timeout=None, provider=None):
+            raise TimeoutError("provider timed out")
+
+        monkeypatch.setattr(llm_fallback, "_call_llm", broken)
+        assert llm_fallback.llm_parse("let me in please") is None
+        monkeypatch.setattr(llm_fallback, "_call_llm", lambda text, timeout=None, provider=None: {"intent": "disarm"})
+        assert llm_fallback.llm_parse("let me in please") == {"intent": "disarm"}
+
+    def test_empty_or_malformed_replies_not_cached(self, llm, monkeypatch):
+        replies = iter(["", "{not json", '{"intent": "disarm", "entities": {}}'])
+
+        def glitchy(text, timeout=None, provider=None):
+            llm.append(text)
+            message = SimpleNamespace(content=next(replies))
+            return llm_fallback._decode(
+                SimpleNamespace(choices=[SimpleNamespace(message=message)]), "github", 0.0
+            )
+
+        monkeypatch.setattr(llm_fallback, "_call_llm", glitchy)
+        assert llm_fallback.llm_parse("let me in please") is None
+        assert llm_fallback.llm_parse("let me in please") is None
+        assert llm_fallback.llm_parse("let me in please")["intent"] == "disarm"
+        assert len(llm) == 3
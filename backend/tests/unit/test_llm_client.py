@@ -0,0 +1,95 @@
+import httpx
+import pytest
+
+from app.nlp import llm_client
+
+
+@pytest.fixture
+def github(monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "LLM_PROVIDER", "github")
+    monkeypatch.setattr(settings, "GITHUB_TOKEN", "token")
+    monkeypatch.setattr(settings, "GITHUB_MODEL", "openai/gpt-4o")
+    monkeypatch.setattr(llm_client, "_clients", {})
+    return settings
+
+
+class TestPooledClient:
+    def test_client_reused(self, github):
+        first, model = llm_client.get_llm_client()
+        second, _ = llm_client.get_llm_client()
+        assert first is second
+        assert model == "openai/gpt-4o"
+
+    def test_one_client_per_provider(self, github, monkeypatch):
+        monkeypatch.setattr(github, "AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+        monkeypatch.setattr(github, "AZURE_OPENAI_API_KEY", "key")
+        monkeypatch.setattr(github, "AZURE_OPENAI_DEPLOYMENT", "gpt-4o-mini")
+        monkeypatch.setattr(github, "LLM_PROVIDERS", "azure,github")
+        primary, model = llm_client.get_llm_client()
+        secondary, _ = llm_client.get_llm_client("github")
+        assert model == "gpt-4o-mini"
+        assert primary is not secondary
+        assert llm_client.get_llm_model("github") == "openai/gpt-4o"
+
+    def test_rebuilt_when_config_changes(self, github, monkeypatch):
+        first, _ = llm_client.get_llm_client()
+        monkeypatch.setattr(github, "GITHUB_MODEL", "openai/gpt-4o-mini")
+        second, model = llm_client.get_llm_client()
+        assert first is not second
+        assert model == "openai/gpt-4o-mini"
+
+    def test_pool_uses_configured_timeout(self, github, monkeypatch):
+        monkeypatch.setattr(github, "LLM_TIMEOUT", 7)
+        _, _, http_client = llm_client._pooled_client(asynchronous=False)
+        assert isinstance(http_client, httpx.Client)
+        assert http_client.timeout == httpx.Timeout(7)
+
+    def test_http2_without_h2_falls_back(self, github, monkeypatch):
+        monkeypatch.setattr(github, "LLM_HTTP2", True)
+        client, _ = llm_client.get_llm_client()
+        assert client is not None
+
+    def test_azure_gets_timeout(self, github, monkeypatch):
+        monkeypatch.setattr(github, "LLM_PROVIDER", "azure")
+        monkeypatch.setattr(github, "AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+        monkeypatch.setattr(github, "AZURE_OPENAI_API_KEY", "key")
+        monkeypatch.setattr(github, "LLM_TIMEOUT", 5)
+        client, _ = llm_client.get_llm_client()
+        assert client.timeout == 5
+
+    async def test_async_client_reused_on_same_loop(self, github):
+        first, _ = llm_client.get_async_llm_client()
+        second, _ = llm_client.get_async_llm_client()
+        assert first is second
+
+
+class TestWarmUp:
+    async def test_opens_requested_connections(self, github, monkeypatch):
+        seen = []
+
+        def handler(request):
+            seen.append(request.url.host)
+            return httpx.Response(404)
+
+        monkeypatch.setattr(
+            llm_client,
+            "_build_http_client",
+            lambda settings, asynchronous: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+        assert await llm_client.warm_up_llm_client(3) == 3
+        assert seen == ["models.github.ai"] * 3
+        await llm_client.close_llm_clients()
+        assert llm_client._clients == {}
+
+    async def test_failures_are_not_fatal(self, github, monkeypatch):
+        def handler(request):
+            raise httpx.ConnectError("no route")
+
+        monkeypatch.setattr(
+            llm_client,
+            "_build_http_client",
+            lambda settings, asynchronous: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+        assert await llm_client.warm_up_llm_client(2) == 0
@@ -0,0 +1,167 @@
+import asyncio
+import math
+
+import pytest
+
+from app.metrics import metrics
+from app.nlp.circuit_breaker import CircuitOpenError, get_breaker
+from app.nlp.llm_router import ProviderStats, call_routed, call_routed_async, llm_router
+
+
+def _observe(provider, latency_ms, times=10, ok=True):
+    for _ in range(times):
+        llm_router.record(provider, ok, latency_ms)
+
+
+class TestProviderStats:
+    def test_ewma_latency(self):
+        stats = ProviderStats(alpha=0.5)
+        assert stats.cost() == math.inf
+        stats.record(True, 100)
+        stats.record(True, 200)
+        assert stats.latency_ms == 150
+
+    def test_errors_inflate_cost(self):
+        healthy, flaky = ProviderStats(alpha=0.5), ProviderStats(alpha=0.5)
+        for stats in (healthy, flaky):
+            stats.record(True, 100)
+        flaky.record(False, 5)
+        assert flaky.cost() > healthy.cost()
+
+    def test_p90_needs_samples(self):
+        stats = ProviderStats(alpha=0.2)
+        for latency in (10, 20, 30, 40):
+            stats.record(True, latency)
+        assert stats.p90() is None
+        for latency in range(50, 110, 10):
+            stats.record(True, latency)
+        assert stats.p90() == 90
+
+
+class TestOrder:
+    def test_configured_order_before_observations(self):
+        assert llm_router.order(["azure", "github"]) == ["azure", "github"]
+
+    def test_observed_provider_ahead_of_unobserved(self):
+        _observe("github", 200)
+        assert llm_router.order(["azure", "github"]) == ["github", "azure"]
+
+    def test_faster_provider_first(self):
+        _observe("azure", 900)
+        _observe("github", 200)
+        assert llm_router.order(["azure", "github"]) == ["github", "azure"]
+
+    def test_hedge_delay_floored(self, monkeypatch):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY_MS", 100)
+        assert llm_router.hedge_delay("azure") is None
+        _observe("azure", 20)
+        assert llm_router.hedge_delay("azure") == 0.1
+
+
+class TestCallRouted:
+    def test_fails_over_on_error(self):
+        calls = []
+
+        def call(provider, remaining):
+            calls.append(provider)
+            if provider == "azure":
+                raise TimeoutError("slow")
+            return {"intent": "disarm"}
+
+        assert call_routed(["azure", "github"], call) == {"intent": "disarm"}
+        assert calls == ["azure", "github"]
+        assert metrics.get("llm.failovers") == 1
+
+    def test_skips_open_breaker(self):
+        get_breaker("azure")._trip()
+        assert call_routed(["azure", "github"], lambda p, r: p) == "github"
+
+    def test_all_open_raises(self):
+        get_breaker("azure")._trip()
+        with pytest.raises(CircuitOpenError):
+            call_routed(["azure"], lambda p, r: p)
+
+    def test_last_error_raised(self):
+        def call(provider, remaining):
+            raise ValueError(provider)
+
+        with pytest.raises(ValueError, match="github"):
+            call_routed(["azure", "github"], call)
+
+
+def _async_call(delays, results=None):
+    calls = []
+
+    async def call(provider):
+        calls.append(provider)
+        await asyncio.sleep(delays[provider])
+        outcome = (results or {}).get(provider, {"intent": "disarm", "from": provider})
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return calls, call
+
+
+class TestCallRoutedAsync:
+    async def test_no_hedge_without_history(self):
+        calls, call = _async_call({"azure": 0.05, "github": 0})
+        result = await call_routed_async(["azure", "github"], call)
+        assert result["from"] == "azure"
+        assert calls == ["azure"]
+
+    async def test_hedges_slow_primary(self, monkeypatch):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY_MS", 10)
+        _observe("azure", 10)
+        calls, call = _async_call({"azure": 0.5, "github": 0})
+        result = await asyncio.wait_for(call_routed_async(["azure", "github"], call), 0.3)
+        assert result["from"] == "github"
+        assert calls == ["azure", "github"]
+        assert metrics.get("llm.hedged") == 1
+        assert metrics.get("llm.hedge_wins") == 1
+
+    async def test_fast_primary_not_hedged(self, monkeypatch):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY_MS", 200)
+        _observe("azure", 10)
+        calls, call = _async_call({"azure": 0, "github": 0})
+        assert (await call_routed_async(["azure", "github"], call))["from"] == "azure"
+        assert calls == ["azure"]
+
+    async def test_hedging_can_be_disabled(self, monkeypatch):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "LLM_HEDGE", False)
+        monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY_MS", 10)
+        _observe("azure", 10)
+        calls, call = _async_call({"azure": 0.05, "github": 0})
+        assert (await call_routed_async(["azure", "github"], call))["from"] == "azure"
+        assert calls == ["azure"]
+
+    async def test_invalid_answer_waits_for_hedge(self, monkeypatch):
+        from app.config import settings
+
+        monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY_MS", 10)
+        _observe("azure", 10)
+        calls, call = _async_call({"azure": 0.05, "github": 0.1}, {"azure": None})
+        result = await call_routed_async(["azure", "github"], call)
+        assert result["from"] == "github"
+
+    async def test_fails_over_on_error(self):
+        calls, call = _async_call({"azure": 0, "github": 0}, {"azure": TimeoutError("slow")})
+        result = await call_routed_async(["azure", "github"], call)
+        assert result["from"] == "github"
+        assert metrics.get("llm.failovers") == 1
+        assert llm_router.snapshot()["azure"]["error_rate"] > 0
+
+    async def test_last_error_raised(self):
+        _, call = _async_call(
+            {"azure": 0, "github": 0}, {"azure": TimeoutError("a"), "github": ValueError("g")}
+        )
+        with pytest.raises(ValueError):
+            await call_routed_async(["azure", "github"], call)
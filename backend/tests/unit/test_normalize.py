@@ -0,0 +1,52 @@
+import re
+
+from app.nlp.normalize import NormalizedText, normalize, strip_accents
+
+
+class TestNormalizedText:
+    def test_nfkc(self):
+        nt = NormalizedText("pin １２３４")
+        assert nt.text == "pin 1234"
+
+    def test_folded_is_lowercase(self):
+        assert NormalizedText("ARM The System").folded == "arm the system"
+
+    def test_accents_folded(self):
+        assert NormalizedText("Désactiver le Système").folded == "desactiver le systeme"
+
+    def test_folded_aligned_with_text(self):
+        nt = NormalizedText("Straße für José")
+        assert len(nt.folded) == len(nt.text)
+        start = nt.folded.index("jose")
+        assert nt.text[start:start + 4] == "José"
+
+    def test_tokens_with_offsets(self):
+        nt = NormalizedText("Add user Élise, pin 4321")
+        assert nt.tokens[2] == ("elise", 9, 14)
+        assert nt.text[9:14] == "Élise"
+
+    def test_words(self):
+        assert {"arm", "the", "system"} <= NormalizedText("Arm the system!").words
+
+    def test_search_memoized(self):
+        calls = []
+
+        class CountingPattern:
+            def search(self, text):
+                calls.append(text)
+                return re.search("pin", text)
+
+        pattern = CountingPattern()
+        nt = NormalizedText("pin 1234")
+        assert nt.search(pattern) is nt.search(pattern)
+        assert len(calls) == 1
+
+    def test_normalize_reuses_instance(self):
+        nt = NormalizedText("arm")
+        assert normalize(nt) is nt
+        assert normalize("arm").text == "arm"
+
+
+def test_strip_accents():
+    assert strip_accents("désarmer le système") == "desarmer le systeme"
+    assert strip_accents("plain ascii") == "plain ascii"
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from app.metrics import metrics
+from app.nlp import parser
+from app.nlp.normalize import NormalizedText
+from app.nlp.parse_cache import ParseCache, _Vocabulary, template
+from app.nlp.rule_engine import get_rules
+
+
+@pytest.fixture
+def vocabulary():
+    return _Vocabulary(get_rules())
+
+
+@pytest.fixture
+def no_llm(monkeypatch):
+    monkeypatch.setattr(parser, "llm_parse", lambda text, timeout=None: None)
+
+
+class TestTemplate:
+    def test_names_and_digits_slotted(self, vocabulary):
+        a = template(NormalizedText("add user John with pin 4321"), vocabulary)
+        b = template(NormalizedText("add user Mike with pin 8765"), vocabulary)
+        assert a == b == "add user Xxxx with pin 0000"
+
+    def test_length_preserved(self, vocabulary):
+        text = "add a temporary user Sarah, pin 5678 from today 5pm to Sunday 10am"
+        assert len(template(NormalizedText(text), vocabulary)) == len(text)
+
+    def test_lowercase_words_kept(self, vocabulary):
+        assert template(NormalizedText("add user john"), vocabulary) == "add user john"
+
+    @pytest.mark.parametrize("word", ["Arma", "Disarm", "Sesame", "Stay", "Sunday", "Anna"])
+    def test_words_patterns_can_see_are_not_slotted(self, vocabulary, word):
+        # Rule literals, extractor keywords, non-name words and words whose
+        # edge letter is a one-letter literal ("a" in "a user") stay verbatim
+        assert word in template(NormalizedText(f"{word} sistema"), vocabulary)
+
+
+class TestParseCommandCache:
+    def test_hit_refills_slots_from_actual_text(self, no_llm):
+        parser.parse_command("add user John with pin 4321")
+        result = parser.parse_command("add user Mike with pin 8765")
+        assert metrics.get("parse_cache.hits") == 1
+        assert result["entities"]["name"] == "Mike"
+        assert result["entities"]["pin"] == "8765"
+
+    def test_hit_matches_uncached_parse(self, no_llm, monkeypatch):
+        texts = [
+            "add a temporary user Sarah, pin 5678 from today 5pm to Sunday 10am",
+            "add a temporary user Susan, pin 1357 from today 6pm to Sunday 11am",
+            "arm the system in stay mode",
+            "remove user John",
+            "remove user Mike",
+        ]
+        cached = [parser.parse_command(t) for t in texts]
+        assert metrics.get("parse_cache.hits") == 2
+        monkeypatch.setattr(parser.parse_cache, "maxsize", 0)
+        assert cached == [parser.parse_command(t) for t in texts]
+
+    def test_pins_never_stored(self, no_llm):
+        parser.parse_command("add user John with pin 4321")
+        assert "4321" not in repr(parser.parse_cache._entries)
+
+
+class TestParseCache:
+    def test_lru_bound(self, no_llm, monkeypatch):
+        cache = ParseCache(maxsize=2, ttl=60)
+        rules = get_rules()
+        for text in ("arm the system", "disarm the system", "show all users"):
+            cache.put(NormalizedText(text), rules, "arm", ())
+        assert len(cache) == 2
+        assert cache.get(NormalizedText("arm the system"), rules) is None
+
+    def test_ttl_expiry(self, monkeypatch):
+        cache = ParseCache(maxsize=8, ttl=10)
+        rules = get_rules()
+        cache.put(NormalizedText("arm the system"), rules, "arm", ())
+        assert cache.get(NormalizedText("arm the system"), rules) == ("arm", {})
+        later = time.monotonic() + 11
+        monkeypatch.setattr(time, "monotonic", lambda: later)
+        assert cache.get(NormalizedText("arm the system"), rules) is None
+
+    def test_disabled(self):
+        cache = ParseCache(maxsize=0, ttl=10)
+        rules = get_rules()
+        cache.put(NormalizedText("arm the system"), rules, "arm", ())
+        assert cache.get(NormalizedText("arm the system"), rules) is None
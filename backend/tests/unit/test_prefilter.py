@@ -0,0 +1,81 @@
+import re
+
+import pytest
+
+from app.nlp import rule_engine
+from app.nlp.normalize import normalize
+from app.nlp.prefilter import KeywordIndex, fold, letter_runs, required_literals
+from tests.unit.test_rule_engine import DOCUMENTED_COMMANDS
+
+
+class TestRequiredLiterals:
+    def test_plain_word(self):
+        assert required_literals(re.compile(r"\bkholo\b", re.I)) == {"kholo"}
+
+    def test_alternation_unions_branches(self):
+        pattern = re.compile(r"\bbatel\b|\bbattel\b", re.I)
+        assert required_literals(pattern) == {"batel", "battel"}
+
+    def test_shared_prefix_carried_into_branch(self):
+        # The regex parser factors "p" out of the alternatives
+        pattern = re.compile(r"\b(?:pin|passcode|pass\s*code|password)\b", re.I)
+        assert required_literals(pattern) == {"pin", "pass"}
+
+    def test_small_character_class_expanded(self):
+        pattern = re.compile(r"\bsyst[eè]me\b", re.I)
+        assert required_literals(pattern) == {"systeme", "système"}
+
+    def test_longest_requirement_preferred(self):
+        pattern = re.compile(r"\bmostrar?\s+(?:los\s+)?usuarios?\b", re.I)
+        assert required_literals(pattern) == {"usuario"}
+
+    def test_literals_casefolded(self):
+        assert required_literals(re.compile(r"SESAME", re.I)) == {"sesame"}
+
+    def test_no_literal(self):
+        assert required_literals(re.compile(r"\d{4,6}")) is None
+
+    def test_optional_literal_not_required(self):
+        assert required_literals(re.compile(r"(?:foo)?\w+")) is None
+
+
+class TestLetterRuns:
+    def test_optional_parts_included(self):
+        runs = letter_runs(re.compile(r"\b(?:armar?|activ[ao]r?)\s+(?:el\s+)?sistema\b"))
+        assert {"arma", "armar", "activa", "activo", "el", "sistema"} <= runs
+
+    def test_factored_branches_keep_whole_words(self):
+        assert {"arm", "activate"} <= letter_runs(re.compile(r"arm|activate"))
+
+    def test_lookahead_included(self):
+        assert "disarm" in letter_runs(re.compile(r"\barm\b(?!\s+and\s+disarm)"))
+
+
+class TestKeywordIndex:
+    def test_no_triggers_no_candidates(self):
+        index = KeywordIndex(pattern for _, pattern, _ in rule_engine.get_rules().rules)
+        assert index.candidates("hello there") == ()
+
+    def test_overlapping_triggers_all_reported(self):
+        index = KeywordIndex([re.compile("disarm"), re.compile("arm"), re.compile("dis")])
+        assert index.candidates("DISARM") == (0, 1, 2)
+
+    def test_untriggered_rule_always_candidate(self):
+        index = KeywordIndex([re.compile(r"\d{4}"), re.compile("arm")])
+        assert index.candidates("nothing here") == (0,)
+
+    def test_dotted_capital_i_folds_like_ignorecase(self):
+        index = KeywordIndex([re.compile("pin", re.I)])
+        assert re.search("pin", "PİN", re.I)
+        assert index.candidates("PİN") == (0,)
+        assert fold("PİN") == "pin"
+
+
+@pytest.mark.parametrize("text", DOCUMENTED_COMMANDS)
+def test_prefilter_never_drops_a_matching_rule(text: str):
+    rules = rule_engine.get_rules()
+    folded = normalize(text).folded
+    candidates = rules.index.candidates(folded)
+    for index, (_, pattern, _) in enumerate(rules.rules):
+        if pattern.search(folded):
+            assert index in candidates
@@ -1,5 +1,10 @@
+import json
+import threading
+
 import pytest
 
+from app.nlp import rule_engine
+from app.nlp.normalize import normalize
 from app.nlp.rule_engine import classify_intent
 
 
@@ -104,3 +109,197 @@ def test_creative_aliases(text: str, expected: str):
 def test_new_phrases():
     assert classify_intent("shut off the alarm") == "disarm"
     assert classify_intent("start the alarm") == "arm"
+
+
+# Every command listed in docs/commands.md, plus near-misses and texts that hit
+# several rules at once (the cases where priority order decides the intent).
+DOCUMENTED_COMMANDS = [
+    "arm the system",
+    "please activate the alarm to stay mode",
+    "activate alarm in home mode",
+    "lock it down",
+    "turn on the alarm",
+    "enable the security system",
+    "arm it in away mode",
+    "start the alarm",
+    "disarm the system",
+    "turn off the alarm now",
+    "deactivate the alarm",
+    "disable the security",
+    "unlock the system",
+    "shut off the alarm",
+    "add user John with pin 4321",
+    "create a user Bob with passcode 9999",
+    "add a temporary user Sarah, pin 5678 from today 5pm to Sunday 10am",
+    "give John access",
+    "My mother-in-law is coming to stay for the weekend, make sure she can arm "
+    "and disarm our system using passcode 1234",
+    "remove user John",
+    "delete user Alice",
+    "revoke user access for Bob",
+    "show me all users",
+    "list all users",
+    "who has access",
+    "show the user list",
+    "open sesame",
+    "sesame open",
+    "sesame close",
+    "close sesame",
+    "all clear",
+    "stand down",
+    "at ease",
+    "code red",
+    "red alert",
+    "go hot",
+    "high alert",
+    "go live",
+    "armar el sistema",
+    "activar el sistema",
+    "desarmar el sistema",
+    "desactivar el sistema",
+    "mostrar usuarios",
+    "armer le système",
+    "activer le système",
+    "désarmer le système",
+    "désactiver le système",
+    "Anlage scharf",
+    "scharf schalten",
+    "Anlage unscharf",
+    "unscharf schalten",
+    "aghliq",
+    "aghleq",
+    "iftah",
+    "aftah",
+    "band karo",
+    "kholo",
+    "khol do",
+    "kagi kakete",
+    "akete",
+    "armar o sistema",
+    "ativar o sistema",
+    "desarmar o sistema",
+    "desativar o sistema",
+    "pe'al",
+    "pa'al",
+    "batel",
+    "battel",
+    # Multi-rule and negative cases
+    "ARM THE SYSTEM",
+    "arm the system, then open sesame",
+    "disarm the alarm and add user Kim with pin 2468",
+    "she can arm and disarm using pin 1234",
+    "arm and disarm",
+    "turn on the alarm and show all users",
+    "pin\n1234 for the nanny",
+    "code 1234 is my passcode, lock it down",
+    "hello there",
+    "what time is it",
+    "harmless farm alarm",
+    "",
+]
+
+
+def _sequential_classify(text: str):
+    """Reference: the first-match-wins loop the compiled matcher replaces."""
+    if not text or not text.strip():
+        return None
+    folded = normalize(text).folded
+    for _, pattern, intent in rule_engine.get_rules().rules:
+        if pattern.search(folded):
+            return intent
+    return None
+
+
+@pytest.mark.parametrize("text", DOCUMENTED_COMMANDS)
+def test_compiled_matcher_equivalent_to_sequential(text: str):
+    assert classify_intent(text) == _sequential_classify(text)
+
+
+def test_compiled_matcher_prefers_earlier_rule_further_right():
+    # "arm" matches at offset 0 but the creative alias later in the text wins
+    rules = rule_engine.get_rules().rules
+    index = rule_engine.CompiledMatcher(rules).match("arm the system, then open sesame")
+    assert rules[index][2] == "disarm"
+
+
+class TestRulesFile:
+    def test_bundled_rules_load(self):
+        rules = rule_engine.load_rules(str(rule_engine.DEFAULT_RULES_PATH))
+        assert rules.version == 1
+        assert len(rules.checksum) == 64
+        assert rules.match("open sesame") == ("creative alias", "disarm")
+
+    def test_unknown_intent_rejected(self):
+        with pytest.raises(ValueError, match="unknown intent"):
+            rule_engine.compile_rules({"rules": [{"pattern": "x", "intent": "explode"}]})
+
+    def test_invalid_pattern_rejected(self):
+        with pytest.raises(ValueError, match="invalid pattern"):
+            rule_engine.compile_rules({"rules": [{"pattern": "(", "intent": "arm"}]})
+
+    def test_default_flags_ignorecase(self):
+        rules = rule_engine.compile_rules({"rules": [{"pattern": "batten", "intent": "arm"}]})
+        assert rules.match("BATTEN down") == ("rule", "arm")
+
+    def test_trigger_cache_written_and_reused(self, tmp_path, monkeypatch):
+        cache = tmp_path / "rules-cache.json"
+        monkeypatch.setattr(rule_engine.settings, "RULES_CACHE_PATH", str(cache))
+        first = rule_engine.load_rules()
+        assert cache.exists()
+        second = rule_engine.load_rules()
+        assert second.index.triggers == first.index.triggers
+
+
+class TestReload:
+    @pytest.fixture
+    def rules_file(self, tmp_path, monkeypatch):
+        path = tmp_path / "rules.json"
+        path.write_text(rule_engine.DEFAULT_RULES_PATH.read_text(encoding="utf-8"), encoding="utf-8")
+        monkeypatch.setattr(rule_engine.settings, "RULES_PATH", str(path))
+        original = rule_engine.get_rules()
+        yield path
+        rule_engine._snapshot = original
+
+    def test_reload_swaps_snapshot(self, rules_file):
+        data = json.loads(rules_file.read_text(encoding="utf-8"))
+        data["version"] = 2
+        data["rules"].insert(0, {"stage": "creative alias", "intent": "arm", "pattern": r"\bbatten\s+down\b"})
+        rules_file.write_text(json.dumps(data), encoding="utf-8")
+
+        old = rule_engine.get_rules()
+        new = rule_engine.reload_rules()
+        assert rule_engine.get_rules() is new
+        assert new.version == 2
+        assert classify_intent("batten down the hatches") == "arm"
+        # A request still holding the old snapshot keeps its behaviour
+        assert classify_intent("batten down the hatches", old) is None
+
+    def test_failed_reload_keeps_active_rules(self, rules_file):
+        active = rule_engine.get_rules()
+        rules_file.write_text("{not json", encoding="utf-8")
+        with pytest.raises(ValueError):
+            rule_engine.reload_rules()
+        assert rule_engine.get_rules() is active
+
+    def test_learned_rules_do_not_reread_the_file(self, rules_file):
+        # An operator's half-edited file is neither loaded nor in the way
+        rules_file.write_text("{not json", encoding="utf-8")
+        learned = [{"stage": "learned alias", "intent": "arm", "pattern": r"^batten down$"}]
+        snapshot = rule_engine.set_learned_rules(learned)
+        assert rule_engine.get_rules() is snapshot
+        assert classify_intent("batten down") == "arm"
+        assert classify_intent("disarm the system") == "disarm"
+
+    def test_learned_rules_assigned_under_the_reload_lock(self, rules_file):
+        # A reload in progress must not finish with the entries it started with
+        # after they have been replaced
+        learned = [{"stage": "learned alias", "intent": "arm", "pattern": r"^batten down$"}]
+        before = rule_engine._learned
+        with rule_engine._reload_lock:
+            thread = threading.Thread(target=rule_engine.set_learned_rules, args=(learned,))
+            thread.start()
+            thread.join(0.1)
+            assert rule_engine._learned is before
+        thread.join()
+        assert rule_engine._learned == tuple(learned)
+        assert classify_intent("batten down", rule_engine.reload_rules()) == "arm"
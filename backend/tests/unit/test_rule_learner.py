@@ -0,0 +1,227 @@
+import json
+
+import pytest
+
+from app.config import settings
+from app.metrics import metrics
+from app.nlp import parser, rule_engine
+from app.nlp.normalize import NormalizedText
+from app.nlp.rule_learner import RuleLearner, get_rule_learner, phrase_template
+
+
+def _learner(**kwargs):
+    options = {"min_count": 3, "min_agreement": 0.9}
+    options.update(kwargs)
+    return RuleLearner(**options)
+
+
+def _observe(learner, text, intent, times=1):
+    for _ in range(times):
+        entry = learner.observe(NormalizedText(text), intent)
+    return entry
+
+
+class TestTemplates:
+    def test_numbers_replaced(self):
+        nt = NormalizedText("Let visitor 4444 in, at 8am!")
+        assert phrase_template(nt) == "let visitor <num> in at <num>"
+
+    def test_pattern_matches_same_phrasing_only(self):
+        entry = _observe(_learner(), "let visitor 4444 in", "disarm", times=3)
+        rules = rule_engine.compile_rules({"rules": []}, learned=[
+            {"stage": "learned alias", "intent": "disarm", "pattern": entry["pattern"]}
+        ])
+        assert rules.match(NormalizedText("Let visitor 1234 in.")) == ("learned alias", "disarm")
+        assert rules.match(NormalizedText("don't let visitor 1234 in")) is None
+        assert rules.match(NormalizedText("let visitor 1234 in now")) is None
+
+
+class TestPromotion:
+    def test_promoted_at_threshold(self):
+        learner = _learner()
+        assert _observe(learner, "batten down the hatches", "arm", times=2) is None
+        entry = _observe(learner, "batten down the hatches", "arm")
+        assert (entry["intent"], entry["count"], entry["agreement"]) == ("arm", 3, 1.0)
+        assert metrics.get("rules.learned") == 1
+        assert rule_engine.classify_intent("Batten down the hatches!") == "arm"
+
+    def test_inconsistent_answers_not_promoted(self):
+        learner = _learner(min_count=4)
+        _observe(learner, "batten down the hatches", "arm", times=3)
+        assert _observe(learner, "batten down the hatches", "disarm") is None
+        assert learner.entries() == []
+        assert learner.candidate_count() == 1
+
+    def test_no_intent_counts_against_agreement(self):
+        learner = _learner()
+        _observe(learner, "batten down the hatches", None, times=5)
+        assert learner.entries() == []
+
+    def test_least_recent_candidates_dropped(self):
+        learner = _learner(max_candidates=2)
+        for text in ("batten down the hatches", "stand the guard down", "who holds a key"):
+            _observe(learner, text, "arm")
+        assert learner.candidate_count() == 2
+
+    def test_learned_stage_after_creative_aliases(self):
+        _observe(_learner(), "batten down the hatches", "arm", times=3)
+        stages = [stage for stage, _, _ in rule_engine.get_rules().rules]
+        learned = stages.index("learned alias")
+        assert stages[learned - 1] == "creative alias"
+        assert stages[learned + 1] != "creative alias"
+
+    def test_installed_without_the_learner_lock(self, monkeypatch):
+        from app.nlp import rule_learner
+
+        learner = _learner()
+        held = []
+        install = rule_learner.set_learned_rules
+
+        def set_learned_rules(rules):
+            held.append(learner._lock.locked())
+            return install(rules)
+
+        monkeypatch.setattr(rule_learner, "set_learned_rules", set_learned_rules)
+        entry = _observe(learner, "batten down the hatches", "arm", times=3)
+        learner.revoke(entry["id"])
+        assert held == [False, False]
+
+    def test_checksum_changes(self):
+        before = rule_engine.get_rules().checksum
+        _observe(_learner(), "batten down the hatches", "arm", times=3)
+        assert rule_engine.get_rules().checksum != before
+
+
+class TestReview:
+    def test_revoked_entry_removed_and_not_relearned(self):
+        learner = _learner()
+        entry = _observe(learner, "batten down the hatches", "arm", times=3)
+        revoked = learner.revoke(entry["id"])
+        assert revoked["revoked"] is True
+        assert rule_engine.classify_intent("batten down the hatches") is None
+        assert _observe(learner, "batten down the hatches", "arm", times=5) is None
+        assert learner.export()["rules"] == []
+
+    def test_revoke_unknown(self):
+        assert _learner().revoke("nope") is None
+
+    def test_export_is_a_valid_rules_document(self):
+        learner = _learner()
+        _observe(learner, "batten down the hatches", "arm", times=3)
+        exported = learner.export()
+        rules = rule_engine.compile_rules(exported)
+        assert rules.match(NormalizedText("batten down the hatches")) == ("learned alias", "arm")
+
+    def test_persisted(self, tmp_path):
+        path = str(tmp_path / "learned.json")
+        learner = _learner(path=path)
+        _observe(learner, "batten down the hatches", "arm", times=3)
+        _observe(learner, "stand the guard down", "disarm", times=2)
+        learner.flush()
+        restarted = _learner(path=path)
+        assert [e["template"] for e in restarted.entries()] == ["batten down the hatches"]
+        assert _observe(restarted, "stand the guard down", "disarm")["intent"] == "disarm"
+
+    def test_counts_written_on_promotion_or_flush(self, tmp_path, monkeypatch):
+        path = tmp_path / "learned.json"
+        learner = _learner(path=str(path))
+        writes = []
+        save = learner._save
+        monkeypatch.setattr(learner, "_save", lambda payload: writes.append(save(payload)))
+        _observe(learner, "stand the guard down", "disarm", times=2)
+        assert writes == [] and not path.exists()
+        learner.flush()
+        learner.flush()
+        assert len(writes) == 1
+        _observe(learner, "batten down the hatches", "arm", times=3)
+        assert len(writes) == 2
+        data = json.loads(path.read_text(encoding="utf-8"))
+        assert data["candidates"] == {"stand the guard down": {"disarm": 2}}
+        assert [e["intent"] for e in data["entries"]] == ["arm"]
+
+    def test_counts_flushed_periodically(self, tmp_path):
+        path = tmp_path / "learned.json"
+        _observe(_learner(path=str(path), flush_seconds=0), "stand the guard down", "disarm")
+        assert json.loads(path.read_text(encoding="utf-8"))["candidates"] == {
+            "stand the guard down": {"disarm": 1}
+        }
+
+    def test_no_pin_on_disk(self, tmp_path):
+        path = tmp_path / "learned.json"
+        _observe(_learner(path=str(path)), "let visitor 4444 in", "disarm", times=3)
+        assert "4444" not in path.read_text(encoding="utf-8")
+        assert json.loads(path.read_text(encoding="utf-8"))["entries"]
+
+    def test_installed_on_start(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "learned.json")
+        _observe(_learner(path=path), "batten down the hatches", "arm", times=3)
+        monkeypatch.setattr(rule_engine, "_learned", ())
+        rule_engine.reload_rules()
+        monkeypatch.setattr(settings, "LEARNED_RULES_PATH", path)
+        assert get_rule_learner() is not None
+        assert rule_engine.classify_intent("batten down the hatches") == "arm"
+
+
+class TestParserTier:
+    @pytest.fixture(autouse=True)
+    def llm_only(self, monkeypatch):
+        monkeypatch.setattr(settings, "CLASSIFIER_ENABLED", False)
+        monkeypatch.setattr(settings, "SEMANTIC_CACHE_SIZE", 0)
+        monkeypatch.setattr(settings, "LEARNED_RULES_MIN_COUNT", 3)
+
+    def test_rule_path_takes_over(self, monkeypatch):
+        calls = []
+
+        def llm_parse(text, timeout=None):
+            calls.append(text)
+            return {"intent": "disarm", "entities": {}}
+
+        monkeypatch.setattr(parser, "llm_parse", llm_parse)
+        sources = [parser.parse_command(f"let visitor {i} in")["source"] for i in range(5)]
+        assert sources == ["llm", "llm", "llm", "rule", "rule"]
+        assert len(calls) == 3
+
+    async def test_async_path(self, monkeypatch):
+        async def llm_parse_async(text, timeout=None):
+            return {"intent": "arm", "entities": {}}
+
+        monkeypatch.setattr(parser, "llm_parse_async", llm_parse_async)
+        for _ in range(3):
+            await parser.parse_command_async("batten down the hatches")
+        result = await parser.parse_command_async("batten down the hatches")
+        assert (result["intent"], result["source"]) == ("arm", "rule")
+
+    def test_unreproducible_entities_not_promoted(self, monkeypatch):
+        # No extractor finds the name here: a learned rule would add "unknown"
+        answer = {"intent": "add_user", "entities": {"name": "Bob", "pin": "1234"}}
+        monkeypatch.setattr(parser, "llm_parse", lambda text, timeout=None: answer)
+        results = [parser.parse_command("let Bob in with code 1234") for _ in range(5)]
+        assert [r["source"] for r in results] == ["llm"] * 5
+        assert results[-1]["api"]["payload"]["name"] == "Bob"
+        assert get_rule_learner().entries() == []
+
+    def test_reproducible_entities_promoted(self, monkeypatch):
+        answer = {"intent": "add_user", "entities": {"name": "Bob", "pin": "1234"}}
+        monkeypatch.setattr(parser, "llm_parse", lambda text, timeout=None: answer)
+        sources = [parser.parse_command("enrol user Bob with code 1234")["source"] for _ in range(3)]
+        result = parser.parse_command("enrol user Bob with code 5678")
+        assert sources + [result["source"]] == ["llm", "llm", "llm", "rule"]
+        assert result["api"]["payload"]["name"] == "Bob"
+        assert result["api"]["payload"]["pin"] == "5678"
+
+    def test_cache_replays_not_counted(self, monkeypatch):
+        answer = {"intent": "arm", "entities": {}, "cached": True}
+        monkeypatch.setattr(parser, "llm_parse", lambda text, timeout=None: answer)
+        for _ in range(5):
+            assert parser.parse_command("batten down the hatches")["source"] == "llm"
+        assert get_rule_learner().candidate_count() == 0
+
+    def test_llm_unavailable_not_counted(self, monkeypatch):
+        monkeypatch.setattr(parser, "llm_parse", lambda text, timeout=None: None)
+        for _ in range(5):
+            parser.parse_command("batten down the hatches")
+        assert get_rule_learner().candidate_count() == 0
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "LEARNED_RULES_ENABLED", False)
+        assert get_rule_learner() is None
@@ -0,0 +1,142 @@
+import sqlite3
+
+import pytest
+
+from app.config import settings
+from app.metrics import metrics
+from app.nlp import parser
+from app.nlp.normalize import NormalizedText
+from app.nlp.semantic_cache import SemanticCache, get_semantic_cache
+
+
+def _cache(**kwargs):
+    options = {"max_entries": 100, "threshold": 0.85, "top_k": 3}
+    options.update(kwargs)
+    return SemanticCache(**options)
+
+
+class TestLookup:
+    def test_rewording_hits(self):
+        cache = _cache()
+        cache.put(NormalizedText("make the alarm go on"), "arm")
+        assert cache.get(NormalizedText("could you make the alarm go on please")) == "arm"
+        assert metrics.get("semantic_cache.hits") == 1
+
+    def test_names_and_numbers_are_placeholders(self):
+        cache = _cache()
+        cache.put(NormalizedText("grant my neighbour Bob entry with 4444"), "add_user")
+        assert cache.get(NormalizedText("grant my neighbour Alice entry with 1234")) == "add_user"
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "make the alarm go off",
+            "don't make the alarm go on",
+            "what is the weather",
+        ],
+    )
+    def test_different_commands_miss(self, text):
+        cache = _cache()
+        cache.put(NormalizedText("make the alarm go on"), "arm")
+        assert cache.get(NormalizedText(text)) is None
+        assert metrics.get("semantic_cache.misses") == 1
+
+    def test_disagreeing_neighbours_miss(self):
+        cache = _cache(threshold=0.5)
+        cache.put(NormalizedText("batten down the hatches"), "arm")
+        cache.put(NormalizedText("batten down the hatches tonight"), "disarm")
+        assert cache.get(NormalizedText("batten down the hatches")) is None
+
+    def test_least_recently_used_evicted(self):
+        cache = _cache(max_entries=2)
+        cache.put(NormalizedText("batten down the hatches"), "arm")
+        cache.put(NormalizedText("stand the guard down"), "disarm")
+        assert cache.get(NormalizedText("batten down the hatches")) == "arm"
+        cache.put(NormalizedText("who holds a key"), "list_users")
+        assert len(cache) == 2
+        assert cache.get(NormalizedText("stand the guard down")) is None
+        assert cache.get(NormalizedText("batten down the hatches")) == "arm"
+
+
+class TestPersistence:
+    def test_reloaded_after_restart(self, tmp_path):
+        path = str(tmp_path / "semantic.sqlite3")
+        cache = _cache(path=path)
+        cache.put(NormalizedText("batten down the hatches"), "arm")
+        cache.close()
+        assert _cache(path=path).get(NormalizedText("please batten down the hatches")) == "arm"
+
+    def test_recency_survives_restart(self, tmp_path):
+        path = str(tmp_path / "semantic.sqlite3")
+        cache = _cache(path=path)
+        cache.put(NormalizedText("batten down the hatches"), "arm")
+        cache.put(NormalizedText("stand the guard down"), "disarm")
+        cache.get(NormalizedText("batten down the hatches"))
+        cache.close()
+        # Only the most recently used entry fits after the restart
+        restarted = _cache(path=path, max_entries=1)
+        assert restarted.get(NormalizedText("batten down the hatches")) == "arm"
+        assert restarted.get(NormalizedText("stand the guard down")) is None
+
+    def test_no_text_or_pin_on_disk(self, tmp_path):
+        path = str(tmp_path / "semantic.sqlite3")
+        cache = _cache(path=path)
+        cache.put(NormalizedText("grant my neighbour Bob entry with 4444"), "add_user")
+        cache.close()
+        rows = sqlite3.connect(path).execute("SELECT * FROM semantic_cache").fetchall()
+        assert len(rows) == 1
+        stored = repr(rows)
+        assert "4444" not in stored and "Bob" not in stored and "neighbour" not in stored
+
+
+class TestParserTier:
+    def test_llm_answer_reused_for_rewording(self, monkeypatch):
+        monkeypatch.setattr(settings, "CLASSIFIER_ENABLED", False)
+        calls = []
+
+        def llm_parse(text, timeout=None):
+            calls.append(text)
+            return {"intent": "add_user", "entities": {"name": "Bob", "pin": "4444"}}
+
+        monkeypatch.setattr(parser, "llm_parse", llm_parse)
+        first = parser.parse_command("grant my neighbour Bob entry with 4444")
+        second = parser.parse_command("please grant my neighbour Alice entry with 1234")
+        assert first["source"] == "llm"
+        assert second["source"] == "semantic_cache"
+        # Entities come from the rule extractors, not the stored answer
+        assert second["api"]["payload"]["pin"] == "1234"
+        assert second["api"]["payload"]["name"] == "Neighbour-Alice"
+        assert len(calls) == 1
+
+    async def test_async_path(self, monkeypatch):
+        monkeypatch.setattr(settings, "CLASSIFIER_ENABLED", False)
+
+        async def llm_parse_async(text, timeout=None):
+            return {"intent": "arm", "entities": {}}
+
+        monkeypatch.setattr(parser, "llm_parse_async", llm_parse_async)
+        await parser.parse_command_async("seal up the house")
+        monkeypatch.setattr(parser, "llm_parse_async", None)
+        result = await parser.parse_command_async("seal up the house now")
+        assert (result["intent"], result["source"]) == ("arm", "semantic_cache")
+
+    def test_arm_disarm_hit_needs_an_anchor(self, monkeypatch):
+        # A neighbour of an earlier command may not be about the alarm at all
+        monkeypatch.setattr(settings, "CLASSIFIER_ENABLED", False)
+        answers = iter([{"intent": "arm", "entities": {}}, None])
+        calls = []
+
+        def llm_parse(text, timeout=None):
+            calls.append(text)
+            return next(answers)
+
+        monkeypatch.setattr(parser, "llm_parse", llm_parse)
+        parser.parse_command("batten down the hatches")
+        result = parser.parse_command("batten down the hatches now")
+        assert result["intent"] is None
+        assert len(calls) == 2
+        assert get_semantic_cache().get(NormalizedText("batten down the hatches now")) == "arm"
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "SEMANTIC_CACHE_SIZE", 0)
+        assert get_semantic_cache() is None
@@ -0,0 +1,126 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from app.metrics import metrics
+from app.nlp.single_flight import AsyncSingleFlight, SingleFlight
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight("test")
+        calls = []
+        started = threading.Event()
+
+        def slow():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return "result"
+
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            leader = pool.submit(flight.do, "key", slow)
+            started.wait()
+            followers = [pool.submit(flight.do, "key", slow) for _ in range(7)]
+            results = [leader.result()] + [f.result() for f in followers]
+
+        assert results == ["result"] * 8
+        assert len(calls) == 1
+        assert metrics.get("test.coalesced") == 7
+
+    def test_exception_reaches_every_waiter(self):
+        flight = SingleFlight("test")
+        started = threading.Event()
+
+        def broken():
+            started.set()
+            time.sleep(0.05)
+            raise ValueError("boom")
+
+        with concurrent.futures.ThreadPoolExecutor(2) as pool:
+            leader = pool.submit(flight.do, "key", broken)
+            started.wait()
+            follower = pool.submit(flight.do, "key", broken)
+            for future in (leader, follower):
+                with pytest.raises(ValueError):
+                    future.result()
+
+    def test_waiter_timeout_is_its_own(self):
+        flight = SingleFlight("test")
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            time.sleep(0.2)
+            return "result"
+
+        with concurrent.futures.ThreadPoolExecutor(2) as pool:
+            leader = pool.submit(flight.do, "key", slow)
+            started.wait()
+            with pytest.raises(concurrent.futures.TimeoutError):
+                flight.do("key", slow, timeout=0.01)
+            assert leader.result() == "result"
+
+    def test_key_released_after_completion(self):
+        flight = SingleFlight("test")
+        assert flight.do("key", lambda: 1) == 1
+        assert flight.do("key", lambda: 2) == 2
+        assert metrics.get("test.coalesced") == 0
+
+
+class TestAsyncSingleFlight:
+    async def test_concurrent_calls_share_one_execution(self):
+        flight = AsyncSingleFlight("test")
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", slow) for _ in range(10)))
+        assert results == ["result"] * 10
+        assert len(calls) == 1
+        assert metrics.get("test.coalesced") == 9
+
+    async def test_waiter_timeout_does_not_cancel_shared_call(self):
+        flight = AsyncSingleFlight("test")
+
+        async def slow():
+            await asyncio.sleep(0.1)
+            return "result"
+
+        patient = asyncio.ensure_future(flight.do("key", slow, timeout=1))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("key", slow, timeout=0.01)
+        assert await patient == "result"
+
+    async def test_leader_timeout_does_not_cancel_followers(self):
+        flight = AsyncSingleFlight("test")
+
+        async def slow():
+            await asyncio.sleep(0.1)
+            return "result"
+
+        hasty = asyncio.ensure_future(flight.do("key", slow, timeout=0.01))
+        await asyncio.sleep(0)
+        patient = asyncio.ensure_future(flight.do("key", slow, timeout=1))
+        with pytest.raises(asyncio.TimeoutError):
+            await hasty
+        assert await patient == "result"
+
+    async def test_exception_reaches_every_waiter(self):
+        flight = AsyncSingleFlight("test")
+
+        async def broken():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            *(flight.do("key", broken) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(r, ValueError) for r in results)
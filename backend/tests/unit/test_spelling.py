@@ -0,0 +1,114 @@
+import pytest
+
+from app.config import settings
+from app.metrics import metrics
+from app.nlp import parser, rule_engine
+from app.nlp.normalize import NormalizedText
+from app.nlp.rule_engine import correct_spelling
+from app.nlp.spelling import SpellingIndex, edit_distance
+
+_INDEX = SpellingIndex(
+    ["disarm", "system", "open", "the", "remove", "user", "temporary", "arm", "unlock", "ease"]
+)
+
+
+class TestSpellingIndex:
+    @pytest.mark.parametrize(
+        "word,expected",
+        [
+            ("disram", "disarm"),  # swap
+            ("sytem", "system"),  # deletion
+            ("systeem", "system"),  # insertion
+            ("opne", "open"),  # swap, short word
+            ("teh", "the"),
+            ("temporray", "temporary"),  # two edits in a long word
+        ],
+    )
+    def test_typos_corrected(self, word, expected):
+        assert _INDEX.correct_word(word) == expected
+
+    @pytest.mark.parametrize(
+        "word",
+        [
+            "system",  # already a vocabulary word
+            "remote",  # substitution in a short word: a real word, not a typo
+            "oven",
+            "arms",  # inflection of a vocabulary word
+            "army",
+            "unblock",  # dictionary words are not typos
+            "erase",
+            "wdisarm",  # first letter differs
+            "dsiarmm",  # two edits in a short word
+        ],
+    )
+    def test_left_alone(self, word):
+        assert _INDEX.correct_word(word) is None
+
+    def test_ties_not_corrected(self):
+        assert SpellingIndex(["stand", "stank"]).correct_word("stans") is None
+        assert SpellingIndex(["stand"]).correct_word("stnad") == "stand"
+
+    def test_names_left_alone(self):
+        corrected = _INDEX.correct(NormalizedText("remvoe user Sytem now"))
+        assert corrected.text == "remove user Sytem now"
+
+    def test_nothing_to_correct(self):
+        assert _INDEX.correct(NormalizedText("open the system")) is None
+
+    def test_edit_distance(self):
+        assert edit_distance("disram", "disarm") == 1
+        assert edit_distance("kitten", "sitting") == 3
+        assert edit_distance("", "abc") == 3
+
+
+class TestRuleEngine:
+    def test_vocabulary_comes_from_rules(self):
+        assert correct_spelling("disram the sytem").text == "disarm the system"
+
+    def test_rebuilt_on_reload(self):
+        rules = rule_engine.compile_rules(
+            {"rules": [{"intent": "arm", "pattern": r"\bbatten\s+down\b"}]}
+        )
+        assert correct_spelling("baten down", rules).text == "batten down"
+        assert correct_spelling("baten down") is None
+
+
+class TestParserTier:
+    @pytest.mark.parametrize(
+        "text,intent",
+        [
+            ("disram the sytem", "disarm"),
+            ("disram the system", "disarm"),
+            ("opne sesame", "disarm"),
+            ("lsit users", "list_users"),
+        ],
+    )
+    def test_corrected_match_flagged(self, monkeypatch, text, intent):
+        monkeypatch.setattr(parser, "llm_parse", lambda *a, **k: pytest.fail("LLM called"))
+        result = parser.parse_command(text)
+        assert (result["intent"], result["source"]) == (intent, "rule_corrected")
+        assert metrics.get("rules.spell_corrected") == 1
+
+    @pytest.mark.parametrize(
+        "text",
+        [
+            "unblock the sink",  # a real word, one letter from "unlock"
+            "disram teh sytem",  # the anchor corrected along with two other words
+        ],
+    )
+    def test_corrected_arm_disarm_needs_an_anchor(self, monkeypatch, text):
+        monkeypatch.setattr(parser, "llm_parse", lambda *a, **k: None)
+        assert parser.parse_command(text)["intent"] is None
+
+    def test_entities_read_from_corrected_text(self):
+        result = parser.parse_command("remvoe user Bob")
+        assert result["source"] == "rule_corrected"
+        assert result["api"]["payload"] == {"name": "Bob"}
+
+    def test_exact_match_not_flagged(self):
+        assert parser.parse_command("disarm the system")["source"] == "rule"
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(settings, "RULES_SPELL_CORRECTION", False)
+        monkeypatch.setattr(settings, "CLASSIFIER_ENABLED", False)
+        assert parser.parse_command("disram the system")["intent"] is None
@@ -1,3 +1,7 @@
+import random
+import threading
+import time
+
 import pytest
 
 from app.store import SecurityStore
@@ -104,3 +108,67 @@ class TestMaskPin:
 
     def test_one_digit(self):
         assert SecurityStore.mask_pin("1") == "1"
+
+
+def _consistent(snapshot):
+    by_name, by_pin = snapshot.users_by_name, snapshot.users_by_pin
+    return len(by_name) == len(by_pin) and all(
+        by_pin.get(user["pin"]) is user for key, user in by_name.items()
+        if key == user["name"].lower()
+    )
+
+
+class TestConcurrency:
+    def test_replacing_keeps_indexes_consistent(self, s):
+        s.add_user("Alice", "1234")
+        s.add_user("Alice", "5678")
+        s.add_user("Bob", "5678")
+        assert [u["name"] for u in s.list_users()] == ["Bob"]
+        assert s.remove_user(pin="1234") is None
+        assert _consistent(s.snapshot())
+
+    def test_stress(self, s):
+        """Writers race on overlapping names and PINs while readers check every snapshot."""
+        stop = threading.Event()
+        errors = []
+
+        def writer(seed):
+            rng = random.Random(seed)
+            for _ in range(500):
+                name, pin = f"user{rng.randrange(20)}", f"{rng.randrange(20):04d}"
+                action = rng.random()
+                if action < 0.5:
+                    s.add_user(name, pin)
+                elif action < 0.75:
+                    s.remove_user(name=name)
+                elif action < 0.9:
+                    s.remove_user(pin=pin)
+                else:
+                    s.arm("stay") if rng.random() < 0.5 else s.disarm()
+
+        def reader():
+            while not stop.is_set():
+                if not _consistent(s.snapshot()):
+                    errors.append("inconsistent snapshot")
+                users = s.list_users()
+                if len({u["name"] for u in users}) != len(users):
+                    errors.append("duplicate user listed")
+                s.get_state()
+                time.sleep(0)
+
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        writers = [threading.Thread(target=writer, args=(seed,)) for seed in range(8)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        assert errors == []
+        snapshot = s.snapshot()
+        assert _consistent(snapshot)
+        assert set(map(id, snapshot.users_by_name.values())) == set(
+            map(id, snapshot.users_by_pin.values())
+        )
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+
+import pytest
+
+from app.config import settings
+from app.metrics import metrics
+from app.storage.eventlog import EventLogBackend
+from app.store import SecurityStore, create_backend
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / "log")
+
+
+@pytest.fixture
+def open_store(directory):
+    stores = []
+
+    def open_store(snapshot_every=0):
+        store = SecurityStore(EventLogBackend(directory, snapshot_every))
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+def _log_lines(directory):
+    lines = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".log"):
+            with open(os.path.join(directory, name), encoding="utf-8") as fh:
+                lines += [json.loads(line) for line in fh]
+    return lines
+
+
+class TestLog:
+    def test_state_and_users_survive_restart(self, open_store):
+        store = open_store()
+        store.arm("stay")
+        store.add_user("Alice", "1234", permissions=["arm"])
+        store.add_user("Bob", "5678")
+        store.remove_user(pin="5678")
+        store.close()
+
+        restarted = open_store()
+        assert restarted.get_state() == {"armed": True, "mode": "stay"}
+        assert [u["name"] for u in restarted.list_users()] == ["Alice"]
+
+    def test_every_write_logged_in_order(self, open_store, directory):
+        store = open_store()
+        store.arm("home")
+        store.add_user("Alice", "1234")
+        store.remove_user(name="alice")
+        store.disarm()
+        store.close()
+        lines = _log_lines(directory)
+        assert [(line["seq"], line["type"]) for line in lines] == [
+            (1, "arm"), (2, "add_user"), (3, "remove_user"), (4, "disarm"),
+        ]
+        assert lines[2]["name"] == "Alice"
+
+    def test_torn_append_cut_off(self, open_store, directory):
+        store = open_store()
+        store.arm("stay")
+        store.close()
+        (segment,) = [name for name in os.listdir(directory) if name.endswith(".log")]
+        with open(os.path.join(directory, segment), "a", encoding="utf-8") as fh:
+            fh.write('{"seq": 2, "type": "disa')
+
+        restarted = open_store()
+        assert restarted.get_state()["armed"] is True
+        restarted.add_user("Alice", "1234")
+        restarted.close()
+        assert [line["seq"] for line in _log_lines(directory)] == [1, 2]
+        assert [u["name"] for u in open_store().list_users()] == ["Alice"]
+
+
+class TestSnapshots:
+    def test_startup_replays_only_the_tail(self, open_store, directory):
+        store = open_store(snapshot_every=10)
+        for i in range(25):
+            store.add_user(f"user{i}", f"{i:04d}")
+        store.close()
+
+        with open(os.path.join(directory, "snapshot.json"), encoding="utf-8") as fh:
+            assert json.load(fh)["seq"] == 20
+        backend = EventLogBackend(directory, 10)
+        dump, events = backend.load()
+        assert len(dump["users"]) == 20
+        assert len(list(events)) == 5
+        backend.close()
+
+        restarted = open_store(snapshot_every=10)
+        assert len(restarted.list_users()) == 25
+        # Earlier segments are kept as the audit trail
+        assert [line["seq"] for line in _log_lines(directory)] == list(range(1, 26))
+
+    def test_writes_after_restart_continue_the_sequence(self, open_store, directory):
+        store = open_store(snapshot_every=3)
+        for i in range(3):
+            store.add_user(f"user{i}", f"{i:04d}")
+        store.close()
+        restarted = open_store(snapshot_every=3)
+        restarted.arm()
+        restarted.close()
+        assert [line["seq"] for line in _log_lines(directory)] == [1, 2, 3, 4]
+        reopened = open_store(snapshot_every=3)
+        assert reopened.get_state()["armed"] is True
+        assert len(reopened.list_users()) == 3
+
+
+class TestGroupCommit:
+    def test_queued_appends_share_an_fsync(self, directory, monkeypatch):
+        backend = EventLogBackend(directory)
+        gate = threading.Event()
+        commit_batch = backend._commit
+
+        def held(batch):
+            gate.wait()
+            commit_batch(batch)
+
+        monkeypatch.setattr(backend._committer, "_commit_batch", held)
+        fsyncs = []
+        real_fsync = os.fsync
+        monkeypatch.setattr(os, "fsync", lambda fd: fsyncs.append(fd) or real_fsync(fd))
+        commits = [backend.write({"type": "arm", "mode": f"mode{i}"}) for i in range(50)]
+        gate.set()
+        for commit in commits:
+            commit.wait()
+        backend.close()
+        assert metrics.get("store.writes") == 50
+        assert metrics.get("store.commits") <= 2
+        # One more for the directory when the segment is created
+        assert len(fsyncs) <= 3
+
+
+class TestSelection:
+    def test_eventlog(self, monkeypatch, directory):
+        monkeypatch.setattr(settings, "STORE_BACKEND", "eventlog")
+        monkeypatch.setattr(settings, "STORE_LOG_DIR", directory)
+        backend = create_backend()
+        try:
+            assert isinstance(backend, EventLogBackend)
+        finally:
+            backend.close()
@@ -0,0 +1,183 @@
+import time
+
+import pytest
+
+from app.config import settings
+from app.metrics import metrics
+from app.storage.redis_store import RedisBackend
+from app.store import SecurityStore, create_backend
+
+fakeredis = pytest.importorskip("fakeredis")
+# fakeredis runs Lua scripts with lupa
+pytest.importorskip("lupa")
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def open_store(server):
+    stores = []
+
+    def open_store(prefix="nlsec"):
+        client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        store = SecurityStore(RedisBackend(client, prefix))
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+def _eventually(check, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "change not seen in time"
+        time.sleep(0.01)
+
+
+class TestPersistence:
+    def test_state_and_users_survive_restart(self, open_store):
+        store = open_store()
+        store.arm("stay")
+        store.add_user("Alice", "1234", permissions=["arm"])
+        store.add_user("Bob", "5678", start_time="2026-01-01T09:00:00")
+        store.remove_user(pin="5678")
+        store.close()
+
+        restarted = open_store()
+        assert restarted.get_state() == {"armed": True, "mode": "stay"}
+        assert restarted.list_users() == [
+            {
+                "name": "Alice",
+                "pin": "**34",
+                "start_time": None,
+                "end_time": None,
+                "permissions": ["arm"],
+            }
+        ]
+
+    def test_user_hash_and_pin_index(self, open_store, server):
+        store = open_store()
+        store.add_user("Alice", "1234")
+        store.add_user("alice", "5678")
+        store.add_user("Bob", "5678")
+        client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        assert client.hgetall("{nlsec}:pins") == {"5678": "bob"}
+        assert client.hgetall("{nlsec}:user:bob")["name"] == "Bob"
+        assert not client.exists("{nlsec}:user:alice")
+        assert client.zrange("{nlsec}:order", 0, -1) == ["bob"]
+
+    def test_keys_share_one_cluster_slot(self, open_store, server):
+        from redis.crc import key_slot
+
+        store = open_store()
+        store.arm()
+        store.add_user("Alice", "1234")
+        store.add_user("Bob", "5678")
+        client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        keys = client.keys("*")
+        assert len(keys) >= 7
+        assert {key_slot(key.encode()) for key in keys} == {key_slot(b"{nlsec}")}
+
+    def test_users_keep_their_order(self, open_store):
+        store = open_store()
+        for name in ("Carol", "Alice", "Bob"):
+            store.add_user(name, name[:4].ljust(4, "0"))
+        store.add_user("Carol", "9999")
+        store.close()
+        assert [u["name"] for u in open_store().list_users()] == ["Alice", "Bob", "Carol"]
+
+    def test_reset_clears_only_its_prefix(self, open_store, server):
+        store, other = open_store(), open_store(prefix="other")
+        store.add_user("Alice", "1234")
+        other.add_user("Bob", "5678")
+        store.reset()
+        client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        assert not client.exists("{nlsec}:user:alice", "{nlsec}:pins", "{nlsec}:order")
+        assert client.hgetall("{nlsec}:state") == {"armed": "0", "mode": "away"}
+        assert client.exists("{other}:user:bob")
+
+
+class TestBatching:
+    def test_queued_writes_share_a_round_trip(self, server, monkeypatch):
+        client = fakeredis.FakeRedis(server=server, decode_responses=True)
+        backend = RedisBackend(client)
+        executed = []
+        pipeline = client.pipeline
+
+        def counting_pipeline(*args, **kwargs):
+            executed.append(1)
+            return pipeline(*args, **kwargs)
+
+        monkeypatch.setattr(client, "pipeline", counting_pipeline)
+        store = SecurityStore(backend)
+        with store._lock:
+            commits = [store._write({"type": "arm", "mode": f"mode{i}"}) for i in range(50)]
+        for commit in commits:
+            commit.wait()
+        store.close()
+        assert metrics.get("store.writes") == 50
+        assert len(executed) == metrics.get("store.commits") <= 2
+        assert client.get("{nlsec}:version") == str(len(executed))
+
+
+class TestSharing:
+    def test_writes_from_another_node_are_seen(self, open_store):
+        first, second = open_store(), open_store()
+        first.arm("home")
+        first.add_user("Alice", "1234")
+        _eventually(lambda: second.get_user_by_name("alice") is not None)
+        assert second.get_state() == {"armed": True, "mode": "home"}
+        assert second.remove_user(pin="1234")["name"] == "Alice"
+        _eventually(lambda: first.list_users() == [])
+
+    def test_own_writes_do_not_reload(self, open_store):
+        store = open_store()
+        for i in range(20):
+            store.add_user(f"user{i}", f"{i:04d}")
+            assert len(store.list_users()) == i + 1
+        time.sleep(0.1)
+        assert not store.backend.stale()
+        assert metrics.get("store.reloads") == 0
+
+    def test_lost_subscription_reloads(self, open_store):
+        first, second = open_store(), open_store()
+        first.arm()
+        _eventually(lambda: second.get_state()["armed"])
+        get_message = second.backend._pubsub.get_message
+        failures = [ConnectionError("connection reset")]
+
+        def flaky(**kwargs):
+            if failures:
+                raise failures.pop()
+            return get_message(**kwargs)
+
+        second.backend._pubsub.get_message = flaky
+        _eventually(lambda: second.backend._lost)
+        # Stale until the listener has subscribed again, reloads or not
+        first.disarm()
+        assert second.get_state()["armed"] is False
+        assert second.backend.stale()
+        first.arm("stay")
+        _eventually(lambda: not second.backend._lost)
+        # What was committed while it was down is noticed after all
+        assert second.get_state() == {"armed": True, "mode": "stay"}
+        first.disarm()
+        _eventually(lambda: not second.get_state()["armed"])
+
+
+class TestSelection:
+    def test_redis(self, monkeypatch):
+        monkeypatch.setattr(settings, "STORE_BACKEND", "redis")
+        monkeypatch.setattr(settings, "WEB_CONCURRENCY", 4)
+        client = fakeredis.FakeRedis(decode_responses=True)
+        monkeypatch.setattr("app.store.connect_redis", lambda url: client)
+        backend = create_backend()
+        try:
+            assert isinstance(backend, RedisBackend)
+        finally:
+            backend.close()
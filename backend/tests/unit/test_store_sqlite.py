@@ -0,0 +1,248 @@
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from app.config import settings
+from app.metrics import metrics
+from app.storage import sqlite as sqlite_backend
+from app.storage.base import StorageError
+from app.storage.sqlite import SQLiteBackend
+from app.store import SecurityStore, create_backend
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "store.sqlite3")
+
+
+@pytest.fixture
+def open_store(path):
+    stores = []
+
+    def open_store(shared=False):
+        store = SecurityStore(SQLiteBackend(path, shared=shared))
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+
+class TestPersistence:
+    def test_state_and_users_survive_restart(self, open_store):
+        store = open_store()
+        store.arm("stay")
+        store.add_user("Alice", "1234", permissions=["arm"])
+        store.add_user("Bob", "5678", start_time="2026-01-01T09:00:00")
+        store.remove_user(pin="5678")
+        store.close()
+
+        restarted = open_store()
+        assert restarted.get_state() == {"armed": True, "mode": "stay"}
+        assert restarted.list_users() == [
+            {
+                "name": "Alice",
+                "pin": "**34",
+                "start_time": None,
+                "end_time": None,
+                "permissions": ["arm"],
+            }
+        ]
+        assert restarted.remove_user(name="alice") is not None
+
+    def test_replaced_users_removed_from_database(self, open_store, path):
+        store = open_store()
+        store.add_user("Alice", "1234")
+        store.add_user("alice", "5678")
+        store.add_user("Bob", "5678")
+        rows = sqlite3.connect(path).execute("SELECT name, pin FROM users").fetchall()
+        assert rows == [("Bob", "5678")]
+
+    def test_reset_clears_database(self, open_store):
+        store = open_store()
+        store.arm("home")
+        store.add_user("Alice", "1234")
+        store.reset()
+        store.close()
+        restarted = open_store()
+        assert restarted.get_state() == {"armed": False, "mode": "away"}
+        assert restarted.list_users() == []
+
+    def test_wal_mode(self, open_store, path):
+        open_store()
+        mode = sqlite3.connect(path).execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+
+
+class TestGroupCommit:
+    def test_queued_writes_share_a_transaction(self, path, monkeypatch):
+        backend = SQLiteBackend(path)
+        gate = threading.Event()
+        commit_batch = backend._commit
+
+        def held(batch):
+            gate.wait()
+            commit_batch(batch)
+
+        monkeypatch.setattr(backend._committer, "_commit_batch", held)
+        commits = [backend.write({"type": "arm", "mode": f"mode{i}"}) for i in range(50)]
+        gate.set()
+        for commit in commits:
+            commit.wait()
+        backend.close()
+        assert metrics.get("store.writes") == 50
+        assert metrics.get("store.commits") <= 2
+        restarted = SQLiteBackend(path)
+        assert restarted.load()[0]["state"] == {"armed": True, "mode": "mode49"}
+        restarted.close()
+
+    def test_concurrent_writers(self, open_store):
+        store = open_store()
+
+        def writer(worker):
+            for i in range(25):
+                store.add_user(f"user{worker}-{i}", f"{worker:02d}{i:02d}")
+
+        threads = [threading.Thread(target=writer, args=(w,)) for w in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        store.close()
+        assert len(open_store().list_users()) == 200
+        assert metrics.get("store.commits") <= metrics.get("store.writes") == 200
+
+
+class TestFailure:
+    def test_failed_commit_reloads_cache(self, open_store, monkeypatch):
+        store = open_store()
+        store.add_user("Alice", "1234")
+        apply_event = sqlite_backend.apply_event
+
+        def failing(conn, event):
+            if event["type"] == "arm":
+                raise sqlite3.OperationalError("disk I/O error")
+            apply_event(conn, event)
+
+        monkeypatch.setattr(sqlite_backend, "apply_event", failing)
+        with pytest.raises(StorageError):
+            store.arm()
+        assert store.get_state()["armed"] is False
+        assert [u["name"] for u in store.list_users()] == ["Alice"]
+
+
+class TestShared:
+    def test_writes_from_another_store_are_seen(self, open_store):
+        first, second = open_store(shared=True), open_store(shared=True)
+        first.arm("home")
+        first.add_user("Alice", "1234")
+        assert second.get_state() == {"armed": True, "mode": "home"}
+        assert second.remove_user(pin="1234")["name"] == "Alice"
+        assert first.list_users() == []
+        assert first.get_user_by_name("alice") is None
+
+    def test_own_writes_do_not_reload(self, open_store):
+        store = open_store(shared=True)
+        for i in range(20):
+            store.add_user(f"user{i}", f"{i:04d}")
+            assert len(store.list_users()) == i + 1
+        assert metrics.get("store.reloads") == 0
+
+    def test_interleaved_writers_converge(self, open_store):
+        first, second = open_store(shared=True), open_store(shared=True)
+
+        def writer(store, prefix):
+            for i in range(25):
+                store.add_user(f"{prefix}{i}", f"{prefix}{i:03d}")
+
+        threads = [
+            threading.Thread(target=writer, args=(first, "1")),
+            threading.Thread(target=writer, args=(second, "2")),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(first.list_users()) == len(second.list_users()) == 50
+
+    def test_writes_from_another_store_seen_while_own_are_queued(self, open_store, monkeypatch):
+        first, second = open_store(shared=True), open_store(shared=True)
+        gate = threading.Event()
+        commit_batch = first.backend._commit
+
+        def held(batch):
+            gate.wait()
+            commit_batch(batch)
+
+        monkeypatch.setattr(first.backend._committer, "_commit_batch", held)
+        writer = threading.Thread(target=first.add_user, args=("Alice", "1234"))
+        writer.start()
+        try:
+            while first.get_user_by_name("alice") is None:
+                time.sleep(0.001)
+            # More commits than the one write queued here could account for
+            second.arm("away")
+            second.add_user("Bob", "5678")
+            # Reloaded, with the queued write still in view
+            assert first.get_state() == {"armed": True, "mode": "away"}
+            assert [u["name"] for u in first.list_users()] == ["Bob", "Alice"]
+        finally:
+            gate.set()
+            writer.join()
+        assert [u["name"] for u in second.list_users()] == ["Bob", "Alice"]
+
+    def test_write_from_another_process(self, open_store, path):
+        store = open_store(shared=True)
+        assert store.get_state()["armed"] is False
+        script = (
+            "from app.storage.sqlite import SQLiteBackend\n"
+            "from app.store import SecurityStore\n"
+            f"store = SecurityStore(SQLiteBackend({path!r}, shared=True))\n"
+            "store.arm('stay')\n"
+            "store.close()\n"
+        )
+        subprocess.run([sys.executable, "-c", script], check=True, timeout=60)
+        assert store.get_state() == {"armed": True, "mode": "stay"}
+
+    def test_unshared_store_keeps_its_cache(self, open_store):
+        first, second = open_store(), open_store()
+        first.arm()
+        assert second.get_state()["armed"] is False
+
+
+class TestSelection:
+    def test_memory(self, monkeypatch):
+        monkeypatch.setattr(settings, "STORE_BACKEND", "memory")
+        assert create_backend().name == "memory"
+
+    def test_sqlite(self, monkeypatch, path):
+        monkeypatch.setattr(settings, "STORE_BACKEND", "sqlite")
+        monkeypatch.setattr(settings, "STORE_PATH", path)
+        backend = create_backend()
+        try:
+            assert isinstance(backend, SQLiteBackend)
+        finally:
+            backend.close()
+
+    def test_workers_need_a_shared_store(self, monkeypatch, path):
+        monkeypatch.setattr(settings, "WEB_CONCURRENCY", 4)
+        monkeypatch.setattr(settings, "STORE_BACKEND", "sqlite")
+        monkeypatch.setattr(settings, "STORE_PATH", path)
+        with pytest.raises(ValueError):
+            create_backend()
+        monkeypatch.setattr(settings, "STORE_SHARED", True)
+        backend = create_backend()
+        try:
+            assert backend.shared
+        finally:
+            backend.close()
+
+    def test_unknown(self, monkeypatch):
+        monkeypatch.setattr(settings, "STORE_BACKEND", "floppy")
+        with pytest.raises(ValueError):
+            create_backend()
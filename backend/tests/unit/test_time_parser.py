@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.nlp import time_parser
+from app.nlp.time_parser import parse_native, parse_time
+
+# Saturday 17 October 2026, 14:30:45
+NOW = datetime(2026, 10, 17, 14, 30, 45)
+MINUTE = NOW.replace(second=0)
+
+
+class TestGrammar:
+    @pytest.mark.parametrize(
+        "phrase, expected",
+        [
+            ("today 5pm", datetime(2026, 10, 17, 17, 0)),
+            ("5pm today", datetime(2026, 10, 17, 17, 0)),
+            ("5pm", datetime(2026, 10, 17, 17, 0)),
+            ("today at 10:30 a.m.", datetime(2026, 10, 17, 10, 30)),
+            ("17:00", datetime(2026, 10, 17, 17, 0)),
+            ("at 9", datetime(2026, 10, 17, 9, 0)),
+            ("tomorrow at 9", datetime(2026, 10, 18, 9, 0)),
+            ("noon tomorrow", datetime(2026, 10, 18, 12, 0)),
+            ("Sunday 10am", datetime(2026, 10, 18, 10, 0)),
+            ("sun, 10am", datetime(2026, 10, 18, 10, 0)),
+            ("next monday 8am", datetime(2026, 10, 19, 8, 0)),
+            ("Friday", datetime(2026, 10, 23, 0, 0)),
+            ("2026-10-20", datetime(2026, 10, 20)),
+            ("2026-10-20T17:00", datetime(2026, 10, 20, 17, 0)),
+        ],
+    )
+    def test_absolute(self, phrase, expected):
+        assert parse_native(phrase, MINUTE) == expected
+
+    @pytest.mark.parametrize(
+        "phrase, delta",
+        [
+            ("now", timedelta(0)),
+            ("in 3 hours", timedelta(hours=3)),
+            ("in an hour", timedelta(hours=1)),
+            ("in 45 minutes", timedelta(minutes=45)),
+            ("in 2 days", timedelta(days=2)),
+        ],
+    )
+    def test_relative(self, phrase, delta):
+        assert parse_native(phrase, MINUTE) == MINUTE + delta
+
+    def test_bare_day_keeps_time_of_day(self):
+        assert parse_native("tomorrow", MINUTE) == MINUTE + timedelta(days=1)
+
+    def test_weekday_already_passed_today_is_next_week(self):
+        assert parse_native("saturday 9am", MINUTE) == datetime(2026, 10, 24, 9, 0)
+        assert parse_native("saturday 6pm", MINUTE) == datetime(2026, 10, 17, 18, 0)
+
+    def test_next_same_weekday_is_a_week_out(self):
+        assert parse_native("next saturday", MINUTE) == datetime(2026, 10, 24)
+
+    def test_iso_offset_preserved(self):
+        parsed = parse_native("2026-10-20T17:00+02:00", MINUTE)
+        assert parsed.tzinfo == timezone(timedelta(hours=2))
+
+    @pytest.mark.parametrize("phrase", ["9", "13pm", "25:00", "end of month", "in 3 fortnights", ""])
+    def test_outside_grammar(self, phrase):
+        assert parse_native(phrase, MINUTE) is None
+
+
+class TestParseTime:
+    def setup_method(self):
+        time_parser.clear_cache()
+
+    def test_memoized_per_minute(self):
+        first = parse_time("in 3 hours", NOW)
+        assert parse_time("in 3 hours", NOW.replace(second=5)) is first
+        assert parse_time("in 3 hours", NOW + timedelta(minutes=1)) == first + timedelta(minutes=1)
+
+    def test_grammar_skips_dateparser(self, monkeypatch):
+        def fail(phrase):
+            raise AssertionError(f"dateparser called for {phrase!r}")
+
+        monkeypatch.setattr(time_parser, "_parse_fallback", fail)
+        assert parse_time("Sunday 10am", NOW) == datetime(2026, 10, 18, 10, 0)
+
+    def test_falls_back_to_dateparser(self):
+        pytest.importorskip("dateparser")
+        assert parse_time("October 20, 2026 5pm", NOW) == datetime(2026, 10, 20, 17, 0)
+
+    def test_unparseable(self):
+        pytest.importorskip("dateparser")
+        assert parse_time("whenever you like", NOW) is None